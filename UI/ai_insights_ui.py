@@ -1,5 +1,93 @@
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 import streamlit as st
-from services.gemini_llm import query_gemini  # ✅ Use Groq-hosted GPU LLM
+from services.gemini_llm import ErrorMessage, error_message, is_error_response, query_gemini, query_gemini_stream  # ✅ Use Groq-hosted GPU LLM
+from services.long_document import build_prompt, estimate_tokens, needs_map_reduce
+
+# Upper bound on simultaneous LLM calls in "Generate all insights"
+MAX_CONCURRENT_INSIGHTS = int(os.getenv("AI_INSIGHTS_CONCURRENCY", "3"))
+
+# (button label, section heading, long_document task)
+INSIGHTS = [
+    ("🧠 Generate Case Summary", "📄 Case Summary", "summary"),
+    ("📅 Generate Timeline of Events", "🗓️ Timeline of Events", "timeline"),
+    ("⚠️ Detect Legal Risks", "🚨 Legal Risk Detection", "risks"),
+    ("📌 Suggest Legal Actions", "🧾 Suggested Legal Actions", "actions"),
+    ("📤 Generate Client Brief", "🗣️ Client Communication Brief", "brief"),
+]
+
+
+def stream_insight(heading, text, task):
+    """
+    Renders the response as it is generated and returns the full text, as an
+    ErrorMessage if the call failed part-way. Long documents are mapped
+    section by section first, with a progress bar.
+    """
+    st.subheader(heading)
+    progress = None
+    if needs_map_reduce(text):
+        progress = st.progress(0.0, text="📚 Long document: analysing sections...")
+
+    def on_progress(done, total):
+        progress.progress(done / total, text=f"📚 Analysed {done}/{total} sections")
+
+    try:
+        prompt = build_prompt(text, task, on_progress=on_progress)
+    except Exception as e:
+        st.error(error_message(e))
+        return error_message(e)
+    finally:
+        if progress is not None:
+            progress.empty()
+
+    failed = []
+
+    def tracked():
+        for chunk in query_gemini_stream(prompt):
+            if is_error_response(chunk):
+                failed.append(chunk)
+            yield chunk
+
+    body = st.write_stream(tracked())
+    return ErrorMessage(body) if failed else body
+
+
+def run_insight(text, task):
+    """Worker-thread body for batch mode: no Streamlit calls in here."""
+    try:
+        return query_gemini(build_prompt(text, task))
+    except Exception as e:
+        return error_message(e)
+
+
+def show_insight(heading, body):
+    st.subheader(heading)
+    st.write(body)
+
+
+def generate_all_insights(text, insights, slots, results):
+    """
+    Sends every selected prompt at once, at most MAX_CONCURRENT_INSIGHTS in
+    flight, and renders each section into its slot as soon as it completes.
+    Worker threads only call the LLM; all Streamlit calls stay on this thread.
+    Returns the headings it rendered.
+    """
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_INSIGHTS) as pool:
+        futures = {
+            pool.submit(run_insight, text, task): heading
+            for _, heading, task in insights
+        }
+        for future in as_completed(futures):
+            heading = futures[future]
+            body = future.result()
+            with slots[heading]:
+                show_insight(heading, body)
+            if not is_error_response(body):
+                results[heading] = body
+    return set(futures.values())
+
 
 def render_ai_insights():
     st.title("📊 AI Insights for Legal Cases")
@@ -8,38 +96,34 @@ def render_ai_insights():
     if uploaded_file:
         text = uploaded_file.read().decode("utf-8")
         st.success("✅ File loaded. Now choose insights to generate.")
+        if needs_map_reduce(text):
+            st.info(
+                f"📚 About {estimate_tokens(text):,} tokens: insights are built section by section, "
+                "and unchanged sections are reused on re-runs."
+            )
+
+        # Results survive reruns, per document
+        doc_key = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        results = st.session_state.setdefault("ai_insights", {}).setdefault(doc_key, {})
+
+        headings = [heading for _, heading, _ in INSIGHTS]
+        selected = st.multiselect("Insights for a full workup", headings, default=headings)
+        generate_all = st.button("⚡ Generate all insights")
+        clicked = {heading for label, heading, _ in INSIGHTS if st.button(label)}
+
+        slots = {heading: st.container() for heading in headings}
+
+        rendered = set()
+        if generate_all:
+            pending = [i for i in INSIGHTS if i[1] in selected and i[1] not in results]
+            rendered = generate_all_insights(text, pending, slots, results)
 
-        if st.button("🧠 Generate Case Summary"):
-            with st.spinner("Summarizing..."):
-                prompt = f"Summarize the following legal case:\n\n{text}\n\nSummary:"
-                summary = query_gemini(prompt)
-                st.subheader("📄 Case Summary")
-                st.write(summary)
-
-        if st.button("📅 Generate Timeline of Events"):
-            with st.spinner("Extracting timeline..."):
-                prompt = f"Extract a detailed timeline of events from the following legal document:\n\n{text}\n\nTimeline:"
-                timeline = query_gemini(prompt)
-                st.subheader("🗓️ Timeline of Events")
-                st.write(timeline)
-
-        if st.button("⚠️ Detect Legal Risks"):
-            with st.spinner("Analyzing risks..."):
-                prompt = f"Analyze the following legal case and list any potential legal risks:\n\n{text}\n\nRisks:"
-                risks = query_gemini(prompt)
-                st.subheader("🚨 Legal Risk Detection")
-                st.write(risks)
-
-        if st.button("📌 Suggest Legal Actions"):
-            with st.spinner("Generating suggestions..."):
-                prompt = f"Based on the following legal case, suggest possible legal actions or next steps:\n\n{text}\n\nSuggestions:"
-                actions = query_gemini(prompt)
-                st.subheader("🧾 Suggested Legal Actions")
-                st.write(actions)
-
-        if st.button("📤 Generate Client Brief"):
-            with st.spinner("Creating brief..."):
-                prompt = f"Generate a simple and clear client communication brief for the following legal case:\n\n{text}\n\nBrief:"
-                client_brief = query_gemini(prompt)
-                st.subheader("🗣️ Client Communication Brief")
-                st.write(client_brief)
+        for label, heading, task in INSIGHTS:
+            if heading in clicked:
+                with slots[heading]:
+                    body = stream_insight(heading, text, task)
+                if not is_error_response(body):
+                    results[heading] = body
+            elif heading in results and heading not in rendered:
+                with slots[heading]:
+                    show_insight(heading, results[heading])
@@ -1,33 +1,82 @@
+import hashlib
+import io
 import os
 import streamlit as st
 from PyPDF2 import PdfReader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_community.vectorstores import FAISS
-from services.gemini_llm import query_gemini  # ✅ GPU-based LLM
+from services.gemini_llm import is_error_response, query_gemini_stream  # ✅ GPU-based LLM
+from services.answer_cache import get_answer_cache
+from services.case_corpus import get_case_corpus
+from services.document_cache import file_hash, get_document_cache
+from services.embedding_service import SharedEmbeddings, get_embedding_service
 
 UPLOAD_FOLDER = "assets/uploads"
+CACHE_NAMESPACE = "case_analyzer"
+CHUNK_SIZE = 300
+CHUNK_OVERLAP = 50
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
-def extract_text_from_file(uploaded_file):
-    if uploaded_file.name.endswith(".txt"):
-        return uploaded_file.read().decode("utf-8")
+def extract_text_from_file(file_name, data):
+    if file_name.endswith(".txt"):
+        return data.decode("utf-8")
     else:
-        pdf_reader = PdfReader(uploaded_file)
+        pdf_reader = PdfReader(io.BytesIO(data))
         return "".join(page.extract_text() or "" for page in pdf_reader.pages)
 
-@st.cache_resource(show_spinner="🔎 Processing file and creating vector index...")
 def process_text(text):
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=300, chunk_overlap=50)
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
     chunks = text_splitter.split_text(text)
 
-    embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+    embeddings = SharedEmbeddings()
     vectorstore = FAISS.from_texts(chunks, embedding=embeddings)
     return vectorstore, chunks
 
-def ask_ai_groq(vectorstore, chunks, query):
-    top_k_docs = vectorstore.similarity_search(query, k=3)
+def index_fingerprint():
+    return {
+        "model": get_embedding_service().model_name,
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+    }
+
+# Keyed on the file hash only; `_data` is skipped by Streamlit's argument hashing
+@st.cache_resource(show_spinner="🔎 Processing file and creating vector index...", max_entries=16)
+def load_document(doc_key, file_name, _data):
+    """
+    Returns (vectorstore, chunks) for an upload. Documents seen before, in any
+    session or before a restart, are loaded from the on-disk document cache
+    instead of being extracted and embedded again.
+    """
+    def build():
+        text = extract_text_from_file(file_name, _data)
+        vectorstore, chunks = process_text(text)
+        return text, chunks, vectorstore
+
+    _, chunks, vectorstore = get_document_cache().get_or_build(
+        doc_key, index_fingerprint(), build
+    )
+    return vectorstore, chunks
+
+def _content_hash(*texts):
+    return hashlib.sha1("\x1f".join(texts).encode("utf-8")).hexdigest()[:16]
+
+def ask_ai_groq_stream(vectorstore, chunks, query, doc_key=None):
+    """
+    Yields the answer as it is generated; cached answers arrive in one piece.
+    Pass the document's `doc_key` so the answer cache doesn't rehash its chunks.
+    """
+    query_embedding = get_embedding_service().embed_query(query)
+    top_k_docs = vectorstore.similarity_search_by_vector(query_embedding.tolist(), k=3)
     context = "\n\n".join(doc.page_content for doc in top_k_docs)
+
+    # Rephrasings of an earlier question that retrieve the same notes reuse its answer
+    cache = get_answer_cache()
+    document = doc_key or _content_hash(*chunks)
+    context_ids = [_content_hash(doc.page_content) for doc in top_k_docs]
+    cached = cache.get_similar(CACHE_NAMESPACE, query_embedding, context_ids, document)
+    if cached is not None:
+        yield cached
+        return
     
     prompt = f"""
 You are an expert legal assistant. Based on the case notes below, answer the user's question clearly and concisely.
@@ -40,16 +89,86 @@ You are an expert legal assistant. Based on the case notes below, answer the use
 
 ### Answer:
 """
-    return query_gemini(prompt)
+    parts = []
+    for part in query_gemini_stream(prompt):
+        parts.append(part)
+        yield part
+    if parts and not is_error_response(parts[-1]):
+        cache.put(CACHE_NAMESPACE, prompt, "".join(parts), document, query_embedding, context_ids)
+
+def ask_ai_groq(vectorstore, chunks, query, doc_key=None):
+    return "".join(ask_ai_groq_stream(vectorstore, chunks, query, doc_key))
+
+def ask_corpus_stream(query, matters, doc_ids=None):
+    """Answers from the matter corpus, citing which document each excerpt came from."""
+    hits = get_case_corpus().search(query, top_k=6, matters=matters, doc_ids=doc_ids)
+    if not hits:
+        yield "⚠️ No matching content in the selected documents."
+        return
+    context = "\n\n".join(f"[{hit['name']} — {hit['matter']}]\n{hit['text']}" for hit in hits)
+    prompt = f"""
+You are an expert legal assistant. Based on the excerpts below from the matter's documents, answer the user's question clearly and concisely, naming the documents you rely on.
+
+### Excerpts:
+{context}
+
+### Question:
+{query}
 
-def handle_input(vectorstore, chunks):
-    query = st.session_state.chat_input
+### Answer:
+"""
+    yield from query_gemini_stream(prompt)
+
+def display_corpus_mode():
+    corpus = get_case_corpus()
+
+    with st.expander("➕ Add documents to a matter", expanded=not corpus.matters()):
+        matter = st.text_input("Matter", placeholder="e.g. Sharma v. Orion Logistics")
+        files = st.file_uploader(
+            "Pleadings, transcripts or notes (.pdf or .txt)",
+            type=["pdf", "txt"],
+            accept_multiple_files=True,
+            key="corpus_files",
+        )
+        if st.button("📥 Add to corpus") and matter and files:
+            progress = st.progress(0.0)
+            for i, file in enumerate(files):
+                data = file.getvalue()
+                added = corpus.add_document(
+                    matter, file.name, extract_text_from_file(file.name, data), doc_id=file_hash(data)
+                )
+                progress.progress((i + 1) / len(files), text=f"{file.name}: {added} chunks")
+            st.success(f"✅ Added {len(files)} document(s) to {matter}.")
+
+    matters = st.multiselect("🗂️ Matters", corpus.matters())
+    documents = corpus.documents(matters) if matters else []
+    labels = {doc["doc_id"]: f"{doc['name']} ({doc['matter']})" for doc in documents}
+    chosen = st.multiselect(
+        "📄 Restrict to documents (optional)", list(labels), format_func=labels.get
+    )
+    if not matters:
+        st.info("Select one or more matters to ask questions across their documents.")
+        return
+
+    history = st.session_state.setdefault("corpus_history", [])
+    for speaker, msg in history:
+        render_message(speaker, msg)
+
+    query = st.chat_input("Ask across the selected matter documents...")
     if query:
-        with st.spinner("🤖 Thinking..."):
-            response = ask_ai_groq(vectorstore, chunks, query)
-            st.session_state.chat_history.append(("user", query))
-            st.session_state.chat_history.append(("ai", response))
-        st.session_state.chat_input = ""  # Clear input box safely
+        render_message("user", query)
+        with st.chat_message("assistant"):
+            response = st.write_stream(ask_corpus_stream(query, matters, chosen or None))
+        history.append(("user", query))
+        history.append(("ai", response))
+
+def render_message(speaker, msg):
+    if speaker == "user":
+        with st.chat_message("user"):
+            st.markdown(f"**🧑‍💼 You:** {msg}")
+    else:
+        with st.chat_message("assistant"):
+            st.markdown(f"<div style='display: flex; align-items: center;'><span style='font-size: 24px;'>💭</span> <span style='margin-left: 8px;'>**AI:** {msg}</span></div>", unsafe_allow_html=True)
 
 def display_case_analyzer():
     st.markdown("""
@@ -64,15 +183,27 @@ def display_case_analyzer():
                     "- Ask questions like:\n"
                     "  - What are the key facts?\n"
                     "  - Any legal risks involved?\n"
-                    "- AI answers using your uploaded content.")
+                    "- AI answers using your uploaded content.\n"
+                    "- Corpus mode searches every document of a matter.")
+
+    mode = st.radio("Mode", ["📄 Single document", "🗂️ Matter corpus"], horizontal=True)
+    if mode == "🗂️ Matter corpus":
+        display_corpus_mode()
+        return
 
     uploaded_file = st.file_uploader("📎 Upload a case file (.pdf or .txt)", type=["pdf", "txt"])
 
     if uploaded_file:
-        if "vectorstore" not in st.session_state or "chunks" not in st.session_state:
+        # Hash each upload once; a new file replaces the previous document and thread
+        hashes = st.session_state.setdefault("upload_hashes", {})
+        if uploaded_file.file_id not in hashes:
+            hashes[uploaded_file.file_id] = file_hash(uploaded_file.getvalue())
+        doc_key = hashes[uploaded_file.file_id]
+
+        if st.session_state.get("doc_key") != doc_key:
             with st.spinner("🧠 Reading and indexing document..."):
-                text = extract_text_from_file(uploaded_file)
-                vectorstore, chunks = process_text(text)
+                vectorstore, chunks = load_document(doc_key, uploaded_file.name, uploaded_file.getvalue())
+                st.session_state.doc_key = doc_key
                 st.session_state.vectorstore = vectorstore
                 st.session_state.chunks = chunks
                 st.session_state.chat_history = []
@@ -81,23 +212,20 @@ def display_case_analyzer():
         st.markdown("---")
         st.markdown("### 💬 Ask a question about the case")
 
-        if "chat_input" not in st.session_state:
-            st.session_state.chat_input = ""
-
-        st.text_input(
-            "", 
-            key="chat_input", 
-            placeholder="Type your question here...",
-            on_change=handle_input, 
-            args=(st.session_state.vectorstore, st.session_state.chunks)
-        )
-
-        if "chat_history" in st.session_state and st.session_state.chat_history:
+        if st.session_state.chat_history:
             st.markdown("### 🧵 Conversation Thread")
-            for speaker, msg in reversed(st.session_state.chat_history):
-                if speaker == "user":
-                    with st.chat_message("user"):
-                        st.markdown(f"**🧑‍💼 You:** {msg}")
-                else:
-                    with st.chat_message("assistant"):
-                        st.markdown(f"<div style='display: flex; align-items: center;'><span style='font-size: 24px;'>💭</span> <span style='margin-left: 8px;'>**AI:** {msg}</span></div>", unsafe_allow_html=True)
+        for speaker, msg in st.session_state.chat_history:
+            render_message(speaker, msg)
+
+        query = st.chat_input("Type your question here...")
+        if query:
+            render_message("user", query)
+            with st.chat_message("assistant"):
+                # Tokens are rendered as they arrive; the full text goes to history
+                response = st.write_stream(
+                    ask_ai_groq_stream(
+                        st.session_state.vectorstore, st.session_state.chunks, query, st.session_state.doc_key
+                    )
+                )
+            st.session_state.chat_history.append(("user", query))
+            st.session_state.chat_history.append(("ai", response))
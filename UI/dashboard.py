@@ -1,15 +1,104 @@
 import streamlit as st
 import pandas as pd
-from services.data_loader import load_all_data
-from services.analytics import compute_dashboard_metrics
+from services.erp_store import erp_store_enabled, get_erp_store
+from services.metrics_engine import get_metrics_engine
+from services.anomaly_store import get_anomaly_store
+from services.analytics import workload_timeline
+from services.data_loader import load_table, table_signature
+from services.leave_index import available_attorneys, get_leave_index, staffing_conflicts
 import altair as alt
 
-def display_dashboard():
-    # Load data from CSV files
-    attorneys, clients, matters, leaves = load_all_data()
+TREND_PERIODS = {"Weekly": ("W", 104), "Monthly": ("M", 36)}
+
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def _workload_timeline(signature, freq, day):
+    # Full history for every attorney; recomputed only when matters change or the day rolls over
+    return workload_timeline(load_table("matters"), freq, day)
+
+
+def display_workload_trends():
+    st.markdown("### 📈 Workload Trends")
+    label = st.radio("Granularity", list(TREND_PERIODS), horizontal=True, key="workload_trend_freq")
+    freq, shown = TREND_PERIODS[label]
+    timeline = _workload_timeline(table_signature("matters"), freq, pd.Timestamp.today().normalize())
+    if timeline.empty:
+        st.info("ℹ️ No matters with an open date yet.")
+        return
 
-    # Compute all metrics
-    metrics = compute_dashboard_metrics(attorneys, clients, matters, leaves)
+    recent = timeline[timeline["period"].isin(timeline["period"].drop_duplicates().nlargest(shown))]
+    firm = recent.groupby("period", as_index=False)[["active_matters", "complexity_load"]].sum()
+    st.altair_chart(
+        alt.Chart(firm).mark_area(opacity=0.4, line=True).encode(
+            x=alt.X("period:T", title=None),
+            y=alt.Y("complexity_load:Q", title="Firm complexity load"),
+            tooltip=["period:T", "active_matters:Q", "complexity_load:Q"],
+        ),
+        use_container_width=True,
+    )
+
+    # Attorneys above their own rolling threshold, largest excess first
+    spikes = recent[recent["over_threshold"]]
+    if spikes.empty:
+        st.success("✅ No attorney is above their rolling workload threshold.")
+        return
+    excess = (spikes["complexity_load"] - spikes["threshold"]).groupby(spikes["attorney_id"]).max()
+    top = excess.nlargest(5).index
+    names = load_table("attorneys").set_index("attorney_id")["name"]
+    series = recent[recent["attorney_id"].isin(top)].assign(
+        attorney=lambda df: df["attorney_id"].map(names).fillna(df["attorney_id"].astype(str))
+    )
+    base = alt.Chart(series).encode(
+        x=alt.X("period:T", title=None), color=alt.Color("attorney:N", title="Attorney")
+    )
+    st.altair_chart(
+        base.mark_line().encode(
+            y=alt.Y("complexity_load:Q", title="Complexity load"),
+            tooltip=["attorney:N", "period:T", "active_matters:Q", "complexity_load:Q", "threshold:Q"],
+        )
+        + base.mark_line(strokeDash=[4, 4], opacity=0.5).encode(y="threshold:Q")
+        + base.transform_filter(alt.datum.over_threshold).mark_point(filled=True, size=60).encode(
+            y="complexity_load:Q"
+        ),
+        use_container_width=True,
+    )
+    st.caption(f"Dashed lines: each attorney's rolling threshold. Dots: {label.lower()} periods above it.")
+
+def display_staffing_availability():
+    st.markdown("### 🗓️ Staffing Availability")
+    today = pd.Timestamp.today().normalize()
+    window = st.date_input(
+        "Period",
+        value=(today.date(), (today + pd.Timedelta(days=6)).date()),
+        key="staffing_window",
+    )
+    if not isinstance(window, (tuple, list)) or len(window) != 2:
+        st.info("ℹ️ Pick a start and an end date.")
+        return
+    start, end = (pd.Timestamp(d) for d in window)
+
+    index = get_leave_index()
+    conflicts = staffing_conflicts(start, end, index=index)
+    available = available_attorneys(start, end, index=index)
+    col1, col2, col3 = st.columns(3)
+    col1.metric("🏖️ Out today", len(index.out_on(today)))
+    col2.metric("⚠️ Active matters affected", conflicts["matter_id"].nunique() if not conflicts.empty else 0)
+    col3.metric("✅ Attorneys available", len(available))
+    if conflicts.empty:
+        st.success("✅ No active matter's attorney is on leave in this period.")
+    else:
+        st.dataframe(conflicts, use_container_width=True)
+    with st.expander("Attorneys available for new matters"):
+        st.dataframe(available, use_container_width=True)
+
+
+def display_dashboard():
+    if erp_store_enabled():
+        # Indexed SQL queries against the embedded ERP store
+        metrics = get_erp_store().dashboard_metrics()
+    else:
+        # Materialized aggregates, updated only for rows that changed in the CSVs
+        metrics = get_metrics_engine().dashboard_metrics()
 
     # Dashboard Title
     st.markdown("## 📊 Legal ERP Dashboard")
@@ -33,10 +122,16 @@ def display_dashboard():
     st.markdown("### 🏖️ Upcoming Leaves")
     st.dataframe(metrics['upcoming_leaves'], use_container_width=True)
 
+    # Section: Staffing Availability
+    display_staffing_availability()
+
     # Section: Top Clients
     st.markdown("### 🤝 Top Clients by Matter Count")
     st.dataframe(metrics['top_clients'], use_container_width=True)
 
+    # Section: Workload Trends
+    display_workload_trends()
+
     # Section: Attorney Workload Anomalies
     st.markdown("### ⚠️ Attorney Workload Anomalies")
     if not metrics['attorney_workload_anomalies'].empty:
@@ -44,6 +139,25 @@ def display_dashboard():
     else:
         st.success("✅ No workload anomalies detected.")
 
+    # Section: Data Anomalies (precomputed by `python -m services.anomaly_store`)
+    st.markdown("### 🚨 Data Anomalies")
+    store = get_anomaly_store()
+    last_scan = store.last_scan()
+    if last_scan is None:
+        st.info("ℹ️ No anomaly scan yet. Run `python -m services.anomaly_store` to populate this section.")
+    else:
+        counts = store.open_counts()
+        if counts:
+            for col, (rule, count) in zip(st.columns(len(counts)), sorted(counts.items())):
+                col.metric(rule, count)
+            st.dataframe(store.open_anomalies(limit=500), use_container_width=True)
+        else:
+            st.success("✅ No open data anomalies.")
+        st.caption(
+            f"Last scan {last_scan['started_at']}: {last_scan['changed']} rows changed, "
+            f"{last_scan['opened']} opened, {last_scan['resolved']} resolved."
+        )
+
     # Section: Billing Rate Anomalies
     st.markdown("### 💸 Billing Rate Anomalies")
     if not metrics['billing_anomalies'].empty:
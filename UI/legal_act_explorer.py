@@ -11,9 +11,11 @@ from services.legal_rag_chroma import (
     prepare_rag_index,
     answer_query_with_rag,
 )
+from services.act_store import get_act_store
 
 CSV_PATH = "Data/actmetadata/act_metadata.csv"
 ACT_METADATA_FOLDER = "Data/actmetadata"
+SECTIONS_PER_PAGE = 25
 
 
 @st.cache_data
@@ -28,20 +30,36 @@ def init_indexes_once():
     prepare_rag_index()
 
 
-def load_full_act(act_title):
-    for file in os.listdir(ACT_METADATA_FOLDER):
-        if file.endswith(".csv"):
-            df = pd.read_csv(os.path.join(ACT_METADATA_FOLDER, file))
-            matched = df[df["title"] == act_title]
-            if not matched.empty:
-                sections = []
-                for _, row in matched.iterrows():
-                    number = row.get("section_number", "N/A")
-                    name = row.get("section_name", "Unnamed")
-                    text = row.get("section_text", "")
-                    sections.append(f"### Section {number}: {name}\n\n{text}\n\n---\n")
-                return "\n".join(sections)
-    return "⚠️ Full Act not found."
+def load_full_act(act_title, page=0, page_size=SECTIONS_PER_PAGE):
+    sections = get_act_store(ACT_METADATA_FOLDER).sections(act_title, page, page_size)
+    if not sections:
+        return "⚠️ Full Act not found."
+    return "\n".join(
+        f"### Section {row['section_number'] or 'N/A'}: {row['section_name'] or 'Unnamed'}"
+        f"\n\n{row['section_text']}\n\n---\n"
+        for row in sections
+    )
+
+
+def display_full_act(act_title):
+    total = get_act_store(ACT_METADATA_FOLDER).count(act_title)
+    if total == 0:
+        st.markdown("⚠️ Full Act not found.")
+        return
+
+    pages = (total + SECTIONS_PER_PAGE - 1) // SECTIONS_PER_PAGE
+    page = 0
+    if pages > 1:
+        page = (
+            st.number_input(
+                f"Page (1–{pages})", min_value=1, max_value=pages, value=1, step=1
+            )
+            - 1
+        )
+    first = page * SECTIONS_PER_PAGE + 1
+    last = min((page + 1) * SECTIONS_PER_PAGE, total)
+    st.caption(f"Sections {first}–{last} of {total}")
+    st.markdown(load_full_act(act_title, page))
 
 
 def display_legal_act_explorer():
@@ -76,7 +94,6 @@ def display_legal_act_explorer():
                 "Select an Act to read full content:", metadata["title"].unique()
             )
             if act_selected:
-                act_text = load_full_act(act_selected)
-                st.markdown(act_text)
+                display_full_act(act_selected)
         else:
             st.warning("⚠️ No metadata file found.")
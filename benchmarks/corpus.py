@@ -0,0 +1,144 @@
+# benchmarks/corpus.py
+#
+# Deterministic synthetic statute corpus and labelled query set for the
+# retrieval benchmarks. The same seed always produces the same acts, sections
+# and queries, so results are comparable across runs and machines.
+
+import os
+import random
+import re
+
+import pandas as pd
+
+ACTS = [
+    ("Carriage of Goods Act", "CGA"),
+    ("Tenancy and Rent Control Act", "TRCA"),
+    ("Negotiable Instruments Act", "NIA"),
+    ("Consumer Protection Act", "CPA"),
+    ("Arbitration and Conciliation Act", "ACA"),
+    ("Motor Vehicles Act", "MVA"),
+]
+
+SUBJECTS = [
+    "carrier", "landlord", "tenant", "drawer", "holder", "consumer", "trader",
+    "arbitrator", "insurer", "owner", "driver", "agent", "broker", "guarantor",
+    "lessee", "trustee", "auditor", "registrar", "surveyor", "pledgee",
+]
+ACTIONS = [
+    "liability", "eviction", "dishonour", "compensation", "penalty", "notice",
+    "appointment", "revocation", "recovery", "inspection", "forfeiture",
+    "registration", "suspension", "indemnity", "disclosure", "attachment",
+]
+OBJECTS = [
+    "cargo", "premises", "cheque", "defective goods", "award", "licence",
+    "deposit", "security", "vessel", "warehouse", "invoice", "policy",
+    "instalment", "mortgage", "permit", "bill of lading",
+]
+FILLER = (
+    "provided that nothing in this section shall apply where the competent "
+    "authority is satisfied that sufficient cause exists and the parties have "
+    "agreed otherwise in writing subject to such conditions as may be prescribed"
+).split()
+
+HEADER_PATTERN = re.compile(r"\b([A-Z]{2,})\s+Section\s+(\d+)\.")
+
+
+def build_corpus(sections_per_act=200, seed=7):
+    """Returns a DataFrame with one row per section across all synthetic acts."""
+    rng = random.Random(seed)
+    combos = [(s, a, o) for s in SUBJECTS for a in ACTIONS for o in OBJECTS]
+    rng.shuffle(combos)
+
+    rows, used = [], 0
+    for title, code in ACTS:
+        for number in range(1, sections_per_act + 1):
+            subject, action, obj = combos[used]
+            used += 1
+            name = f"{action.capitalize()} of {subject} for {obj}"
+            words = [subject, action, obj] + rng.sample(FILLER, 12)
+            rng.shuffle(words)
+            text = (
+                f"The {action} of the {subject} in respect of the {obj} shall be "
+                f"determined under this Act. " + " ".join(words) + "."
+            )
+            rows.append(
+                {
+                    "title": title,
+                    "code": code,
+                    "section_number": str(number),
+                    "section_name": name,
+                    "section_text": text,
+                    "subject": subject,
+                    "action": action,
+                    "object": obj,
+                }
+            )
+    return pd.DataFrame(rows)
+
+
+def build_queries(corpus, n_queries=200, citation_share=0.3, seed=11):
+    """
+    Returns [{"query", "act_title", "section_number", "kind"}]. Descriptive
+    queries paraphrase a section's subject matter; citation queries name the
+    section and act directly.
+    """
+    rng = random.Random(seed)
+    picks = corpus.sample(n=min(n_queries, len(corpus)), random_state=seed)
+    queries = []
+    for row in picks.itertuples(index=False):
+        if rng.random() < citation_share:
+            query = rng.choice(
+                [
+                    f"What does section {row.section_number} of the {row.title} say?",
+                    f"{row.code} section {row.section_number}",
+                    f"s. {row.section_number} {row.code}",
+                ]
+            )
+            kind = "citation"
+        else:
+            query = rng.choice(
+                [
+                    f"What is the {row.action} of the {row.subject} for {row.object}?",
+                    f"When is a {row.subject} subject to {row.action} over the {row.object}?",
+                    f"{row.object} {row.action} rules for a {row.subject}",
+                ]
+            )
+            kind = "descriptive"
+        queries.append(
+            {
+                "query": query,
+                "act_title": row.title,
+                "section_number": row.section_number,
+                "kind": kind,
+            }
+        )
+    return queries
+
+
+def section_block(row):
+    return f"{row.code} Section {row.section_number}. {row.section_name}\n{row.section_text}\n"
+
+
+def write_corpus(corpus, root):
+    """
+    Lays the corpus out the way each backend expects it under `root`:
+    act CSVs for legal_rag_chroma, one .txt per act for legal_rag, and one
+    combined case text for the Case Analyzer FAISS store.
+    """
+    csv_dir = os.path.join(root, "Data", "actmetadata")
+    txt_dir = os.path.join(root, "Data", "legal_acts_cleaned_texts")
+    os.makedirs(csv_dir, exist_ok=True)
+    os.makedirs(txt_dir, exist_ok=True)
+
+    columns = ["title", "section_number", "section_name", "section_text"]
+    for (title, code), group in corpus.groupby(["title", "code"], sort=False):
+        group[columns].to_csv(os.path.join(csv_dir, f"{code.lower()}.csv"), index=False)
+        with open(os.path.join(txt_dir, f"{title}.txt"), "w", encoding="utf-8") as f:
+            f.write("\n".join(section_block(row) for row in group.itertuples(index=False)))
+
+    return "\n".join(section_block(row) for row in corpus.itertuples(index=False))
+
+
+def cited_sections(text):
+    """(act code, section number) pairs whose header appears in a text chunk."""
+    return set(HEADER_PATTERN.findall(text))
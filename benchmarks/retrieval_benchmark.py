@@ -0,0 +1,316 @@
+# benchmarks/retrieval_benchmark.py
+#
+# Latency and recall benchmark for the three retrieval backends:
+#
+#   legal_rag          services/legal_rag (memory-mapped cosine search)
+#   legal_rag_chroma   services/legal_rag_chroma (section lookup + BM25/HNSW hybrid)
+#   case_faiss         UI/case_analyzer.process_text (LangChain FAISS)
+#
+#   python -m benchmarks.retrieval_benchmark --output bench.json
+#   python -m benchmarks.retrieval_benchmark --embedder hashing --compare baseline.json
+#
+# Everything runs offline inside a temporary working directory. LLM calls are
+# replaced by a stub, and `--embedder hashing` swaps MiniLM for a deterministic
+# hashing encoder so the suite also runs on machines without the model cached.
+# Results are written as JSON; `--compare` exits non-zero on a regression.
+
+import argparse
+import hashlib
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmarks.corpus import build_corpus, build_queries, cited_sections, write_corpus
+
+BACKENDS = ("legal_rag", "legal_rag_chroma", "case_faiss")
+
+
+class HashingEncoder:
+    """Offline stand-in for SentenceTransformer: hashed bag of words, 384-d."""
+
+    def __init__(self, dimension=384):
+        self.dimension = dimension
+
+    def get_sentence_embedding_dimension(self):
+        return self.dimension
+
+    def encode(self, texts, batch_size=32, convert_to_numpy=True, **kwargs):
+        out = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for word in str(text).lower().split():
+                h = int.from_bytes(hashlib.md5(word.encode()).digest()[:4], "little")
+                out[i, h % self.dimension] += 1.0 if h & 1 else -1.0
+        return out
+
+
+def stub_llm(prompt, *args, **kwargs):
+    return "Stub answer."
+
+
+def stub_llm_stream(prompt, *args, **kwargs):
+    yield stub_llm(prompt)
+
+
+def rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # ru_maxrss is a high-water mark (KiB on Linux, bytes on macOS)
+        scale = 1 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+def disk_bytes(*paths):
+    total = 0
+    for path in paths:
+        if os.path.isfile(path):
+            total += os.path.getsize(path)
+        for root, _, files in os.walk(path):
+            total += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+    return total
+
+
+# ------------------ Backends ------------------
+# Each builder returns (search, disk_paths, answer). `search(query, k)` yields
+# the (act code or title, section number) pairs of the top-k hits in order.
+
+
+def build_legal_rag(corpus, case_text):
+    from services import legal_rag
+
+    legal_rag.query_llm = stub_llm
+    prepare = getattr(legal_rag.prepare_rag_index, "__wrapped__", legal_rag.prepare_rag_index)
+    index = prepare(folder="Data/legal_acts_cleaned_texts", index_dir="Data/legal_rag_index")
+    chunks, titles, embeddings = index
+
+    def search(query, k):
+        hits = legal_rag.retrieve_top_chunks(query, chunks, titles, embeddings, top_k=k)
+        return [pair for _, chunk in hits for pair in sorted(cited_sections(chunk))]
+
+    def answer(query):
+        top_docs = legal_rag.retrieve_top_chunks(query, chunks, titles, embeddings)
+        return stub_llm(query, top_docs)
+
+    return search, ["Data/legal_rag_index"], answer
+
+
+def build_legal_rag_chroma(corpus, case_text):
+    from services import legal_rag_chroma
+
+    legal_rag_chroma.prepare_rag_index("Data/actmetadata")
+    code_of = dict(zip(corpus["title"], corpus["code"]))
+
+    def search(query, k):
+        _, metadatas = legal_rag_chroma.search(query, top_k=k)
+        return [(code_of.get(m["act_title"]), str(m["section_number"])) for m in metadatas]
+
+    def answer(query):
+        return legal_rag_chroma.answer_query_with_rag(query)
+
+    paths = [
+        "chroma_db",
+        legal_rag_chroma.MANIFEST_PATH,
+        legal_rag_chroma.BM25_INDEX_PATH,
+        legal_rag_chroma.SECTION_INDEX_PATH,
+    ]
+    return search, paths, answer
+
+
+def build_case_faiss(corpus, case_text):
+    from UI import case_analyzer
+
+    case_analyzer.query_gemini_stream = stub_llm_stream
+    process = getattr(case_analyzer.process_text, "__wrapped__", case_analyzer.process_text)
+    vectorstore, chunks = process(case_text)
+    vectorstore.save_local("case_faiss_index")
+
+    def search(query, k):
+        docs = vectorstore.similarity_search(query, k=k)
+        return [pair for doc in docs for pair in sorted(cited_sections(doc.page_content))]
+
+    def answer(query):
+        return case_analyzer.ask_ai_groq(vectorstore, chunks, query)
+
+    return search, ["case_faiss_index"], answer
+
+
+BUILDERS = {
+    "legal_rag": build_legal_rag,
+    "legal_rag_chroma": build_legal_rag_chroma,
+    "case_faiss": build_case_faiss,
+}
+
+
+# ------------------ Measurement ------------------
+def percentiles(samples_ms):
+    p50, p95, p99 = np.percentile(samples_ms, [50, 95, 99])
+    return {"p50_ms": round(p50, 3), "p95_ms": round(p95, 3), "p99_ms": round(p99, 3)}
+
+
+def measure_backend(name, corpus, case_text, queries, top_ks, concurrency):
+    rss_before = rss_bytes()
+    started = time.perf_counter()
+    search, disk_paths, answer = BUILDERS[name](corpus, case_text)
+    build_s = time.perf_counter() - started
+
+    code_of = dict(zip(corpus["title"], corpus["code"]))
+    targets = [(code_of[q["act_title"]], q["section_number"]) for q in queries]
+    result = {
+        "build_s": round(build_s, 3),
+        "disk_bytes": disk_bytes(*[p for p in disk_paths if p]),
+        "rss_delta_bytes": rss_bytes() - rss_before,
+        "top_k": {},
+    }
+
+    for k in top_ks:
+        latencies, found, by_kind = [], 0, {}
+        for q, target in zip(queries, targets):
+            t = time.perf_counter()
+            hits = search(q["query"], k)
+            latencies.append((time.perf_counter() - t) * 1000)
+            hit = target in hits
+            found += hit
+            kind = by_kind.setdefault(q["kind"], [0, 0])
+            kind[0] += hit
+            kind[1] += 1
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            t = time.perf_counter()
+            list(pool.map(lambda q: search(q["query"], k), queries))
+            qps = len(queries) / (time.perf_counter() - t)
+
+        result["top_k"][str(k)] = {
+            **percentiles(latencies),
+            "qps": round(qps, 1),
+            "concurrency": concurrency,
+            "recall": round(found / len(queries), 4),
+            "recall_by_kind": {kind: round(h / n, 4) for kind, (h, n) in by_kind.items()},
+        }
+
+    # End-to-end answer path with the stubbed LLM
+    latencies = []
+    for q in queries[:50]:
+        t = time.perf_counter()
+        answer(q["query"])
+        latencies.append((time.perf_counter() - t) * 1000)
+    result["answer"] = percentiles(latencies)
+    return result
+
+
+def compare(results, baseline, tolerance, recall_tolerance):
+    """Returns human-readable regressions of `results` against `baseline`."""
+    regressions = []
+    for name, current in results["backends"].items():
+        base = baseline.get("backends", {}).get(name)
+        if not base:
+            continue
+        for k, stats in current["top_k"].items():
+            base_stats = base["top_k"].get(k)
+            if not base_stats:
+                continue
+            if stats["p95_ms"] > base_stats["p95_ms"] * (1 + tolerance):
+                regressions.append(
+                    f"{name} top_k={k}: p95 {base_stats['p95_ms']}ms -> {stats['p95_ms']}ms"
+                )
+            if stats["recall"] < base_stats["recall"] - recall_tolerance:
+                regressions.append(
+                    f"{name} top_k={k}: recall {base_stats['recall']} -> {stats['recall']}"
+                )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the legal retrieval backends.")
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument("--top-k", nargs="+", type=int, default=[1, 3, 10])
+    parser.add_argument("--sections-per-act", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--embedder", choices=["minilm", "hashing"], default="minilm")
+    parser.add_argument("--output", help="Write results as JSON to this path.")
+    parser.add_argument("--compare", help="Baseline JSON; exit 1 on regression.")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.2, help="Allowed relative p95 slowdown."
+    )
+    parser.add_argument(
+        "--recall-tolerance",
+        type=float,
+        default=0.03,
+        help="Allowed absolute recall drop (HNSW builds are not bit-for-bit stable).",
+    )
+    args = parser.parse_args(argv)
+
+    output = os.path.abspath(args.output) if args.output else None
+    baseline_path = os.path.abspath(args.compare) if args.compare else None
+
+    corpus = build_corpus(args.sections_per_act)
+    queries = build_queries(corpus, args.queries)
+
+    from services.embedding_service import configure_embedding_service
+
+    if args.embedder == "hashing":
+        configure_embedding_service(model=HashingEncoder(), model_name="hashing-stub")
+
+    results = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "embedder": args.embedder,
+        "sections": len(corpus),
+        "queries": len(queries),
+        "backends": {},
+    }
+
+    workdir = tempfile.mkdtemp(prefix="legal-bench-")
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        case_text = write_corpus(corpus, workdir)
+        for name in args.backends:
+            print(f"⏱️ Benchmarking {name}...")
+            results["backends"][name] = measure_backend(
+                name, corpus, case_text, queries, args.top_k, args.concurrency
+            )
+    finally:
+        os.chdir(cwd)
+
+    for name, stats in results["backends"].items():
+        print(
+            f"{name}: build {stats['build_s']}s, disk {stats['disk_bytes'] / 1e6:.1f} MB, "
+            f"rss +{stats['rss_delta_bytes'] / 1e6:.1f} MB"
+        )
+        for k, s in stats["top_k"].items():
+            print(
+                f"  top_k={k}: p50 {s['p50_ms']}ms p95 {s['p95_ms']}ms p99 {s['p99_ms']}ms "
+                f"{s['qps']} q/s recall {s['recall']}"
+            )
+
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"✅ Results written to {output}")
+
+    if baseline_path:
+        with open(baseline_path, "r", encoding="utf-8") as f:
+            regressions = compare(
+                results, json.load(f), args.tolerance, args.recall_tolerance
+            )
+        for line in regressions:
+            print(f"❌ Regression: {line}")
+        if regressions:
+            sys.exit(1)
+        print("✅ No regressions against baseline.")
+
+
+if __name__ == "__main__":
+    main()
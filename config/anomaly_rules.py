@@ -0,0 +1,73 @@
+# config/anomaly_rules.py
+
+import pandas as pd
+
+from config.schema import CLIENT_COLUMNS, LEAVE_COLUMNS, MATTER_COLUMNS
+
+STALE_MATTER_DAYS = 365
+MAX_LEAVE_DAYS = 10
+
+# Each rule is evaluated by services/anomaly_detection.py over whole columns:
+#   table:    ERP table the rule flags rows of (see config/schema.py)
+#   id:       column reported as the anomaly id
+#   values:   derived columns, as DataFrame.eval expressions
+#   when:     boolean DataFrame.eval expression; `@name` refers to rule_params()
+#   without:  anti-join — keep rows whose `on` value has no row in `table`
+#             matching `where`
+#   message:  str.format template over the row's columns and values
+#   due:      for rules the clock alone can trigger — the row starts matching
+#             `after_days` past `column`, provided `while` still holds
+# NaT compares False, so date comparisons need no separate notna() checks.
+ANOMALY_RULES = [
+    {
+        "type": "Matter Delay",
+        "table": "matters",
+        "id": MATTER_COLUMNS["id"],
+        "values": {"days": f"({MATTER_COLUMNS['closed']} - {MATTER_COLUMNS['due']}).dt.days"},
+        "when": f"{MATTER_COLUMNS['closed']} > {MATTER_COLUMNS['due']}",
+        "message": "Matter {" + MATTER_COLUMNS["id"] + "} closed later than estimated by {days:.0f} days.",
+    },
+    {
+        "type": "Stale Open Matter",
+        "table": "matters",
+        "id": MATTER_COLUMNS["id"],
+        "when": f"{MATTER_COLUMNS['closed']}.isna() & ({MATTER_COLUMNS['created']} <= @stale_before)",
+        "message": "Matter {" + MATTER_COLUMNS["id"] + "} has been open for more than 1 year without closure.",
+        "due": {
+            "column": MATTER_COLUMNS["created"],
+            "after_days": STALE_MATTER_DAYS + 1,
+            "while": f"{MATTER_COLUMNS['closed']}.isna()",
+        },
+    },
+    {
+        "type": "Extended Leave",
+        "table": "leaves",
+        "id": LEAVE_COLUMNS["id"],
+        "values": {"days": f"({LEAVE_COLUMNS['end']} - {LEAVE_COLUMNS['start']}).dt.days"},
+        "when": "days > @max_leave_days",
+        "message": "Attorney {" + LEAVE_COLUMNS["attorney_id"] + "} took leave for {days:.0f} days.",
+    },
+    {
+        "type": "Inactive Client",
+        "table": "clients",
+        "id": CLIENT_COLUMNS["id"],
+        "when": f"{CLIENT_COLUMNS['status']}.str.lower() == 'active'",
+        "without": {
+            "table": "matters",
+            "on": (CLIENT_COLUMNS["id"], MATTER_COLUMNS["client_id"]),
+            "where": f"{MATTER_COLUMNS['status']}.str.lower() == 'active'",
+        },
+        "message": "Client {" + CLIENT_COLUMNS["id"] + "} is marked active but has no open matters.",
+    },
+]
+
+
+def rule_params(now=None):
+    """The `@` variables available to rule expressions."""
+    now = pd.Timestamp(now or pd.Timestamp.now())
+    return {
+        "now": now,
+        # (now - open_date).days > 365  <=>  open_date <= now - 366 days
+        "stale_before": now - pd.Timedelta(days=STALE_MATTER_DAYS + 1),
+        "max_leave_days": MAX_LEAVE_DAYS,
+    }
@@ -15,16 +15,54 @@ ATTORNEY_COLUMNS = {
 }
 
 MATTER_COLUMNS = {
+    "id": "matter_id",
     "title": "name",
     "status": "status",
     "client_id": "client_id",
     "attorney_id": "attorney_id",
-    "created": "open_date"
+    "created": "open_date",
+    "due": "estimated_close_date",
+    "closed": "actual_close_date"
 }
 
 LEAVE_COLUMNS = {
+    "id": "leave_id",
     "attorney_id": "attorney_id",
-    "start": "open_date",
-    "end": "actual_close_date",
-    "status": "status"
+    "start": "start_date",
+    "end": "end_date",
+    "status": "approval_status"
+}
+
+# Storage types for the ERP tables loaded by services/data_loader.py.
+# ids: compact integers when numeric (category otherwise); categories: low-
+# cardinality text; dates: datetime64; numbers: downcast floats/ints.
+TABLE_SCHEMAS = {
+    "attorneys": {
+        "file": "attorney_data.csv",
+        "ids": [ATTORNEY_COLUMNS["id"]],
+        "categories": [ATTORNEY_COLUMNS["status"]],
+        "dates": [],
+        "numbers": [],
+    },
+    "clients": {
+        "file": "client_data.csv",
+        "ids": [CLIENT_COLUMNS["id"]],
+        "categories": [CLIENT_COLUMNS["status"]],
+        "dates": [],
+        "numbers": [],
+    },
+    "matters": {
+        "file": "matter_data.csv",
+        "ids": [MATTER_COLUMNS["id"], MATTER_COLUMNS["client_id"], MATTER_COLUMNS["attorney_id"]],
+        "categories": [MATTER_COLUMNS["status"]],
+        "dates": [MATTER_COLUMNS["created"], MATTER_COLUMNS["due"], MATTER_COLUMNS["closed"]],
+        "numbers": ["complexity_score"],
+    },
+    "leaves": {
+        "file": "leave_time_data.csv",
+        "ids": [LEAVE_COLUMNS["id"], LEAVE_COLUMNS["attorney_id"]],
+        "categories": [LEAVE_COLUMNS["status"]],
+        "dates": [LEAVE_COLUMNS["start"], LEAVE_COLUMNS["end"]],
+        "numbers": [],
+    },
 }
@@ -1,6 +1,5 @@
-import ollama
+from services.llm_gateway import get_gateway
 
 def generate_client_update(text: str):
     prompt = f"Write a short client update explaining the current status and next steps in the case:\n\n{text}"
-    response = ollama.chat(model="mistral", messages=[{"role": "user", "content": prompt}])
-    return response["message"]["content"]
+    return get_gateway().complete("ollama", prompt, model="mistral")
@@ -1,6 +1,5 @@
-import ollama
+from services.llm_gateway import get_gateway
 
 def detect_legal_risks(text: str):
     prompt = f"Identify any potential legal risks or weaknesses in this case:\n\n{text}"
-    response = ollama.chat(model="mistral", messages=[{"role": "user", "content": prompt}])
-    return response["message"]["content"]
+    return get_gateway().complete("ollama", prompt, model="mistral")
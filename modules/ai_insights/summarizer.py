@@ -1,6 +1,13 @@
 # modules/summarizer.py
-from services.gemini_llm import query_gemini
+from services.gemini_llm import error_message, query_gemini
+from services.long_document import build_prompt, needs_map_reduce
 
 def summarize_text(text: str):
+    if needs_map_reduce(text):
+        # Too long for one prompt: summarize sections, then combine
+        try:
+            return query_gemini(build_prompt(text, "summary"))
+        except Exception as e:
+            return error_message(e)
     prompt = f"Summarize the following legal note:\n\n{text}\n\nSummary:"
     return query_gemini(prompt)
@@ -1,37 +1,222 @@
-import ollama
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import faiss
 import numpy as np
-from concurrent.futures import ThreadPoolExecutor
+import ollama
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from services.db import connect
+
+EMBED_MODEL = os.getenv("OLLAMA_EMBED_MODEL", "nomic-embed-text")
+EMBED_BATCH_SIZE = int(os.getenv("OLLAMA_EMBED_BATCH_SIZE", "32"))
+# A local model server saturates quickly; a few concurrent batches keep it busy
+EMBED_CONCURRENCY = int(os.getenv("OLLAMA_EMBED_CONCURRENCY", "2"))
+EMBED_RETRIES = 3
+EMBEDDING_CACHE_PATH = os.getenv("OLLAMA_EMBED_CACHE", "Data/cache/ollama_embeddings.sqlite3")
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = ollama.Client(host=os.getenv("OLLAMA_HOST"))
+        return _client
+
+
+class EmbeddingError(RuntimeError):
+    """
+    Raised when some chunks could not be embedded even after retries.
+    `failed` lists the positions of those chunks and errors[i] is the error
+    for failed[i].
+    """
+
+    def __init__(self, failed, errors):
+        self.failed = failed
+        self.errors = errors
+        super().__init__(
+            f"{len(failed)} chunk(s) could not be embedded (first error: {errors[0] if errors else 'unknown'})"
+        )
+
+
+class EmbeddingCache:
+    """On-disk embedding cache keyed by (model, sha256 of the chunk)."""
+
+    def __init__(self, path=EMBEDDING_CACHE_PATH):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT NOT NULL, hash TEXT NOT NULL, vector BLOB NOT NULL, "
+                "PRIMARY KEY (model, hash))"
+            )
+
+    def _connect(self):
+        return connect(self.path)
+
+    @staticmethod
+    def key(text):
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get_many(self, model, keys):
+        found = {}
+        with self._connect() as conn:
+            for start in range(0, len(keys), 500):
+                batch = keys[start : start + 500]
+                rows = conn.execute(
+                    f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({','.join('?' * len(batch))})",
+                    (model, *batch),
+                )
+                found.update((h, np.frombuffer(v, dtype=np.float32)) for h, v in rows)
+        return found
+
+    def put_many(self, model, items):
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)",
+                [(model, key, np.asarray(v, dtype=np.float32).tobytes()) for key, v in items],
+            )
 
-def get_embeddings(texts):
-    def embed(chunk):
+
+def _embed_batch(texts, model, retries=EMBED_RETRIES):
+    """One batched /api/embed request, retried with jittered backoff."""
+    for attempt in range(retries + 1):
+        try:
+            response = get_client().embed(model=model, input=texts)
+            vectors = response["embeddings"]
+            if len(vectors) != len(texts):
+                raise ValueError(f"expected {len(texts)} embeddings, got {len(vectors)}")
+            return vectors
+        except Exception:
+            if attempt == retries:
+                raise
+            time.sleep(random.uniform(0, min(8.0, 0.5 * 2 ** attempt)))
+
+
+def get_embeddings(
+    texts,
+    model=EMBED_MODEL,
+    batch_size=EMBED_BATCH_SIZE,
+    max_workers=EMBED_CONCURRENCY,
+    cache=None,
+):
+    """
+    Returns a float32 matrix with one row per text. Cached chunks are not sent
+    again; the rest go out in batches with at most `max_workers` in flight. A
+    batch that keeps failing is retried chunk by chunk, and any chunk that
+    still fails raises EmbeddingError instead of being zero-filled. Once the
+    server can't be reached at all, the remaining chunks fail without retries.
+    """
+    cache = cache or EmbeddingCache()
+    keys = [EmbeddingCache.key(t) for t in texts]
+    vectors = cache.get_many(model, list(set(keys)))
+
+    missing = list(dict.fromkeys(k for k in keys if k not in vectors))
+    text_of = dict(zip(keys, texts))
+    batches = [missing[i : i + batch_size] for i in range(0, len(missing), batch_size)]
+    error_of = {}
+    unreachable = []
+
+    def fail(batch, error):
+        error_of.update(dict.fromkeys(batch, error))
+
+    def run(batch):
+        if unreachable:
+            fail(batch, unreachable[0])
+            return []
         try:
-            response = ollama.embeddings(model="nomic-embed-text", prompt=chunk)
-            return response['embedding']
-        except Exception as e:
-            print(f"[Embedding Error] {e}")
-            return [0.0] * 768  # Return dummy vector on error
-
-    with ThreadPoolExecutor() as executor:
-        embeddings = list(executor.map(embed, texts))
-    return np.array(embeddings)
-
-def smart_chunk_text(text, max_chunks=200):
-    total_length = len(text)
-    chunk_size = max(100, total_length // max_chunks)
-    chunks = [text[i:i + chunk_size] for i in range(0, total_length, chunk_size)]
-    return chunks[:max_chunks]
-
-def load_vector_store(text: str):
+            return list(zip(batch, _embed_batch([text_of[k] for k in batch], model)))
+        except ConnectionError as e:
+            # Server down: retrying chunk by chunk would only repeat the wait
+            unreachable.append(e)
+            fail(batch, e)
+            return []
+        except Exception:
+            # Isolate the bad chunk(s) so one failure doesn't sink the batch
+            results = []
+            for i, key in enumerate(batch):
+                if unreachable:
+                    fail(batch[i:], unreachable[0])
+                    break
+                try:
+                    results.append((key, _embed_batch([text_of[key]], model)[0]))
+                except ConnectionError as e:
+                    unreachable.append(e)
+                    fail(batch[i:], e)
+                    break
+                except Exception as e:
+                    fail([key], e)
+            return results
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for results in pool.map(run, batches):
+            if results:
+                cache.put_many(model, results)
+                vectors.update((k, np.asarray(v, dtype=np.float32)) for k, v in results)
+
+    if error_of:
+        # Every position of a failed chunk, including repeats of the same text
+        failed = [i for i, k in enumerate(keys) if k in error_of]
+        raise EmbeddingError(failed, [error_of[keys[i]] for i in failed])
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+    return np.stack([vectors[k] for k in keys])
+
+
+def smart_chunk_text(text, chunk_size=1000, chunk_overlap=100):
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    return splitter.split_text(text)
+
+
+class OllamaVectorStore:
+    """A FAISS L2 index over Ollama embeddings, plus the chunks it indexes."""
+
+    def __init__(self, index, chunks, model=EMBED_MODEL):
+        self.index = index
+        self.chunks = chunks
+        self.model = model
+
+    def search(self, query, k=3):
+        query_vector = get_embeddings([query], self.model)
+        distances, ids = self.index.search(query_vector, min(k, len(self.chunks)))
+        return [(self.chunks[i], float(d)) for d, i in zip(distances[0], ids[0]) if i >= 0]
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        faiss.write_index(self.index, os.path.join(path, "index.faiss"))
+        with open(os.path.join(path, "chunks.json"), "w", encoding="utf-8") as f:
+            json.dump({"model": self.model, "chunks": self.chunks}, f)
+
+    @classmethod
+    def load(cls, path):
+        index = faiss.read_index(os.path.join(path, "index.faiss"))
+        with open(os.path.join(path, "chunks.json"), "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(index, data["chunks"], data["model"])
+
+
+def load_vector_store(text: str, model=EMBED_MODEL):
     chunks = smart_chunk_text(text)
 
     if not chunks:
         raise ValueError("Text could not be chunked.")
 
-    vectors = get_embeddings(chunks)
+    vectors = get_embeddings(chunks, model)
 
     if vectors.size == 0 or len(vectors[0]) == 0:
         raise ValueError("Failed to generate valid embeddings.")
 
     dimension = len(vectors[0])
-    index = faiss.IndexFlatL2
+    index = faiss.IndexFlatL2(dimension)
+    index.add(vectors)
+    return OllamaVectorStore(index, chunks, model)
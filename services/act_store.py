@@ -0,0 +1,185 @@
+# services/act_store.py
+
+import json
+import os
+import tempfile
+import threading
+import uuid
+
+import pandas as pd
+import pyarrow as pa
+
+ACT_METADATA_FOLDER = "Data/actmetadata"
+ACT_STORE_DIR = "Data/act_store"
+COLUMNS = ["title", "section_number", "section_name", "section_text"]
+SCHEMA = pa.schema([(col, pa.string()) for col in COLUMNS])
+
+
+def _source_signature(folder_path):
+    signature = {}
+    for file in sorted(os.listdir(folder_path)):
+        if file.endswith(".csv"):
+            stat = os.stat(os.path.join(folder_path, file))
+            signature[file] = [stat.st_size, stat.st_mtime_ns]
+    return signature
+
+
+def _read_index(store_dir):
+    with open(os.path.join(store_dir, "index.json"), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _replace_from_tmp(path, write):
+    """
+    Calls write(tmp_path) on a private temp file in the same folder, then
+    swaps it in as `path`. Returns what write returned.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    os.close(fd)
+    try:
+        result = write(tmp_path)
+        os.replace(tmp_path, path)
+        return result
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def build_act_store(folder_path=ACT_METADATA_FOLDER, store_dir=ACT_STORE_DIR, chunksize=5000):
+    """
+    Compiles every act CSV into one uncompressed Arrow IPC file plus an index of
+    title -> row ranges. Rows of an act are written contiguously within each
+    source chunk, so reading one act never touches the pages of another.
+
+    Each build writes a new, uniquely named data file and then swaps in
+    index.json pointing at it, so readers (in any process) see either the
+    old pair or the new one, and concurrent builds never share a temp file.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    data_file = f"acts-{uuid.uuid4().hex[:12]}.arrow"
+    titles = {}
+    offset = _replace_from_tmp(
+        os.path.join(store_dir, data_file),
+        lambda tmp: _write_acts(folder_path, tmp, titles, chunksize),
+    )
+
+    try:
+        previous = _read_index(store_dir).get("data", "acts.arrow")
+    except (OSError, ValueError):
+        previous = None
+    index = {"sources": _source_signature(folder_path), "rows": offset, "titles": titles, "data": data_file}
+
+    def write_index(tmp):
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(index, f)
+
+    _replace_from_tmp(os.path.join(store_dir, "index.json"), write_index)
+
+    # Open memory maps keep working after the file they map is unlinked
+    if previous and previous != data_file:
+        try:
+            os.remove(os.path.join(store_dir, previous))
+        except OSError:
+            pass
+    return index
+
+
+def _write_acts(folder_path, path, titles, chunksize):
+    """Writes the act rows to `path`, filling `titles` with row ranges. Returns the row count."""
+    offset = 0
+    with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(sink, SCHEMA) as writer:
+        for file in sorted(os.listdir(folder_path)):
+            if not file.endswith(".csv"):
+                continue
+            file_path = os.path.join(folder_path, file)
+            header = pd.read_csv(file_path, nrows=0).columns
+            if "title" not in header or "section_text" not in header:
+                continue
+
+            for rows in pd.read_csv(
+                file_path, dtype=str, keep_default_na=False, chunksize=chunksize
+            ):
+                rows = rows.reindex(columns=COLUMNS, fill_value="N/A")
+                for title, group in rows.groupby("title", sort=False):
+                    ranges = titles.setdefault(title, [])
+                    if ranges and ranges[-1][1] == offset:
+                        ranges[-1][1] += len(group)
+                    else:
+                        ranges.append([offset, offset + len(group)])
+                    writer.write_table(
+                        pa.Table.from_pandas(group, schema=SCHEMA, preserve_index=False)
+                    )
+                    offset += len(group)
+    return offset
+
+
+class ActStore:
+    """
+    Read-only, memory-mapped view over the compiled act file.
+
+    Looking up an act is a dict access for its row ranges followed by a
+    zero-copy slice, so a page of sections costs the same whether the
+    library holds one act or a thousand.
+    """
+
+    def __init__(self, store_dir=ACT_STORE_DIR):
+        for attempt in range(3):
+            index = _read_index(store_dir)
+            try:
+                source = pa.memory_map(os.path.join(store_dir, index.get("data", "acts.arrow")), "r")
+                break
+            except FileNotFoundError:
+                # A newer build replaced the file between reading the index and opening it
+                if attempt == 2:
+                    raise
+        self.sources = index["sources"]
+        self.ranges = index["titles"]
+        self.table = pa.ipc.open_file(source).read_all()
+
+    def titles(self):
+        return list(self.ranges)
+
+    def count(self, title):
+        return sum(stop - start for start, stop in self.ranges.get(title, ()))
+
+    def sections(self, title, page=0, page_size=None):
+        """Returns one page of an act's sections as dicts, in source order."""
+        total = self.count(title)
+        start = page * page_size if page_size else 0
+        stop = min(start + page_size, total) if page_size else total
+
+        rows, seen = [], 0
+        for range_start, range_stop in self.ranges.get(title, ()):
+            length = range_stop - range_start
+            lo, hi = max(start - seen, 0), min(stop - seen, length)
+            if lo < hi:
+                rows.extend(self.table.slice(range_start + lo, hi - lo).to_pylist())
+            seen += length
+            if seen >= stop:
+                break
+        return rows
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_act_store(folder_path=ACT_METADATA_FOLDER, store_dir=ACT_STORE_DIR):
+    """Returns the act store, rebuilding it first if any source CSV changed."""
+    global _store
+    with _store_lock:
+        signature = _source_signature(folder_path)
+        if _store is not None and _store.sources == signature:
+            return _store
+
+        index_path = os.path.join(store_dir, "index.json")
+        if os.path.exists(index_path):
+            store = ActStore(store_dir)
+            if store.sources == signature:
+                _store = store
+                return _store
+
+        build_act_store(folder_path, store_dir)
+        _store = ActStore(store_dir)
+        return _store
@@ -1,5 +1,6 @@
 # services/analytics.py
 
+import numpy as np
 import pandas as pd
 
 def compute_dashboard_metrics(attorneys, clients, matters, leaves):
@@ -7,18 +8,19 @@ def compute_dashboard_metrics(attorneys, clients, matters, leaves):
 
     # KPI Cards
     metrics['total_attorneys'] = len(attorneys)
-    metrics['active_clients'] = len(clients[clients['status'].str.lower() == 'active'])
-    metrics['open_matters'] = len(matters[matters['status'].str.lower() == 'active'])
-    metrics['pending_leaves'] = len(leaves[leaves['approval_status'].str.lower() == 'pending'])
+    metrics['active_clients'] = int((clients['status'].str.lower() == 'active').sum())
+    metrics['open_matters'] = int((matters['status'].str.lower() == 'active').sum())
+    metrics['pending_leaves'] = int((leaves['approval_status'].str.lower() == 'pending').sum())
     metrics['billing_anomalies'] = pd.DataFrame()
 
-    # Recent matters
-    matters['open_date'] = pd.to_datetime(matters['open_date'], errors='coerce')
-    metrics['recent_matters'] = matters.sort_values(by='open_date', ascending=False).head(5)
+    # Recent matters (inputs are shared read-only frames: select rows, never assign)
+    open_dates = pd.to_datetime(matters['open_date'], errors='coerce')
+    metrics['recent_matters'] = matters.loc[open_dates.sort_values(ascending=False).index[:5]]
 
     # Upcoming leaves
-    leaves['start_date'] = pd.to_datetime(leaves['start_date'], errors='coerce')
-    metrics['upcoming_leaves'] = leaves[leaves['start_date'] >= pd.Timestamp.today()].sort_values(by='start_date').head(5)
+    start_dates = pd.to_datetime(leaves['start_date'], errors='coerce')
+    upcoming = start_dates[start_dates >= pd.Timestamp.today()].sort_values()
+    metrics['upcoming_leaves'] = leaves.loc[upcoming.index[:5]]
 
     # Top clients by matter count
     top_clients = matters['client_id'].value_counts().head(5).reset_index()
@@ -45,3 +47,66 @@ def detect_attorney_workload_anomalies(matters, attorneys):
     anomalies = pd.merge(anomalies, attorneys, on='attorney_id', how='left')
 
     return anomalies
+
+
+# ------------------ Workload over time ------------------
+def workload_timeline(matters, freq='W', today=None, window=12, k=2.0, min_history=4, min_spread=0.1):
+    """
+    Active-matter count and complexity load per attorney for every period
+    (freq 'W' or 'M') from the first open date to today, in one pass: each
+    matter adds +1 at its opening period and -1 after its closing period on
+    an (attorney x period) grid, and a cumulative sum along time yields the
+    load. A matter counts in every period it was open for any part of.
+
+    Each row is also compared with that attorney's trailing `window` periods:
+    over_threshold is set when load exceeds their mean + k * std (with at
+    least `min_history` periods of history). The std is floored at
+    `min_spread` * mean so a steady ramp with little variance isn't flagged.
+    """
+    today = pd.Timestamp(today or pd.Timestamp.today())
+    opened = pd.to_datetime(matters['open_date'], errors='coerce')
+    closed = pd.to_datetime(matters['actual_close_date'], errors='coerce')
+    # Matters with no attorney assigned have nothing to add to a workload
+    valid = (opened.notna() & (opened <= today) & matters['attorney_id'].notna()).to_numpy()
+    if not valid.any():
+        return pd.DataFrame(columns=['period', 'attorney_id', 'active_matters', 'complexity_load', 'threshold', 'over_threshold'])
+
+    opened, closed = opened[valid], closed[valid].fillna(today).clip(upper=today)
+    first = opened.min().to_period(freq).ordinal
+    periods = pd.period_range(opened.min(), today, freq=freq)
+    start = opened.dt.to_period(freq).array.asi8 - first
+    end = np.maximum(closed.dt.to_period(freq).array.asi8 - first, start)
+    attorney, attorneys = pd.factorize(matters['attorney_id'].to_numpy()[valid])
+    complexity = pd.to_numeric(matters['complexity_score'], errors='coerce').fillna(0).to_numpy()[valid]
+
+    # Open/close events on a flattened (attorney x period) grid
+    width = len(periods) + 1
+    size = len(attorneys) * width
+    opens, closes = attorney * width + start, attorney * width + end + 1
+    counts = np.bincount(opens, minlength=size) - np.bincount(closes, minlength=size)
+    load = np.bincount(opens, complexity, size) - np.bincount(closes, complexity, size)
+    counts = counts.reshape(-1, width).cumsum(axis=1)[:, :-1]
+    load = load.reshape(-1, width).cumsum(axis=1)[:, :-1]
+
+    # Trailing mean/std of the previous `window` periods from running sums
+    sums = np.pad(load.cumsum(axis=1), ((0, 0), (1, 0)))
+    squares = np.pad((load ** 2).cumsum(axis=1), ((0, 0), (1, 0)))
+    t = np.arange(load.shape[1])
+    lo = np.maximum(t - window, 0)
+    n = t - lo
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = (sums[:, t] - sums[:, lo]) / n
+        var = (squares[:, t] - squares[:, lo]) / n - mean ** 2
+        spread = np.maximum(np.sqrt(np.clip(var, 0, None)), min_spread * mean)
+        threshold = mean + k * spread
+    threshold[:, n < min_history] = np.nan
+    over = load > threshold
+
+    return pd.DataFrame({
+        'period': np.tile(periods.to_timestamp(), len(attorneys)),
+        'attorney_id': np.repeat(attorneys, len(periods)),
+        'active_matters': counts.ravel(),
+        'complexity_load': load.ravel(),
+        'threshold': threshold.ravel(),
+        'over_threshold': over.ravel(),
+    })
@@ -1,78 +1,235 @@
-import pandas as pd
+import logging
 import os
+import string
+import time
 
-# Load CSVs (update the paths as needed)
-BASE_PATH = "data"
-matter_df = pd.read_csv(os.path.join(BASE_PATH, "matter_data.csv"))
-leave_df = pd.read_csv(os.path.join(BASE_PATH, "leave_time_data.csv"))
-client_df = pd.read_csv(os.path.join(BASE_PATH, "client_data.csv"))
-attorney_df = pd.read_csv(os.path.join(BASE_PATH, "attorney_data.csv"))
+import numpy as np
+import pandas as pd
 
-# ------------------ Anomaly Rules ------------------
-def detect_matter_anomalies(matter_df):
-    anomalies = []
+from config.anomaly_rules import ANOMALY_RULES, rule_params
+from config.schema import TABLE_SCHEMAS
+from services.data_loader import _apply_schema, data_dir, load_table
 
-    for idx, row in matter_df.iterrows():
-        # Rule 1: Estimated vs Actual Close Date delay
-        if pd.notna(row['estimated_close_date']) and pd.notna(row['actual_close_date']):
-            est = pd.to_datetime(row['estimated_close_date'])
-            act = pd.to_datetime(row['actual_close_date'])
-            if act > est:
-                anomalies.append({
-                    "type": "Matter Delay",
-                    "id": row['matter_id'],
-                    "description": f"Matter {row['matter_id']} closed later than estimated by {(act - est).days} days."
-                })
-
-        # Rule 2: Matters with no actual close date and open too long
-        if pd.isna(row['actual_close_date']) and pd.notna(row['open_date']):
-            open_date = pd.to_datetime(row['open_date'])
-            if (pd.Timestamp.now() - open_date).days > 365:
-                anomalies.append({
-                    "type": "Stale Open Matter",
-                    "id": row['matter_id'],
-                    "description": f"Matter {row['matter_id']} has been open for more than 1 year without closure."
-                })
+# "stream" scans the CSVs in bounded chunks instead of loading whole tables;
+# "incremental" re-evaluates only changed rows into services/anomaly_store
+ANOMALY_SCAN = os.getenv("ANOMALY_SCAN", "memory")
+ANOMALY_CHUNK_ROWS = int(os.getenv("ANOMALY_CHUNK_ROWS", "100000"))
 
-    return anomalies
+RULES_BY_TYPE = {rule["type"]: rule for rule in ANOMALY_RULES}
 
-def detect_leave_anomalies(leave_df):
-    anomalies = []
-    leave_df['start_date'] = pd.to_datetime(leave_df['start_date'])
-    leave_df['end_date'] = pd.to_datetime(leave_df['end_date'])
-
-    # Rule: Leave duration more than 10 days
-    for idx, row in leave_df.iterrows():
-        duration = (row['end_date'] - row['start_date']).days
-        if duration > 10:
-            anomalies.append({
-                "type": "Extended Leave",
-                "id": row['leave_id'],
-                "description": f"Attorney {row['attorney_id']} took leave for {duration} days."
-            })
+logger = logging.getLogger(__name__)
 
-    return anomalies
 
-def detect_client_anomalies(client_df):
-    anomalies = []
-    # Rule: Clients marked as active but have no open matters (joined with matter_df)
-    active_clients = client_df[client_df['ststus'].str.lower() == 'active']
-    open_matters = matter_df[matter_df['status'].str.lower() == 'active']
-
-    for idx, row in active_clients.iterrows():
-        if row['client_id'] not in open_matters['client_id'].values:
-            anomalies.append({
-                "type": "Inactive Client",
-                "id": row['client_id'],
-                "description": f"Client {row['client_id']} is marked active but has no open matters."
-            })
+# ------------------ Rule engine ------------------
+def _typed(name, frame):
+    """Parses date columns still held as text, e.g. in a frame read straight from CSV."""
+    text_dates = [
+        col for col in TABLE_SCHEMAS[name]["dates"]
+        if col in frame and not pd.api.types.is_datetime64_any_dtype(frame[col])
+    ]
+    if text_dates:
+        frame = frame.assign(**{col: pd.to_datetime(frame[col], errors="coerce") for col in text_dates})
+    return frame
+
+
+def _compile_message(rule):
+    """
+    Returns (fields, template): the columns a rule's output needs, id first,
+    and its message rewritten to take them positionally.
+    """
+    fields = [rule["id"]]
+    template = ""
+    for literal, field, spec, conversion in string.Formatter().parse(rule["message"]):
+        template += literal.replace("{", "{{").replace("}", "}}")
+        if field is None:
+            continue
+        if field not in fields:
+            fields.append(field)
+        template += "{" + str(fields.index(field))
+        template += ("!" + conversion if conversion else "") + (":" + spec if spec else "") + "}"
+    return fields, template
+
+
+def _mask(frame, expr, params):
+    return frame.eval(expr, engine="python", local_dict=params).to_numpy(dtype=bool, na_value=False)
+
+
+def join_keys(join, frame, params):
+    """Sorted unique `on` values of the rows of a join's table that match its `where`."""
+    keys = frame[join["on"][1]]
+    if join.get("where"):
+        keys = keys[_mask(frame, join["where"], params)]
+    return np.unique(keys.dropna().to_numpy())
+
+
+def evaluate_rule(rule, tables, params, keys=None):
+    """
+    Evaluates one rule over whole columns. Returns {type, anomalies, scanned,
+    flagged, scan_seconds, seconds}, where anomalies are {type, id,
+    description} dicts and seconds includes building them. A rule with a
+    join uses `keys` when given, else computes them from its join table.
+    """
+    started = time.perf_counter()
+    frame = _typed(rule["table"], tables[rule["table"]])
+    if rule.get("values"):
+        frame = frame.assign(
+            **{name: frame.eval(expr, engine="python", local_dict=params) for name, expr in rule["values"].items()}
+        )
+    mask = _mask(frame, rule["when"], params)
+
+    join = rule.get("without")
+    if join:
+        if keys is None:
+            keys = join_keys(join, _typed(join["table"], tables[join["table"]]), params)
+        mask &= ~frame[join["on"][0]].isin(keys).to_numpy()
+
+    scanned = time.perf_counter()
+
+    # Only the flagged rows' output fields leave the vectorized world
+    fields, template = _compile_message(rule)
+    flagged = frame.loc[mask, fields]
+    kind = rule["type"]
+    anomalies = [
+        {"type": kind, "id": values[0], "description": template.format(*values)}
+        for values in zip(*(flagged[col].tolist() for col in fields))
+    ]
+    return {
+        "type": kind,
+        "anomalies": anomalies,
+        "scanned": len(frame),
+        "flagged": len(anomalies),
+        "scan_seconds": scanned - started,
+        "seconds": time.perf_counter() - started,
+    }
+
+
+def run_rules(tables=None, now=None, rules=ANOMALY_RULES):
+    """
+    Runs every rule and returns one result per rule (see evaluate_rule).
+    Tables not supplied are loaded from the shared typed cache.
+    """
+    tables = dict(tables or {})
+    for rule in rules:
+        for name in (rule["table"], rule.get("without", {}).get("table")):
+            if name and name not in tables:
+                tables[name] = load_table(name)
+    params = rule_params(now)
+    return [evaluate_rule(rule, tables, params) for rule in rules]
+
+
+# ------------------ Streaming scan ------------------
+def read_chunks(name, chunk_rows=ANOMALY_CHUNK_ROWS):
+    """Yields a table's CSV as typed frames of at most chunk_rows rows."""
+    path = os.path.join(data_dir(), TABLE_SCHEMAS[name]["file"])
+    with pd.read_csv(path, chunksize=chunk_rows) as reader:
+        for chunk in reader:
+            yield _apply_schema(chunk, TABLE_SCHEMAS[name])
+
+
+def _scan_order(rules):
+    """Tables in scan order: every join's table before the tables whose rules need it."""
+    needs = {}
+    for rule in rules:
+        needs.setdefault(rule["table"], set())
+        join = rule.get("without")
+        if join:
+            needs.setdefault(join["table"], set())
+            if join["table"] != rule["table"]:
+                needs[rule["table"]].add(join["table"])
+    order = []
+    while needs:
+        ready = sorted(name for name, deps in needs.items() if deps <= set(order))
+        if not ready:
+            raise ValueError(f"Anomaly rules have circular joins between {sorted(needs)}")
+        order.extend(ready)
+        for name in ready:
+            del needs[name]
+    return order
+
+
+def stream_rules(now=None, chunk_rows=ANOMALY_CHUNK_ROWS, rules=ANOMALY_RULES, read=read_chunks):
+    """
+    Evaluates the rules one chunk at a time, scanning each table once and
+    yielding an evaluate_rule result per rule and chunk. Memory is bounded by
+    chunk_rows: the only state carried across chunks is each join's sorted
+    unique keys (for example the ids of clients with an active matter).
+    """
+    params = rule_params(now)
+    keys = {}
+
+    for name in _scan_order(rules):
+        sources = [rule for rule in rules if rule.get("without", {}).get("table") == name]
+        # A rule joined against its own table can only run once that table is fully scanned
+        deferred = [rule for rule in sources if rule["table"] == name]
+        ready = [rule for rule in rules if rule["table"] == name and rule not in deferred]
+        for rule in sources:
+            keys[id(rule)] = np.array([], dtype=np.int64)
+
+        for chunk in read(name, chunk_rows):
+            for rule in sources:
+                keys[id(rule)] = np.union1d(keys[id(rule)], join_keys(rule["without"], chunk, params))
+            for rule in ready:
+                yield evaluate_rule(rule, {name: chunk}, params, keys.get(id(rule)))
+
+        for chunk in read(name, chunk_rows) if deferred else ():
+            for rule in deferred:
+                yield evaluate_rule(rule, {name: chunk}, params, keys[id(rule)])
+
+
+def run_rules_streaming(now=None, chunk_rows=ANOMALY_CHUNK_ROWS, rules=ANOMALY_RULES):
+    """stream_rules folded into one result per rule, shaped like run_rules."""
+    totals = {
+        rule["type"]: {"type": rule["type"], "anomalies": [], "scanned": 0, "flagged": 0, "scan_seconds": 0.0, "seconds": 0.0}
+        for rule in rules
+    }
+    for result in stream_rules(now, chunk_rows, rules):
+        total = totals[result["type"]]
+        total["anomalies"].extend(result["anomalies"])
+        for key in ("scanned", "flagged", "scan_seconds", "seconds"):
+            total[key] += result[key]
+    return list(totals.values())
+
+
+# ------------------ Anomaly Rules ------------------
+def detect_matter_anomalies(matter_df, now=None):
+    rules = [RULES_BY_TYPE["Matter Delay"], RULES_BY_TYPE["Stale Open Matter"]]
+    results = run_rules({"matters": matter_df}, now, rules)
+    return [a for result in results for a in result["anomalies"]]
+
+
+def detect_leave_anomalies(leave_df, now=None):
+    results = run_rules({"leaves": leave_df}, now, [RULES_BY_TYPE["Extended Leave"]])
+    return results[0]["anomalies"]
+
+
+def detect_client_anomalies(client_df, matter_df):
+    results = run_rules(
+        {"clients": client_df, "matters": matter_df}, rules=[RULES_BY_TYPE["Inactive Client"]]
+    )
+    return results[0]["anomalies"]
 
-    return anomalies
 
 # ------------------ Aggregate ------------------
-def detect_all_anomalies():
+def detect_all_anomalies(now=None):
+    from services.erp_store import erp_store_enabled, get_erp_store
+
+    if erp_store_enabled():
+        return get_erp_store().detect_anomalies(now)
+
+    if ANOMALY_SCAN == "incremental":
+        from services.anomaly_store import get_anomaly_store
+
+        store = get_anomaly_store()
+        store.scan(now)
+        return store.open_anomalies()[["type", "id", "description"]].to_dict("records")
+
     anomalies = []
-    anomalies.extend(detect_matter_anomalies(matter_df))
-    anomalies.extend(detect_leave_anomalies(leave_df))
-    anomalies.extend(detect_client_anomalies(client_df))
+    results = run_rules_streaming(now) if ANOMALY_SCAN == "stream" else run_rules(now=now)
+    for result in results:
+        logger.debug(
+            "%s: %d of %d rows (scan %.0f ms, total %.0f ms)",
+            result["type"], result["flagged"], result["scanned"],
+            result["scan_seconds"] * 1000, result["seconds"] * 1000,
+        )
+        anomalies.extend(result["anomalies"])
     return anomalies
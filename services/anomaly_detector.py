@@ -1,32 +1,254 @@
 # services/anomaly_detector.py
 
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+import joblib
+import numpy as np
 import pandas as pd
 from sklearn.ensemble import IsolationForest
 
-def detect_attorney_workload_anomalies(matters_df, attorneys_df):
+from config.schema import ATTORNEY_COLUMNS, CLIENT_COLUMNS, LEAVE_COLUMNS, MATTER_COLUMNS
+from services.data_loader import load_table, table_signature
+
+MODEL_DIR = os.getenv("ANOMALY_MODEL_DIR", "Data/models")
+# Refit on this schedule even if the data hasn't drifted
+REFIT_DAYS = float(os.getenv("ANOMALY_MODEL_REFIT_DAYS", "7"))
+# Refit when any feature mean moves by more than this many fitted standard deviations
+DRIFT_THRESHOLD = float(os.getenv("ANOMALY_MODEL_DRIFT", "0.25"))
+MODEL_JOBS = int(os.getenv("ANOMALY_MODEL_JOBS", "-1"))
+CONTAMINATION = 0.1
+# Entry fields kept in a JSON sidecar, so moving a model to a new data version
+# doesn't rewrite the model itself
+META_FIELDS = ("data_version", "fitted_at")
+
+logger = logging.getLogger(__name__)
+
+
+# ------------------ Features ------------------
+def _open_days(matters, today):
+    opened = matters[MATTER_COLUMNS["created"]]
+    closed = matters["actual_close_date"].fillna(today)
+    return (closed - opened).dt.days
+
+
+def workload_features(matters, leaves, today=None):
+    """One row per attorney: matter counts, mean complexity, mean open duration, leave days."""
+    today = pd.Timestamp(today or pd.Timestamp.today()).normalize()
+    attorney_id = MATTER_COLUMNS["attorney_id"]
+    work = pd.DataFrame({
+        attorney_id: matters[attorney_id].to_numpy(),
+        "active": (matters[MATTER_COLUMNS["status"]].astype(str).str.lower() == "active").to_numpy(),
+        "complexity": matters["complexity_score"].to_numpy(),
+        "open_days": _open_days(matters, today).to_numpy(),
+    })
+    features = work.groupby(attorney_id).agg(
+        matter_count=("active", "size"),
+        active_matters=("active", "sum"),
+        mean_complexity=("complexity", "mean"),
+        mean_open_days=("open_days", "mean"),
+    )
+
+    taken = leaves[leaves[LEAVE_COLUMNS["status"]].astype(str).str.lower() != "rejected"]
+    days = (taken[LEAVE_COLUMNS["end"]] - taken[LEAVE_COLUMNS["start"]]).dt.days.clip(lower=0) + 1
+    leave_days = days.groupby(taken[LEAVE_COLUMNS["attorney_id"]].to_numpy()).sum()
+    features["leave_days"] = leave_days.reindex(features.index).fillna(0)
+    return features.fillna(0).astype(np.float64)
+
+
+def client_activity_features(matters, today=None):
+    """One row per client: matter counts, mean complexity, mean open duration, attorneys involved."""
+    today = pd.Timestamp(today or pd.Timestamp.today()).normalize()
+    client_id = MATTER_COLUMNS["client_id"]
+    work = pd.DataFrame({
+        client_id: matters[client_id].to_numpy(),
+        "active": (matters[MATTER_COLUMNS["status"]].astype(str).str.lower() == "active").to_numpy(),
+        "complexity": matters["complexity_score"].to_numpy(),
+        "open_days": _open_days(matters, today).to_numpy(),
+        "attorney": matters[MATTER_COLUMNS["attorney_id"]].to_numpy(),
+    })
+    features = work.groupby(client_id).agg(
+        matter_count=("active", "size"),
+        active_matters=("active", "sum"),
+        mean_complexity=("complexity", "mean"),
+        mean_open_days=("open_days", "mean"),
+        attorneys=("attorney", "nunique"),
+    )
+    return features.fillna(0).astype(np.float64)
+
+
+# ------------------ Registry ------------------
+class ModelRegistry:
     """
-    Detect attorneys handling too many matters using Isolation Forest.
+    Fitted IsolationForest models, one per kind ("workload", "client_activity"),
+    persisted with joblib, with the data version they cover and their fit
+    time in a small JSON sidecar.
+
+    A model is refitted only when there is none yet, when it is older than
+    REFIT_DAYS, or when the data version changed and the feature means have
+    drifted by more than DRIFT_THRESHOLD fitted standard deviations. Scores
+    are memoized per (kind, data version, model), so repeated requests cost
+    a dictionary lookup.
     """
-    # Count how many matters each attorney is handling
-    workload = matters_df['Attorney'].value_counts().reset_index()
-    workload.columns = ['Attorney', 'MatterCount']
 
-    # Apply Isolation Forest
-    model = IsolationForest(contamination=0.1, random_state=42)
-    workload['anomaly'] = model.fit_predict(workload[['MatterCount']])
-    anomalies = workload[workload['anomaly'] == -1]
+    def __init__(self, root=MODEL_DIR, refit_days=REFIT_DAYS, drift_threshold=DRIFT_THRESHOLD, n_jobs=MODEL_JOBS):
+        self.root = root
+        self.refit_days = refit_days
+        self.drift_threshold = drift_threshold
+        self.n_jobs = n_jobs
+        self._models = {}
+        self._scores = {}
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, kind):
+        return os.path.join(self.root, f"{kind}.joblib")
+
+    def _meta_path(self, kind):
+        return os.path.join(self.root, f"{kind}.json")
+
+    def _load(self, kind):
+        if kind not in self._models and os.path.exists(self._path(kind)):
+            try:
+                entry = joblib.load(self._path(kind))
+                with open(self._meta_path(kind), "r", encoding="utf-8") as f:
+                    entry.update(json.load(f))
+                self._models[kind] = entry
+            except Exception as e:
+                logger.warning("Could not load %s model, refitting: %s", kind, e)
+        return self._models.get(kind)
+
+    def _save_meta(self, kind, entry):
+        tmp = f"{self._meta_path(kind)}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({field: entry[field] for field in META_FIELDS}, f)
+        os.replace(tmp, self._meta_path(kind))
+        self._models[kind] = entry
+
+    def _save(self, kind, entry):
+        tmp = f"{self._path(kind)}.tmp"
+        joblib.dump({k: v for k, v in entry.items() if k not in META_FIELDS}, tmp)
+        os.replace(tmp, self._path(kind))
+        self._save_meta(kind, entry)
+
+    def fit(self, kind, features, data_version):
+        model = IsolationForest(
+            n_estimators=200, contamination=CONTAMINATION, random_state=42, n_jobs=self.n_jobs
+        )
+        model.fit(features.to_numpy())
+        entry = {
+            "model": model,
+            "columns": list(features.columns),
+            "data_version": data_version,
+            "fitted_at": time.time(),
+            "n_samples": len(features),
+            "mean": features.mean().to_numpy(),
+            "std": features.std().replace(0, 1).fillna(1).to_numpy(),
+        }
+        self._save(kind, entry)
+        logger.info("Fitted %s model on %d rows (data %s)", kind, len(features), data_version)
+        return entry
+
+    def drifted(self, entry, features):
+        if list(features.columns) != entry["columns"]:
+            return True
+        shift = np.abs(features.mean().to_numpy() - entry["mean"]) / entry["std"]
+        return bool(np.nanmax(shift) > self.drift_threshold)
+
+    def model_for(self, kind, features, data_version):
+        """The model to score `features` with, refitting if due."""
+        entry = self._load(kind)
+        if entry is None or time.time() - entry["fitted_at"] > self.refit_days * 86400:
+            return self.fit(kind, features, data_version)
+        if entry["data_version"] != data_version:
+            if self.drifted(entry, features):
+                return self.fit(kind, features, data_version)
+            # Same distribution: keep the model, remember it covers this version
+            entry = {**entry, "data_version": data_version}
+            self._save_meta(kind, entry)
+        return entry
+
+    def score(self, kind, data_version, build_features):
+        """
+        Features (from build_features(), called only on a cache miss) with
+        anomaly_score (lower is more anomalous) and is_anomaly columns.
+        """
+        with self._lock:
+            cached = self._scores.get(kind)
+            if cached is not None and cached[0] == data_version:
+                return cached[1]
+            features = build_features()
+            entry = self.model_for(kind, features, data_version)
+            # One batched pass over the trees (n_jobs threads); predict() is just score < 0
+            scores = entry["model"].decision_function(features[entry["columns"]].to_numpy())
+            scored = features.assign(anomaly_score=scores, is_anomaly=scores < 0)
+            self._scores[kind] = (data_version, scored)
+            return scored
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_model_registry():
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ModelRegistry()
+    return _registry
+
+
+def _data_version(frames, today):
+    """Key of the data a model sees: table signatures (or content hashes) plus the day."""
+    digest = hashlib.sha1(str(pd.Timestamp(today).date()).encode())
+    for name, frame in frames.items():
+        if frame is None:
+            digest.update(repr(table_signature(name)).encode())
+        else:
+            digest.update(pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes())
+    return digest.hexdigest()[:16]
 
-    return anomalies[['Attorney', 'MatterCount']]
 
-def detect_unusual_client_activity(matters_df, clients_df):
+# ------------------ Detection ------------------
+def detect_attorney_workload_anomalies(matters_df=None, attorneys_df=None, leaves_df=None, today=None):
     """
-    Detect clients with suspiciously low or high number of matters.
+    Attorneys whose workload profile the model isolates as unusual, most
+    anomalous first. Tables default to the shared ERP data.
     """
-    activity = matters_df['Client'].value_counts().reset_index()
-    activity.columns = ['Client', 'MatterCount']
+    today = pd.Timestamp(today or pd.Timestamp.today()).normalize()
+    version = _data_version({"matters": matters_df, "leaves": leaves_df}, today)
+    scored = get_model_registry().score(
+        "workload",
+        version,
+        lambda: workload_features(
+            matters_df if matters_df is not None else load_table("matters"),
+            leaves_df if leaves_df is not None else load_table("leaves"),
+            today,
+        ),
+    )
+    anomalies = scored[scored["is_anomaly"]].sort_values("anomaly_score")
+    anomalies = anomalies.rename_axis(ATTORNEY_COLUMNS["id"]).reset_index()
+    attorneys = attorneys_df if attorneys_df is not None else load_table("attorneys")
+    return anomalies.merge(attorneys, on=ATTORNEY_COLUMNS["id"], how="left")
 
-    model = IsolationForest(contamination=0.1, random_state=42)
-    activity['anomaly'] = model.fit_predict(activity[['MatterCount']])
-    anomalies = activity[activity['anomaly'] == -1]
 
-    return anomalies[['Client', 'MatterCount']]
+def detect_unusual_client_activity(matters_df=None, clients_df=None, today=None):
+    """Clients whose matter activity the model isolates as unusual, most anomalous first."""
+    today = pd.Timestamp(today or pd.Timestamp.today()).normalize()
+    version = _data_version({"matters": matters_df}, today)
+    scored = get_model_registry().score(
+        "client_activity",
+        version,
+        lambda: client_activity_features(
+            matters_df if matters_df is not None else load_table("matters"), today
+        ),
+    )
+    anomalies = scored[scored["is_anomaly"]].sort_values("anomaly_score")
+    anomalies = anomalies.rename_axis(CLIENT_COLUMNS["id"]).reset_index()
+    clients = clients_df if clients_df is not None else load_table("clients")
+    return anomalies.merge(clients, on=CLIENT_COLUMNS["id"], how="left")
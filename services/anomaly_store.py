@@ -0,0 +1,378 @@
+# services/anomaly_store.py
+#
+# Persisted, incrementally maintained results of the anomaly rules.
+#
+#   python -m services.anomaly_store            # nightly scan
+#   python -m services.anomaly_store --full     # forget fingerprints, rescan all rows
+#
+# Rows are fingerprinted by primary key and content hash (one parquet snapshot
+# per table next to the database). A scan re-evaluates
+# only rows that were inserted or changed, rows whose join partners changed,
+# and rows of time-dependent rules that have come due; everything else keeps
+# its stored result. Each anomaly records when it was first seen and when it
+# was resolved, and the dashboard reads these rows instead of scanning.
+
+import argparse
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from config.anomaly_rules import ANOMALY_RULES, rule_params
+from config.schema import TABLE_SCHEMAS
+from services.anomaly_detection import _mask, evaluate_rule, join_keys
+from services.data_loader import load_table, table_signature
+from services.db import connect
+
+ANOMALY_DB_PATH = os.getenv("ANOMALY_DB_PATH", "Data/anomalies.sqlite3")
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    tbl TEXT PRIMARY KEY,
+    signature TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS anomalies (
+    rule TEXT NOT NULL,
+    row_id NOT NULL,
+    description TEXT NOT NULL,
+    first_seen TEXT NOT NULL,
+    last_seen TEXT NOT NULL,
+    resolved_at TEXT,
+    PRIMARY KEY (rule, row_id)
+);
+CREATE INDEX IF NOT EXISTS anomalies_open ON anomalies (resolved_at, rule);
+CREATE TABLE IF NOT EXISTS due (
+    rule TEXT NOT NULL,
+    row_id NOT NULL,
+    due_at TEXT NOT NULL,
+    PRIMARY KEY (rule, row_id)
+);
+CREATE INDEX IF NOT EXISTS due_at ON due (due_at);
+CREATE TABLE IF NOT EXISTS scans (
+    started_at TEXT NOT NULL,
+    seconds REAL NOT NULL,
+    changed INTEGER NOT NULL,
+    evaluated INTEGER NOT NULL,
+    opened INTEGER NOT NULL,
+    resolved INTEGER NOT NULL
+);
+"""
+
+
+def _primary_key(name):
+    return TABLE_SCHEMAS[name]["ids"][0]
+
+
+def _unique_rows(name, frame):
+    """Rows are fingerprinted by primary key, so keep the last row for each one."""
+    id_col = _primary_key(name)
+    duplicated = frame[id_col].duplicated(keep="last")
+    if duplicated.any():
+        logger.warning("%s: ignoring %d rows with a duplicate %s", name, int(duplicated.sum()), id_col)
+        frame = frame[~duplicated.to_numpy()]
+    return frame
+
+
+def _link_column(name, rules):
+    """The column other tables' rules join on, recorded with each fingerprint."""
+    columns = {rule["without"]["on"][1] for rule in rules if rule.get("without", {}).get("table") == name}
+    if len(columns) > 1:
+        raise ValueError(f"Rules join {name} on several columns: {sorted(columns)}")
+    return columns.pop() if columns else None
+
+
+def _frame(frames, name):
+    if name not in frames:
+        frames[name] = _unique_rows(name, load_table(name))
+    return frames[name]
+
+
+def _iso(ts):
+    return pd.Timestamp(ts).isoformat(sep=" ", timespec="seconds")
+
+
+def _python(values):
+    # sqlite3 binds Python scalars only
+    return pd.Series(values).tolist()
+
+
+class AnomalyStore:
+    """
+    SQLite table of anomalies kept current by delta scans. scan() diffs each
+    changed CSV against its stored row fingerprints, re-evaluates only the
+    affected rows, opens new anomalies and resolves the ones that no longer
+    hold. Rules with a `due` clause also queue the time each row will cross
+    the threshold, so the clock alone can open an anomaly without a rescan.
+    """
+
+    def __init__(self, path=ANOMALY_DB_PATH, rules=ANOMALY_RULES):
+        self.path = path
+        self.rules = rules
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        return connect(self.path)
+
+    # ------------------ Scanning ------------------
+    def _fingerprint_path(self, name):
+        return os.path.join(f"{os.path.splitext(self.path)[0]}_fingerprints", f"{name}.parquet")
+
+    def _read_fingerprints(self, name, signature):
+        """The table's row fingerprints as of `signature`, or None if there is no such snapshot."""
+        path = self._fingerprint_path(name)
+        if signature is None or not os.path.exists(path):
+            return None
+        if (pq.read_schema(path).metadata or {}).get(b"source_signature") != signature.encode():
+            return None
+        return pd.read_parquet(path)
+
+    def _write_fingerprints(self, name, fingerprints, signature):
+        table = pa.Table.from_pandas(fingerprints, preserve_index=False)
+        table = table.replace_schema_metadata(
+            {**(table.schema.metadata or {}), b"source_signature": signature.encode()}
+        )
+        path = self._fingerprint_path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        pq.write_table(table, f"{path}.tmp")
+        os.replace(f"{path}.tmp", path)
+
+    def _diff(self, name, frame, link, old):
+        """
+        Compares `frame` with the previous fingerprints. Returns (ids inserted
+        or changed, ids removed, link values of every touched row, old and
+        new, the new fingerprints).
+        """
+        ids = frame[_primary_key(name)].to_numpy()
+        fingerprints = pd.DataFrame({
+            "row_id": ids,
+            "hash": pd.util.hash_pandas_object(frame, index=False).to_numpy().view(np.int64),
+            "link": frame[link].to_numpy() if link else None,
+        })
+        if old is None:
+            old = fingerprints.iloc[:0]
+        new = fingerprints.set_index("row_id")
+        old = old.set_index("row_id")
+
+        common = new.index.intersection(old.index)
+        changed = common[new.loc[common, "hash"].to_numpy() != old.loc[common, "hash"].to_numpy()]
+        upserted = new.index.difference(old.index).append(changed)
+        removed = old.index.difference(new.index)
+        links = pd.concat([
+            new.loc[upserted, "link"].astype(object),
+            old.loc[changed.append(removed), "link"].astype(object),
+        ]).dropna().unique()
+        return upserted.to_numpy(), removed.to_numpy(), links, fingerprints
+
+    def scan(self, now=None, full=False):
+        """
+        Brings the anomaly table up to date with the CSVs at time `now`.
+        Returns {changed, evaluated, opened, resolved, seconds}.
+        """
+        started = time.perf_counter()
+        now = pd.Timestamp(now or pd.Timestamp.now())
+        params = rule_params(now)
+        stats = {"changed": 0, "evaluated": 0, "opened": 0, "resolved": 0}
+
+        with self._lock, self._connect() as conn:
+            if full:
+                conn.execute("DELETE FROM sources")
+
+            frames, upserted, removed, links, snapshots = {}, {}, {}, {}, {}
+            rebuilt = set()
+            stored = dict(conn.execute("SELECT tbl, signature FROM sources"))
+            for name in self._tables():
+                signature = repr(table_signature(name))
+                if stored.get(name) == signature:
+                    continue
+                frames[name] = _unique_rows(name, load_table(name))
+                old = self._read_fingerprints(name, stored.get(name))
+                if old is None:
+                    rebuilt.add(name)
+                upserted[name], removed[name], links[name], fingerprints = self._diff(
+                    name, frames[name], _link_column(name, self.rules), old
+                )
+                snapshots[name] = (fingerprints, signature)
+                conn.execute("INSERT OR REPLACE INTO sources VALUES (?, ?)", (name, signature))
+                stats["changed"] += len(upserted[name]) + len(removed[name])
+
+            for rule in self.rules:
+                name = rule["table"]
+                candidates = [upserted.get(name, [])]
+                due = [row[0] for row in conn.execute(
+                    "SELECT row_id FROM due WHERE rule = ? AND due_at <= ?", (rule["type"], _iso(now))
+                )]
+                candidates.append(due)
+                join = rule.get("without")
+                if join and len(links.get(join["table"], [])):
+                    frame = _frame(frames, name)
+                    affected = frame[join["on"][0]].isin(links[join["table"]]).to_numpy()
+                    candidates.append(frame.loc[affected, _primary_key(name)].to_numpy())
+
+                candidates = [np.asarray(c) for c in candidates if len(c)]
+                ids = np.unique(np.concatenate(candidates)) if candidates else []
+                gone = removed.get(name, np.array([]))
+                if len(ids) == 0 and len(gone) == 0:
+                    continue
+                frame = _frame(frames, name)
+                rows = frame[frame[_primary_key(name)].isin(ids).to_numpy()]
+                if name in rebuilt:
+                    conn.execute("DELETE FROM due WHERE rule = ?", (rule["type"],))
+                self._apply(conn, rule, rows, gone, frames, params, now, stats)
+                if name in rebuilt:
+                    # Every row was just evaluated: whatever wasn't seen now is gone
+                    stats["resolved"] += conn.execute(
+                        "UPDATE anomalies SET resolved_at = ? "
+                        "WHERE rule = ? AND resolved_at IS NULL AND last_seen < ?",
+                        (_iso(now), rule["type"], _iso(now)),
+                    ).rowcount
+
+            stats["seconds"] = time.perf_counter() - started
+            conn.execute(
+                "INSERT INTO scans VALUES (?, ?, ?, ?, ?, ?)",
+                (_iso(now), stats["seconds"], stats["changed"], stats["evaluated"], stats["opened"], stats["resolved"]),
+            )
+            conn.commit()
+            # Written after the commit: a snapshot whose signature doesn't match
+            # `sources` is ignored and that table is re-evaluated in full
+            for name, (fingerprints, signature) in snapshots.items():
+                self._write_fingerprints(name, fingerprints, signature)
+        return stats
+
+    def _tables(self):
+        names = []
+        for rule in self.rules:
+            names.append(rule["table"])
+            if rule.get("without"):
+                names.append(rule["without"]["table"])
+        return list(dict.fromkeys(names))
+
+    def _apply(self, conn, rule, rows, gone, frames, params, now, stats):
+        """Re-evaluates `rows` for one rule and records what opened, resolved or came due."""
+        kind, key = rule["type"], _primary_key(rule["table"])
+        keys = None
+        join = rule.get("without")
+        if join:
+            # Join keys only for the clients (etc.) being re-evaluated
+            other = _frame(frames, join["table"])
+            related = other[other[join["on"][1]].isin(rows[join["on"][0]].unique()).to_numpy()]
+            keys = join_keys(join, related, params)
+        result = evaluate_rule(rule, {rule["table"]: rows}, params, keys)
+        stats["evaluated"] += len(rows)
+        seen = _iso(now)
+
+        flagged = [(kind, a["id"], a["description"], seen, seen) for a in result["anomalies"]]
+        stats["opened"] += conn.executemany(
+            "INSERT INTO anomalies VALUES (?, ?, ?, ?, ?, NULL) "
+            "ON CONFLICT (rule, row_id) DO UPDATE SET first_seen = excluded.first_seen, resolved_at = NULL "
+            "WHERE resolved_at IS NOT NULL",
+            flagged,
+        ).rowcount
+        conn.executemany(
+            "UPDATE anomalies SET description = ?, last_seen = ? WHERE rule = ? AND row_id = ?",
+            ((description, seen, kind, row_id) for _, row_id, description, _, _ in flagged),
+        )
+
+        flagged_ids = {row_id for _, row_id, _, _, _ in flagged}
+        cleared = [row_id for row_id in _python(rows[key]) if row_id not in flagged_ids] + _python(gone)
+        stats["resolved"] += conn.executemany(
+            "UPDATE anomalies SET resolved_at = ? WHERE rule = ? AND row_id = ? AND resolved_at IS NULL",
+            ((seen, kind, row_id) for row_id in cleared),
+        ).rowcount
+
+        due = rule.get("due")
+        if due:
+            conn.executemany(
+                "DELETE FROM due WHERE rule = ? AND row_id = ?",
+                ((kind, row_id) for row_id in _python(rows[key]) + _python(gone)),
+            )
+            pending = rows[_mask(rows, due["while"], params)]
+            due_at = pd.to_datetime(pending[due["column"]], errors="coerce") + pd.Timedelta(days=due["after_days"])
+            upcoming = (due_at > now).to_numpy()
+            conn.executemany(
+                "INSERT INTO due VALUES (?, ?, ?)",
+                zip([kind] * int(upcoming.sum()), _python(pending.loc[upcoming, key]),
+                    [_iso(ts) for ts in due_at[upcoming]]),
+            )
+
+    # ------------------ Reads ------------------
+    def open_anomalies(self, rule=None, limit=None):
+        """Open anomalies, newest first: type, id, description, first_seen, last_seen."""
+        query = (
+            "SELECT rule AS type, row_id AS id, description, first_seen, last_seen "
+            "FROM anomalies WHERE resolved_at IS NULL"
+        )
+        args = []
+        if rule:
+            query += " AND rule = ?"
+            args.append(rule)
+        query += " ORDER BY first_seen DESC, rule, row_id"
+        if limit:
+            query += " LIMIT ?"
+            args.append(int(limit))
+        with self._connect() as conn:
+            return pd.read_sql_query(query, conn, params=args, parse_dates=["first_seen", "last_seen"])
+
+    def open_counts(self):
+        """{rule type: number of open anomalies}."""
+        with self._connect() as conn:
+            return dict(conn.execute(
+                "SELECT rule, COUNT(*) FROM anomalies WHERE resolved_at IS NULL GROUP BY rule"
+            ))
+
+    def last_scan(self):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT started_at, seconds, changed, evaluated, opened, resolved "
+                "FROM scans ORDER BY rowid DESC LIMIT 1"
+            ).fetchone()
+        keys = ("started_at", "seconds", "changed", "evaluated", "opened", "resolved")
+        return dict(zip(keys, row)) if row else None
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_anomaly_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = AnomalyStore()
+    return _store
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Update the persisted anomaly table from the ERP CSVs (run nightly)."
+    )
+    parser.add_argument("--db", default=ANOMALY_DB_PATH)
+    parser.add_argument(
+        "--full", action="store_true", help="Forget row fingerprints and re-evaluate every row."
+    )
+    args = parser.parse_args(argv)
+
+    store = AnomalyStore(args.db)
+    stats = store.scan(full=args.full)
+    print(
+        f"✅ Anomaly scan: {stats['changed']} rows changed, {stats['evaluated']} evaluated, "
+        f"{stats['opened']} opened, {stats['resolved']} resolved in {stats['seconds']:.2f}s"
+    )
+    for rule, count in sorted(store.open_counts().items()):
+        print(f"   {rule}: {count} open")
+
+
+if __name__ == "__main__":
+    main()
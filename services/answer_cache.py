@@ -0,0 +1,179 @@
+# services/answer_cache.py
+
+import hashlib
+import os
+import threading
+import time
+
+import numpy as np
+
+from services.db import connect
+from services.embedding_service import normalize_text
+
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", "Data/cache/answers.sqlite3")
+TTL_SECONDS = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "5000"))
+SIMILARITY_THRESHOLD = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.92"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS answers (
+    key TEXT PRIMARY KEY,
+    namespace TEXT NOT NULL,
+    index_version TEXT NOT NULL,
+    context_key TEXT,
+    embedding BLOB,
+    answer TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS answers_context
+    ON answers (namespace, index_version, context_key);
+CREATE INDEX IF NOT EXISTS answers_last_access ON answers (last_access);
+"""
+
+
+def _digest(*parts):
+    return hashlib.sha256("\x1f".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+
+
+def context_key(context_ids):
+    """Order-insensitive key for the set of retrieved context ids."""
+    return _digest(*sorted(str(i) for i in context_ids))
+
+
+class AnswerCache:
+    """
+    Persistent LLM answer cache in SQLite with two kinds of hit:
+
+    - exact: the same normalized prompt in the same namespace and index version;
+    - semantic: a query whose embedding is within `similarity_threshold` of a
+      cached one *and* whose retrieved context ids are identical, so a hit can
+      only return an answer grounded in the same documents.
+
+    Entries expire after `ttl_seconds`, the least recently used are evicted
+    beyond `max_entries`, and entries from an older index version never match.
+    """
+
+    def __init__(
+        self,
+        path=ANSWER_CACHE_PATH,
+        ttl_seconds=TTL_SECONDS,
+        max_entries=MAX_ENTRIES,
+        similarity_threshold=SIMILARITY_THRESHOLD,
+    ):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self._purged_versions = set()
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        # One short-lived connection per call keeps this safe across sessions/threads
+        return connect(self.path)
+
+    def get_exact(self, namespace, prompt, index_version=""):
+        key = _digest(namespace, index_version, normalize_text(prompt))
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT answer FROM answers WHERE key = ? AND created_at >= ?",
+                (key, now - self.ttl_seconds),
+            ).fetchone()
+            if row:
+                conn.execute("UPDATE answers SET last_access = ? WHERE key = ?", (now, key))
+        return row[0] if row else None
+
+    def get_similar(self, namespace, query_embedding, context_ids, index_version=""):
+        now = time.time()
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT key, embedding, answer FROM answers "
+                "WHERE namespace = ? AND index_version = ? AND context_key = ? "
+                "AND created_at >= ? AND embedding IS NOT NULL",
+                (namespace, index_version, context_key(context_ids), now - self.ttl_seconds),
+            ).fetchall()
+            if not rows:
+                return None
+
+            query = np.asarray(query_embedding, dtype=np.float32)
+            query = query / (np.linalg.norm(query) or 1.0)
+            cached = np.stack([np.frombuffer(r[1], dtype=np.float32) for r in rows])
+            scores = cached @ query
+            best = int(np.argmax(scores))
+            if scores[best] < self.similarity_threshold:
+                return None
+
+            conn.execute(
+                "UPDATE answers SET last_access = ? WHERE key = ?", (now, rows[best][0])
+            )
+            return rows[best][2]
+
+    def put(
+        self,
+        namespace,
+        prompt,
+        answer,
+        index_version="",
+        query_embedding=None,
+        context_ids=None,
+    ):
+        key = _digest(namespace, index_version, normalize_text(prompt))
+        embedding = None
+        if query_embedding is not None:
+            vector = np.asarray(query_embedding, dtype=np.float32)
+            embedding = (vector / (np.linalg.norm(vector) or 1.0)).tobytes()
+        now = time.time()
+
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    namespace,
+                    index_version,
+                    context_key(context_ids) if context_ids is not None else None,
+                    embedding,
+                    answer,
+                    now,
+                    now,
+                ),
+            )
+            conn.execute("DELETE FROM answers WHERE created_at < ?", (now - self.ttl_seconds,))
+            conn.execute(
+                "DELETE FROM answers WHERE key IN ("
+                "SELECT key FROM answers ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def invalidate(self, namespace, keep_version=None):
+        """Drops a namespace's entries, except those for `keep_version`."""
+        with self._lock:
+            if keep_version is not None and (namespace, keep_version) in self._purged_versions:
+                return
+            with self._connect() as conn:
+                conn.execute(
+                    "DELETE FROM answers WHERE namespace = ? AND index_version != ?",
+                    (namespace, keep_version if keep_version is not None else ""),
+                )
+            if keep_version is not None:
+                self._purged_versions.add((namespace, keep_version))
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_answer_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = AnswerCache()
+    return _cache
@@ -0,0 +1,137 @@
+# services/bm25_index.py
+
+import math
+import os
+import pickle
+import re
+from collections import Counter
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOPWORDS = {
+    "a", "an", "and", "any", "are", "as", "at", "be", "by", "for", "from", "in",
+    "is", "it", "of", "on", "or", "shall", "that", "the", "this", "to", "was",
+    "what", "which", "who", "whoever", "with",
+}
+
+
+def tokenize(text):
+    return [t for t in TOKEN_PATTERN.findall(str(text).lower()) if t not in STOPWORDS]
+
+
+def acronym(title):
+    # "Indian Penal Code" -> "ipc", so queries can use the short form of an act
+    words = [w for w in re.findall(r"[A-Za-z]+", str(title)) if w.lower() not in STOPWORDS]
+    return "".join(w[0] for w in words).lower() if len(words) > 1 else ""
+
+
+def section_tokens(chunk, act_title, section_name, section_number):
+    """Tokens for one indexed chunk: its text plus the fields users search by."""
+    tokens = tokenize(chunk) + tokenize(section_name) + tokenize(act_title)
+    tokens += tokenize(section_number)
+    short = acronym(act_title)
+    if short:
+        tokens.append(short)
+    return tokens
+
+
+class BM25Index:
+    """
+    In-memory inverted index with Okapi BM25 scoring and incremental updates.
+
+    Postings map each term to {internal doc number: term frequency}. External
+    ids are the Chroma chunk ids, so lexical and vector hits can be fused.
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.revision = None
+        self.postings = {}
+        self.doc_ids = {}
+        self.doc_keys = {}
+        self.doc_terms = {}
+        self.doc_lengths = {}
+        self.sources = {}
+        self.total_length = 0
+        self._next_doc = 0
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def add(self, doc_id, tokens, source=None):
+        if doc_id in self.doc_ids:
+            self.remove(doc_id)
+
+        doc = self._next_doc
+        self._next_doc += 1
+        counts = Counter(tokens)
+        for term, tf in counts.items():
+            self.postings.setdefault(term, {})[doc] = tf
+
+        self.doc_ids[doc_id] = doc
+        self.doc_keys[doc] = (doc_id, source)
+        self.doc_terms[doc] = tuple(counts)
+        self.doc_lengths[doc] = len(tokens)
+        self.total_length += len(tokens)
+        if source is not None:
+            self.sources.setdefault(source, set()).add(doc_id)
+
+    def remove(self, doc_id):
+        doc = self.doc_ids.pop(doc_id, None)
+        if doc is None:
+            return
+        for term in self.doc_terms.pop(doc):
+            postings = self.postings[term]
+            del postings[doc]
+            if not postings:
+                del self.postings[term]
+        self.total_length -= self.doc_lengths.pop(doc)
+        _, source = self.doc_keys.pop(doc)
+        if source is not None:
+            self.sources[source].discard(doc_id)
+            if not self.sources[source]:
+                del self.sources[source]
+
+    def remove_source(self, source):
+        for doc_id in list(self.sources.get(source, ())):
+            self.remove(doc_id)
+
+    def search(self, query, top_k=10):
+        """Returns [(doc_id, score)] for the best `top_k` matches, best first."""
+        n_docs = len(self.doc_ids)
+        if not n_docs:
+            return []
+        avg_length = self.total_length / n_docs
+
+        scores = Counter()
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            df = len(postings)
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            for doc, tf in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc] / avg_length)
+                scores[doc] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+        return [(self.doc_keys[doc][0], score) for doc, score in scores.most_common(top_k)]
+
+    def save(self, path):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """Fuses several ranked id lists into one, best first (Cormack et al., 2009)."""
+    scores = Counter()
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] += 1.0 / (k + rank + 1)
+    return [doc_id for doc_id, _ in scores.most_common()]
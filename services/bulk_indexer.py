@@ -0,0 +1,321 @@
+# services/bulk_indexer.py
+#
+# Pipelined bulk indexer for the act CSVs behind the Legal Act Explorer.
+#
+#   python -m services.bulk_indexer --folder Data/actmetadata --workers 8
+#
+# CSVs are read in streaming row chunks, section text is split across a process
+# pool, chunks are embedded in large batches on the main thread while a writer
+# thread upserts the previous batch into Chroma. Every stage is bounded, so peak
+# memory depends on the batch settings and not on the size of the library.
+
+import argparse
+import hashlib
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+REQUIRED_COLUMNS = ["section_text", "title", "section_name"]
+OPTIONAL_COLUMNS = ["section_number"]
+
+_worker_splitter = None
+
+
+def _chunk_batch(texts, chunk_size, chunk_overlap):
+    # Runs inside a pool worker; the splitter is built once per process
+    global _worker_splitter
+    if _worker_splitter is None:
+        _worker_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size, chunk_overlap=chunk_overlap
+        )
+    return [_worker_splitter.split_text(text) for text in texts]
+
+
+def _file_sha256(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class _Batch:
+    def __init__(self):
+        self.ids, self.documents, self.metadatas = [], [], []
+        self.finished_files = []
+
+    def __len__(self):
+        return len(self.ids)
+
+
+class BulkIndexer:
+    """
+    Streams act CSVs into the Chroma collection used by `legal_rag_chroma`.
+
+    Chunk ids and manifest entries match `prepare_rag_index`, so a warm start
+    after a bulk run skips every file indexed here.
+    """
+
+    def __init__(
+        self,
+        folder_path="Data/actmetadata",
+        workers=None,
+        read_chunk_rows=2000,
+        embed_batch_size=2048,
+        max_pending=None,
+        chunk_size=500,
+        chunk_overlap=50,
+        force=False,
+        report_every=5.0,
+    ):
+        self.folder_path = folder_path
+        self.workers = workers or os.cpu_count() or 1
+        self.read_chunk_rows = read_chunk_rows
+        self.embed_batch_size = embed_batch_size
+        self.max_pending = max_pending or self.workers * 2
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.force = force
+        self.report_every = report_every
+
+        self.rows = 0
+        self.chunks = 0
+        self.files = 0
+        self._started = None
+        self._last_report = 0.0
+
+    def run(self):
+        # Imported here so pool workers never open Chroma or load the model
+        from services import legal_rag_chroma as rag
+
+        if not os.path.exists(self.folder_path):
+            raise FileNotFoundError(f"❌ Folder not found: {self.folder_path}")
+
+        self.rag = rag
+        self.collection = rag.chroma_client.get_or_create_collection(
+            name=rag.COLLECTION_NAME, embedding_function=None
+        )
+        self.manifest = rag._load_manifest()
+        rag.get_bm25_index(self.collection)
+        rag.get_section_index(self.folder_path)
+        self._started = time.perf_counter()
+
+        # Two batches in flight at most: one being embedded, one being written
+        self._writes = queue.Queue(maxsize=1)
+        self._write_error = None
+        writer = threading.Thread(target=self._write_loop, name="chroma-writer")
+        writer.start()
+
+        try:
+            # Spawned, not forked: this process already runs threads and holds Chroma
+            with ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            ) as pool:
+                self._pipeline(pool)
+        finally:
+            self._writes.put(None)
+            writer.join()
+
+        if self._write_error is not None:
+            raise self._write_error
+
+        rag._save_manifest(self.manifest)
+        rag._save_side_indexes(self.manifest)
+        return self.report(final=True)
+
+    def _pipeline(self, pool):
+        pending = deque()
+        batch = _Batch()
+
+        files = sorted(f for f in os.listdir(self.folder_path) if f.endswith(".csv"))
+        for file in [f for f in self.manifest["files"] if f not in files]:
+            # Source CSV was removed since the last run: drop every chunk that came from it
+            self._put_write(("delete", file))
+            self.rag._sections.remove_file(file)
+
+        for file in files:
+            file_path = os.path.join(self.folder_path, file)
+            stat = os.stat(file_path)
+            previous = self.manifest["files"].get(file)
+            if (
+                previous
+                and not self.force
+                and previous["size"] == stat.st_size
+                and previous["mtime_ns"] == stat.st_mtime_ns
+            ):
+                continue
+            file_hash = _file_sha256(file_path)
+            if previous and previous["sha256"] == file_hash and not self.force:
+                # Touched but not modified: just refresh the stat signature
+                self._put_write(("touch", file, stat.st_size, stat.st_mtime_ns))
+                continue
+
+            header = pd.read_csv(file_path, nrows=0).columns
+            if any(col not in header for col in REQUIRED_COLUMNS):
+                if previous:
+                    self._put_write(("delete", file))
+                self.rag._sections.remove_file(file)
+                continue
+            usecols = REQUIRED_COLUMNS + [c for c in OPTIONAL_COLUMNS if c in header]
+
+            state = {
+                "file": file,
+                "entry": {
+                    "size": stat.st_size,
+                    "mtime_ns": stat.st_mtime_ns,
+                    "sha256": file_hash,
+                    "sections": {},
+                },
+                "seen": {},
+            }
+            self._put_write(("delete", file))
+            self.rag._sections.remove_file(file)
+            for rows in pd.read_csv(
+                file_path, usecols=usecols, chunksize=self.read_chunk_rows
+            ):
+                self.rag._sections.add_rows(file, rows)
+                sections = list(self.rag._iter_sections(rows, file, state["seen"]))
+                texts = [text for _, _, text, _ in sections]
+                future = pool.submit(
+                    _chunk_batch, texts, self.chunk_size, self.chunk_overlap
+                )
+                pending.append((state, sections, future))
+                self.rows += len(rows)
+
+                while len(pending) >= self.max_pending:
+                    batch = self._drain_one(pending, batch)
+
+            pending.append((state, None, None))
+
+        while pending:
+            batch = self._drain_one(pending, batch)
+        self._flush(batch)
+
+    def _drain_one(self, pending, batch):
+        state, sections, future = pending.popleft()
+        if future is None:
+            # End-of-file marker: its chunks are all in this batch or already sent
+            batch.finished_files.append((state["file"], state["entry"]))
+            self.files += 1
+            return batch
+
+        file = state["file"]
+        entries = state["entry"]["sections"]
+        for (section_key, content_hash, _, metadata), chunks in zip(
+            sections, future.result()
+        ):
+            entries[section_key] = {"hash": content_hash, "chunks": len(chunks)}
+            for j, chunk in enumerate(chunks):
+                batch.ids.append(f"{file}_{section_key}_{j}")
+                batch.documents.append(chunk)
+                batch.metadatas.append(metadata)
+                if len(batch) >= self.embed_batch_size:
+                    batch = self._flush(batch)
+
+        self.report()
+        return batch
+
+    def _flush(self, batch):
+        embeddings = (
+            self.rag.embedder.encode(batch.documents, batch_size=256) if batch else None
+        )
+        self.chunks += len(batch)
+        self._put_write(("upsert", batch, embeddings))
+        return _Batch()
+
+    def _put_write(self, item):
+        if self._write_error is not None:
+            raise self._write_error
+        self._writes.put(item)
+
+    def _write_loop(self):
+        while True:
+            item = self._writes.get()
+            if item is None:
+                return
+            if self._write_error is not None:
+                continue
+            try:
+                if item[0] == "delete":
+                    # Until the file is fully re-written it must look unindexed,
+                    # on disk too, or a crash here would leave it skipped for good
+                    self.rag._delete_source(self.collection, item[1])
+                    if self.manifest["files"].pop(item[1], None) is not None:
+                        self.rag._save_manifest(self.manifest)
+                    continue
+                if item[0] == "touch":
+                    _, file, size, mtime_ns = item
+                    self.manifest["files"][file].update(size=size, mtime_ns=mtime_ns)
+                    continue
+                _, batch, embeddings = item
+                if batch:
+                    self.collection.upsert(
+                        ids=batch.ids,
+                        documents=batch.documents,
+                        metadatas=batch.metadatas,
+                        embeddings=embeddings,
+                    )
+                    self.rag._index_lexical(batch.ids, batch.documents, batch.metadatas)
+                for file, entry in batch.finished_files:
+                    self.manifest["files"][file] = entry
+                if batch.finished_files:
+                    self.rag._save_manifest(self.manifest)
+            except Exception as e:
+                self._write_error = e
+
+    def report(self, final=False):
+        now = time.perf_counter()
+        if not final and now - self._last_report < self.report_every:
+            return None
+        self._last_report = now
+        elapsed = max(now - self._started, 1e-9)
+        stats = {
+            "files": self.files,
+            "rows": self.rows,
+            "chunks": self.chunks,
+            "seconds": round(elapsed, 2),
+            "rows_per_s": round(self.rows / elapsed, 1),
+            "chunks_per_s": round(self.chunks / elapsed, 1),
+        }
+        prefix = "✅ Done" if final else "📦 Indexing"
+        print(
+            f"{prefix}: {stats['files']} files, {stats['rows']} rows, "
+            f"{stats['chunks']} chunks in {stats['seconds']}s "
+            f"({stats['rows_per_s']} rows/s, {stats['chunks_per_s']} chunks/s)"
+        )
+        return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Bulk-index act CSVs into the Legal Act Explorer Chroma collection."
+    )
+    parser.add_argument("--folder", default="Data/actmetadata")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--read-chunk-rows", type=int, default=2000)
+    parser.add_argument("--embed-batch-size", type=int, default=2048)
+    parser.add_argument("--max-pending", type=int, default=None)
+    parser.add_argument(
+        "--force", action="store_true", help="Re-index files even if unchanged."
+    )
+    args = parser.parse_args(argv)
+
+    BulkIndexer(
+        folder_path=args.folder,
+        workers=args.workers,
+        read_chunk_rows=args.read_chunk_rows,
+        embed_batch_size=args.embed_batch_size,
+        max_pending=args.max_pending,
+        force=args.force,
+    ).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+# services/case_corpus.py
+
+import hashlib
+import os
+import threading
+import time
+
+import faiss
+import numpy as np
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from services.db import connect
+from services.embedding_service import get_embedding_service
+
+CORPUS_DIR = os.getenv("CASE_CORPUS_DIR", "Data/case_corpus")
+# Shards switch index type as they grow: flat -> HNSW -> IVF
+FLAT_MAX_VECTORS = int(os.getenv("CASE_CORPUS_FLAT_MAX", "50000"))
+HNSW_MAX_VECTORS = int(os.getenv("CASE_CORPUS_HNSW_MAX", "500000"))
+# Filters this selective are answered by exact search over just the selected vectors
+EXACT_FILTER_MAX = 4096
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS matters (
+    matter TEXT PRIMARY KEY,
+    shard TEXT NOT NULL,
+    index_type TEXT NOT NULL,
+    vectors INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS documents (
+    doc_id TEXT NOT NULL,
+    matter TEXT NOT NULL,
+    name TEXT NOT NULL,
+    chunks INTEGER NOT NULL,
+    added_at REAL NOT NULL,
+    PRIMARY KEY (matter, doc_id)
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    chunk_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    matter TEXT NOT NULL,
+    doc_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    embedding BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS chunks_doc ON chunks (matter, doc_id);
+"""
+
+
+def _index_type_for(vectors):
+    if vectors < FLAT_MAX_VECTORS:
+        return "flat"
+    if vectors < HNSW_MAX_VECTORS:
+        return "hnsw"
+    return "ivf"
+
+
+def _new_index(index_type, dimension, training=None):
+    if index_type == "flat":
+        base = faiss.IndexFlatIP(dimension)
+    elif index_type == "hnsw":
+        base = faiss.IndexHNSWFlat(dimension, 32, faiss.METRIC_INNER_PRODUCT)
+        base.hnsw.efConstruction = 80
+    else:
+        nlist = int(4 * np.sqrt(len(training)))
+        base = faiss.IndexIVFFlat(faiss.IndexFlatIP(dimension), dimension, nlist, faiss.METRIC_INNER_PRODUCT)
+        base.train(training)
+    # External ids are the chunk_ids in corpus.sqlite3
+    return faiss.IndexIDMap2(base)
+
+
+def _search_params(index, selector):
+    base = faiss.downcast_index(index.index)
+    if isinstance(base, faiss.IndexHNSW):
+        params = faiss.SearchParametersHNSW()
+        params.efSearch = 64
+    elif isinstance(base, faiss.IndexIVF):
+        params = faiss.SearchParametersIVF()
+        params.nprobe = max(8, base.nlist // 16)
+    else:
+        params = faiss.SearchParameters()
+    if selector is not None:
+        params.sel = selector
+    return params
+
+
+class CaseCorpus:
+    """
+    Persistent multi-document corpus, sharded by matter.
+
+    Each matter is one FAISS shard (IndexIDMap2 over flat, HNSW or IVF,
+    chosen by shard size) whose ids are chunk ids in a SQLite catalogue of
+    documents and chunks. Adding a document embeds only its own chunks and
+    appends them to its matter's shard; a shard is rebuilt only when it
+    crosses a size threshold and is promoted to the next index type.
+
+    Searches restricted to chosen documents pass an IDSelectorBatch to FAISS,
+    so filtering happens inside the index scan rather than after it.
+    """
+
+    def __init__(self, root=CORPUS_DIR, chunk_size=300, chunk_overlap=50):
+        self.root = root
+        self.splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size, chunk_overlap=chunk_overlap
+        )
+        self.embedder = get_embedding_service()
+        self._shards = {}
+        self._lock = threading.RLock()
+        os.makedirs(root, exist_ok=True)
+        self.db_path = os.path.join(root, "corpus.sqlite3")
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        return connect(self.db_path)
+
+    # ------------------ Shards ------------------
+    def _shard_path(self, shard):
+        return os.path.join(self.root, f"{shard}.faiss")
+
+    def _open_shard(self, shard):
+        if shard not in self._shards:
+            path = self._shard_path(shard)
+            if os.path.exists(path):
+                self._shards[shard] = faiss.read_index(path)
+            else:
+                self._shards[shard] = _new_index("flat", self.embedder.dimension)
+        return self._shards[shard]
+
+    def _existing_shard(self, conn, matter):
+        """Returns (shard name, index) for a known matter, or None. Never writes."""
+        row = conn.execute("SELECT shard FROM matters WHERE matter = ?", (matter,)).fetchone()
+        if row is None:
+            return None
+        return row[0], self._open_shard(row[0])
+
+    def _shard(self, conn, matter):
+        """Returns (shard name, index) for a matter, creating an empty flat shard."""
+        found = self._existing_shard(conn, matter)
+        if found is not None:
+            return found
+        shard = hashlib.sha1(matter.encode("utf-8")).hexdigest()[:16]
+        conn.execute(
+            "INSERT INTO matters (matter, shard, index_type) VALUES (?, ?, 'flat')",
+            (matter, shard),
+        )
+        return shard, self._open_shard(shard)
+
+    def _save_shard(self, shard, index):
+        tmp = f"{self._shard_path(shard)}.tmp"
+        faiss.write_index(index, tmp)
+        os.replace(tmp, self._shard_path(shard))
+
+    def _rebuild_shard(self, conn, matter, shard, index_type):
+        rows = conn.execute(
+            "SELECT chunk_id, embedding FROM chunks WHERE matter = ? ORDER BY chunk_id", (matter,)
+        ).fetchall()
+        ids = np.array([r[0] for r in rows], dtype=np.int64)
+        vectors = np.stack([np.frombuffer(r[1], dtype=np.float32) for r in rows]) if rows else None
+        index = _new_index(index_type, self.embedder.dimension, training=vectors)
+        if rows:
+            index.add_with_ids(vectors, ids)
+        self._shards[shard] = index
+        conn.execute("UPDATE matters SET index_type = ? WHERE matter = ?", (index_type, matter))
+        return index
+
+    # ------------------ Writes ------------------
+    def add_document(self, matter, name, text, doc_id=None):
+        """
+        Chunks, embeds and appends one document to its matter's shard.
+        Returns the number of chunks added (0 if the document is already there).
+        """
+        doc_id = doc_id or hashlib.sha256(text.encode("utf-8")).hexdigest()
+        chunks = self.splitter.split_text(text)
+        if not chunks:
+            return 0
+
+        with self._lock, self._connect() as conn:
+            exists = conn.execute(
+                "SELECT 1 FROM documents WHERE matter = ? AND doc_id = ?", (matter, doc_id)
+            ).fetchone()
+            if exists:
+                return 0
+
+            vectors = self.embedder.encode(chunks)
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+            ids = []
+            for position, (chunk, vector) in enumerate(zip(chunks, vectors)):
+                cursor = conn.execute(
+                    "INSERT INTO chunks (matter, doc_id, position, text, embedding) VALUES (?, ?, ?, ?, ?)",
+                    (matter, doc_id, position, chunk, vector.tobytes()),
+                )
+                ids.append(cursor.lastrowid)
+            conn.execute(
+                "INSERT INTO documents VALUES (?, ?, ?, ?, ?)",
+                (doc_id, matter, name, len(chunks), time.time()),
+            )
+
+            shard, index = self._shard(conn, matter)
+            total = index.ntotal + len(chunks)
+            current = conn.execute(
+                "SELECT index_type FROM matters WHERE matter = ?", (matter,)
+            ).fetchone()[0]
+            target = _index_type_for(total)
+            if target != current:
+                index = self._rebuild_shard(conn, matter, shard, target)
+            else:
+                index.add_with_ids(vectors, np.array(ids, dtype=np.int64))
+            conn.execute("UPDATE matters SET vectors = ? WHERE matter = ?", (total, matter))
+            self._save_shard(shard, index)
+        return len(chunks)
+
+    def remove_document(self, matter, doc_id):
+        """Removes a document; only its own matter's shard is rebuilt."""
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM chunks WHERE matter = ? AND doc_id = ?", (matter, doc_id))
+            conn.execute("DELETE FROM documents WHERE matter = ? AND doc_id = ?", (matter, doc_id))
+            shard, _ = self._shard(conn, matter)
+            count = conn.execute(
+                "SELECT COUNT(*) FROM chunks WHERE matter = ?", (matter,)
+            ).fetchone()[0]
+            index = self._rebuild_shard(conn, matter, shard, _index_type_for(count))
+            conn.execute("UPDATE matters SET vectors = ? WHERE matter = ?", (count, matter))
+            self._save_shard(shard, index)
+
+    # ------------------ Reads ------------------
+    def matters(self):
+        with self._connect() as conn:
+            return [r[0] for r in conn.execute("SELECT matter FROM matters ORDER BY matter")]
+
+    def documents(self, matters=None):
+        """[{doc_id, matter, name, chunks, added_at}] for the given matters (all by default)."""
+        query = "SELECT doc_id, matter, name, chunks, added_at FROM documents"
+        args = ()
+        if matters:
+            query += f" WHERE matter IN ({','.join('?' * len(matters))})"
+            args = tuple(matters)
+        with self._connect() as conn:
+            rows = conn.execute(query + " ORDER BY matter, name", args).fetchall()
+        keys = ("doc_id", "matter", "name", "chunks", "added_at")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def search(self, query, top_k=5, matters=None, doc_ids=None):
+        """
+        Returns the top_k chunks as dicts (chunk_id, doc_id, matter, name, text,
+        score), searching only `matters` and, within them, only `doc_ids`.
+        """
+        query_vector = np.asarray(self.embedder.embed_query(query), dtype=np.float32)
+        query_vector = (query_vector / (np.linalg.norm(query_vector) or 1.0))[None, :]
+        matters = matters or self.matters()
+
+        hits = []
+        with self._lock, self._connect() as conn:
+            for matter in matters:
+                found = self._existing_shard(conn, matter)
+                if found is None:
+                    continue
+                shard, index = found
+                if index.ntotal == 0:
+                    continue
+
+                if doc_ids is None:
+                    scores, ids = index.search(query_vector, top_k, params=_search_params(index, None))
+                    hits.extend(zip(scores[0], ids[0]))
+                    continue
+
+                docs = list(doc_ids)
+                rows = conn.execute(
+                    "SELECT chunk_id, embedding FROM chunks "
+                    f"WHERE matter = ? AND doc_id IN ({','.join('?' * len(docs))})",
+                    (matter, *docs),
+                ).fetchall()
+                if not rows:
+                    continue
+                selected = np.array([r[0] for r in rows], dtype=np.int64)
+
+                if len(selected) <= EXACT_FILTER_MAX:
+                    # Small selections: exact search over just those vectors
+                    vectors = np.stack([np.frombuffer(r[1], dtype=np.float32) for r in rows])
+                    scores = vectors @ query_vector[0]
+                    best = np.argsort(scores)[::-1][:top_k]
+                    hits.extend(zip(scores[best], selected[best]))
+                else:
+                    selector = faiss.IDSelectorBatch(selected)
+                    scores, ids = index.search(
+                        query_vector, top_k, params=_search_params(index, selector)
+                    )
+                    hits.extend(zip(scores[0], ids[0]))
+
+            hits = sorted((h for h in hits if h[1] >= 0), key=lambda h: -h[0])[:top_k]
+            if not hits:
+                return []
+            ids = [int(i) for _, i in hits]
+            rows = conn.execute(
+                "SELECT c.chunk_id, c.doc_id, c.matter, d.name, c.text FROM chunks c "
+                "JOIN documents d ON d.doc_id = c.doc_id AND d.matter = c.matter "
+                f"WHERE c.chunk_id IN ({','.join('?' * len(ids))})",
+                ids,
+            ).fetchall()
+
+        by_id = {r[0]: r for r in rows}
+        keys = ("chunk_id", "doc_id", "matter", "name", "text")
+        return [
+            dict(zip(keys, by_id[int(i)]), score=float(s)) for s, i in hits if int(i) in by_id
+        ]
+
+
+_corpus = None
+_corpus_lock = threading.Lock()
+
+
+def get_case_corpus():
+    global _corpus
+    if _corpus is None:
+        with _corpus_lock:
+            if _corpus is None:
+                _corpus = CaseCorpus()
+    return _corpus
@@ -1,14 +1,118 @@
 # File: services/data_loader.py
 
-import pandas as pd
+import logging
 import os
 
-def load_all_data():
-    base_path = os.path.join(os.getcwd(),'Data')
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import streamlit as st
+
+from config.schema import TABLE_SCHEMAS
+
+TABLES = ("attorneys", "clients", "matters", "leaves")
+SIDECAR_DIR = ".parquet"
+
+logger = logging.getLogger(__name__)
+
+
+def data_dir():
+    return os.path.join(os.getcwd(), 'Data')
+
+
+def _signature(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _compact_ids(series):
+    """Smallest integer dtype for numeric ids; category for anything else."""
+    numeric = pd.to_numeric(series, errors="coerce")
+    if numeric.notna().sum() == series.notna().sum() and (numeric.dropna() % 1 == 0).all():
+        if numeric.isna().any():
+            return numeric.astype("Int64")
+        return pd.to_numeric(numeric.astype(np.int64), downcast="integer")
+    return series.astype("category")
+
+
+def _apply_schema(df, schema):
+    for col in schema["ids"]:
+        if col in df:
+            df[col] = _compact_ids(df[col])
+    for col in schema["categories"]:
+        if col in df:
+            df[col] = df[col].astype("category")
+    for col in schema["dates"]:
+        if col in df:
+            df[col] = pd.to_datetime(df[col], errors="coerce")
+    for col in schema["numbers"]:
+        if col in df:
+            df[col] = pd.to_numeric(df[col], errors="coerce", downcast="float")
+    return df
 
-    attorneys = pd.read_csv(os.path.join(base_path, 'attorney_data.csv'))
-    clients = pd.read_csv(os.path.join(base_path, 'client_data.csv'))
-    matters = pd.read_csv(os.path.join(base_path, 'matter_data.csv'))
-    leaves = pd.read_csv(os.path.join(base_path, 'leave_time_data.csv'))
 
+def _read_sidecar(sidecar, signature):
+    """Returns the parquet sidecar if it was written from this exact CSV version."""
+    if not os.path.exists(sidecar):
+        return None
+    meta = pq.read_schema(sidecar).metadata or {}
+    if meta.get(b"source_signature") != repr(signature).encode():
+        return None
+    return pd.read_parquet(sidecar)
+
+
+def _write_sidecar(sidecar, df, signature):
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.replace_schema_metadata(
+        {**(table.schema.metadata or {}), b"source_signature": repr(signature).encode()}
+    )
+    tmp = f"{sidecar}.tmp"
+    try:
+        os.makedirs(os.path.dirname(sidecar), exist_ok=True)
+        pq.write_table(table, tmp)
+        os.replace(tmp, sidecar)
+    except OSError as e:
+        logger.warning("Could not write parquet sidecar %s: %s", sidecar, e)
+
+
+def _read_only(df):
+    """Marks the arrays behind every column non-writeable, so in-place writes raise."""
+    for values in df._mgr.arrays:
+        # numpy blocks, and the ndarrays inside datetime, categorical and masked arrays
+        for part in (values, *(getattr(values, attr, None) for attr in ("_ndarray", "_data", "_mask"))):
+            if isinstance(part, np.ndarray):
+                part.flags.writeable = False
+    return df
+
+
+@st.cache_resource(show_spinner=False, max_entries=16)
+def _load_table(name, path, signature):
+    sidecar = os.path.join(os.path.dirname(path), SIDECAR_DIR, f"{name}.parquet")
+    df = _read_sidecar(sidecar, signature)
+    if df is None:
+        df = _apply_schema(pd.read_csv(path), TABLE_SCHEMAS[name])
+        _write_sidecar(sidecar, df, signature)
+    return _read_only(df)
+
+
+def table_signature(name):
+    """(mtime_ns, size) of a table's CSV; changes whenever the file does."""
+    return _signature(os.path.join(data_dir(), TABLE_SCHEMAS[name]["file"]))
+
+
+def load_table(name):
+    """
+    Returns one typed table. It is parsed once per CSV version (size and
+    mtime) and shared by every session, via a parquet sidecar on cold start.
+    The result is a shallow copy over read-only arrays: callers may add or
+    replace columns on it, but writing values in place raises ValueError.
+    Use .copy() first to modify the data itself.
+    """
+    path = os.path.join(data_dir(), TABLE_SCHEMAS[name]["file"])
+    return _load_table(name, path, _signature(path)).copy(deep=False)
+
+
+def load_all_data():
+    attorneys, clients, matters, leaves = (load_table(name) for name in TABLES)
     return attorneys, clients, matters, leaves
@@ -0,0 +1,19 @@
+# services/db.py
+
+import contextlib
+import sqlite3
+
+
+@contextlib.contextmanager
+def connect(path, timeout=30):
+    """
+    A SQLite connection for one `with` block: commits on success, rolls back
+    on error, and is closed on exit. sqlite3's own context manager only ends
+    the transaction, leaving the connection and its file handle open.
+    """
+    conn = sqlite3.connect(path, timeout=timeout)
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
@@ -0,0 +1,126 @@
+# services/document_cache.py
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import uuid
+
+from langchain_community.vectorstores import FAISS
+from services.embedding_service import SharedEmbeddings
+
+DOC_CACHE_DIR = os.getenv("DOC_CACHE_DIR", "Data/doc_cache")
+DOC_CACHE_MAX_BYTES = int(os.getenv("DOC_CACHE_MAX_MB", "1024")) * 1024 * 1024
+
+
+def file_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _dir_size(path):
+    return sum(
+        os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files
+    )
+
+
+class DocumentCache:
+    """
+    Content-addressed store of processed uploads: file hash -> extracted text,
+    chunks and a saved FAISS index. Entries are shared by every session and
+    survive restarts; the least recently opened are evicted past `max_bytes`.
+
+    Each entry records the fingerprint it was built with (embedding model,
+    chunking), and an entry with a different fingerprint counts as a miss.
+    """
+
+    def __init__(self, root=DOC_CACHE_DIR, max_bytes=DOC_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _entry(self, key):
+        return os.path.join(self.root, key)
+
+    def get(self, key, fingerprint):
+        entry = self._entry(key)
+        meta_path = os.path.join(entry, "meta.json")
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("fingerprint") != fingerprint:
+                return None
+            with open(os.path.join(entry, "text.txt"), "r", encoding="utf-8") as f:
+                text = f.read()
+            with open(os.path.join(entry, "chunks.json"), "r", encoding="utf-8") as f:
+                chunks = json.load(f)
+            vectorstore = FAISS.load_local(
+                os.path.join(entry, "faiss"),
+                SharedEmbeddings(),
+                allow_dangerous_deserialization=True,  # written by this process, never uploaded
+            )
+        except (OSError, ValueError, RuntimeError):
+            return None
+
+        os.utime(meta_path)  # mtime of meta.json is the LRU clock
+        return text, chunks, vectorstore
+
+    def put(self, key, fingerprint, text, chunks, vectorstore):
+        tmp = os.path.join(self.root, f".{key}.{uuid.uuid4().hex}.tmp")
+        os.makedirs(tmp)
+        with open(os.path.join(tmp, "text.txt"), "w", encoding="utf-8") as f:
+            f.write(text)
+        with open(os.path.join(tmp, "chunks.json"), "w", encoding="utf-8") as f:
+            json.dump(chunks, f)
+        vectorstore.save_local(os.path.join(tmp, "faiss"))
+        with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"fingerprint": fingerprint, "chunks": len(chunks)}, f)
+
+        with self._lock:
+            shutil.rmtree(self._entry(key), ignore_errors=True)
+            os.replace(tmp, self._entry(key))
+            self._evict(keep=key)
+
+    def get_or_build(self, key, fingerprint, build):
+        """
+        Returns (text, chunks, vectorstore) for `key`, calling
+        `build() -> (text, chunks, vectorstore)` and storing the result on a miss.
+        """
+        cached = self.get(key, fingerprint)
+        if cached is not None:
+            return cached
+        text, chunks, vectorstore = build()
+        self.put(key, fingerprint, text, chunks, vectorstore)
+        return text, chunks, vectorstore
+
+    def _evict(self, keep=None):
+        entries = []
+        for name in os.listdir(self.root):
+            path = self._entry(name)
+            meta_path = os.path.join(path, "meta.json")
+            if name.startswith(".") or not os.path.exists(meta_path):
+                continue
+            entries.append((os.path.getmtime(meta_path), _dir_size(path), name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            shutil.rmtree(self._entry(name), ignore_errors=True)
+            total -= size
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_document_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = DocumentCache()
+    return _cache
@@ -0,0 +1,192 @@
+# services/embedding_service.py
+
+import queue
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from sentence_transformers import SentenceTransformer
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+
+
+def normalize_text(text):
+    # MiniLM is uncased, so case and runs of whitespace never change the embedding
+    return " ".join(str(text).lower().split())
+
+
+class EmbeddingService:
+    """
+    Holds the single MiniLM instance for the process.
+
+    Query embeddings go through a bounded LRU cache keyed by normalized text;
+    cache misses from concurrent callers (e.g. several Streamlit sessions) are
+    merged by a background worker into one `encode` call per micro-batch.
+    Bulk document encoding goes straight to the model in large batches.
+    """
+
+    def __init__(
+        self,
+        model_name=MODEL_NAME,
+        max_batch_size=64,
+        max_wait_ms=5,
+        cache_size=4096,
+        model=None,
+    ):
+        self.model_name = model_name
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.cache_size = cache_size
+
+        # Any object with SentenceTransformer's `encode` works, e.g. an offline stub
+        self._model = model
+        self._model_lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._requests = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    self._model = SentenceTransformer(self.model_name)
+        return self._model
+
+    @property
+    def dimension(self):
+        return self.model.get_sentence_embedding_dimension()
+
+    def encode(self, texts, batch_size=256, show_progress_bar=False):
+        """Encodes documents in bulk. Returns a float32 array of shape (n, dim)."""
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        embeddings = self.model.encode(
+            texts,
+            batch_size=batch_size,
+            convert_to_numpy=True,
+            show_progress_bar=show_progress_bar,
+        )
+        return np.asarray(embeddings, dtype=np.float32)
+
+    def embed_query(self, text):
+        return self.embed_queries([text])[0]
+
+    def embed_queries(self, texts):
+        """Embeds short query strings through the LRU cache and the micro-batcher."""
+        keys = [normalize_text(t) for t in texts]
+        results = [None] * len(keys)
+        misses = {}
+
+        with self._cache_lock:
+            for i, key in enumerate(keys):
+                cached = self._cache.get(key)
+                if cached is not None:
+                    self._cache.move_to_end(key)
+                    results[i] = cached
+                else:
+                    misses.setdefault(key, []).append(i)
+
+        if misses:
+            future = self._submit(list(misses))
+            for key, embedding in zip(misses, future.result()):
+                # Copy the row so the cache never pins a whole batch array
+                embedding = embedding.copy()
+                embedding.setflags(write=False)
+                self._remember(key, embedding)
+                for i in misses[key]:
+                    results[i] = embedding
+
+        return np.stack(results) if results else np.zeros((0, self.dimension), np.float32)
+
+    def cache_info(self):
+        with self._cache_lock:
+            return {"size": len(self._cache), "max_size": self.cache_size}
+
+    def _remember(self, key, embedding):
+        with self._cache_lock:
+            self._cache[key] = embedding
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _submit(self, texts):
+        future = Future()
+        self._ensure_worker()
+        self._requests.put((texts, future))
+        return future
+
+    def _ensure_worker(self):
+        if self._worker is not None:
+            return
+        with self._worker_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(
+                    target=self._run_batches, name="embedding-batcher", daemon=True
+                )
+                self._worker.start()
+
+    def _run_batches(self):
+        while True:
+            batch = [self._requests.get()]
+            size = len(batch[0][0])
+            # Give concurrent callers a few milliseconds to join this batch
+            while size < self.max_batch_size:
+                try:
+                    item = self._requests.get(timeout=self.max_wait)
+                except queue.Empty:
+                    break
+                batch.append(item)
+                size += len(item[0])
+
+            texts = [text for item_texts, _ in batch for text in item_texts]
+            try:
+                embeddings = self.encode(texts, batch_size=self.max_batch_size)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            offset = 0
+            for item_texts, future in batch:
+                future.set_result(embeddings[offset : offset + len(item_texts)])
+                offset += len(item_texts)
+
+
+class SharedEmbeddings(Embeddings):
+    """LangChain adapter so FAISS stores reuse the shared model."""
+
+    def __init__(self, service=None):
+        self.service = service or get_embedding_service()
+
+    def embed_documents(self, texts):
+        return self.service.encode(texts).tolist()
+
+    def embed_query(self, text):
+        return self.service.embed_query(text).tolist()
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_embedding_service():
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = EmbeddingService()
+    return _service
+
+
+def configure_embedding_service(**kwargs):
+    """Replaces the process-wide service; call before anything embeds."""
+    global _service
+    with _service_lock:
+        _service = EmbeddingService(**kwargs)
+    return _service
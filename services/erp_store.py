@@ -0,0 +1,263 @@
+# services/erp_store.py
+
+import os
+import threading
+
+import pandas as pd
+
+from config.anomaly_rules import rule_params
+from config.schema import (
+    ATTORNEY_COLUMNS,
+    CLIENT_COLUMNS,
+    LEAVE_COLUMNS,
+    MATTER_COLUMNS,
+    TABLE_SCHEMAS,
+)
+from services.data_loader import TABLES, _signature, data_dir, load_table
+from services.db import connect
+
+# "sqlite" routes dashboard metrics and anomaly rules through this store
+ERP_STORE = os.getenv("ERP_STORE", "pandas")
+ERP_DB_PATH = os.getenv("ERP_DB_PATH", "Data/erp.sqlite3")
+
+# Extra composite indexes that cover the dashboard's grouped queries
+COVERING_INDEXES = {
+    "matters": [
+        f'(lower("{MATTER_COLUMNS["status"]}"), "{MATTER_COLUMNS["attorney_id"]}", "complexity_score")',
+    ],
+}
+
+
+def erp_store_enabled():
+    return ERP_STORE == "sqlite"
+
+
+def _q(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _sql_time(ts):
+    # pandas.to_sql stores datetimes as ISO text, which sorts chronologically
+    return pd.Timestamp(ts).strftime("%Y-%m-%d %H:%M:%S")
+
+
+class ERPStore:
+    """
+    SQLite copy of the ERP CSVs with indexes on every id, status and date
+    column declared in config/schema.py. Each table is reloaded only when its
+    CSV changes, into a new table that is swapped in atomically; readers are
+    never blocked (WAL) and never see a half-loaded table.
+
+    Metrics and anomaly rules are single indexed queries, so their cost
+    follows the size of the answer rather than the size of the tables.
+    """
+
+    def __init__(self, path=ERP_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS _sources (name TEXT PRIMARY KEY, signature TEXT NOT NULL)"
+            )
+
+    def _connect(self):
+        return connect(self.path)
+
+    # ------------------ Loading ------------------
+    def sync(self):
+        """Reloads any table whose CSV changed since it was last loaded."""
+        with self._lock, self._connect() as conn:
+            loaded = dict(conn.execute("SELECT name, signature FROM _sources"))
+            for name in TABLES:
+                path = os.path.join(data_dir(), TABLE_SCHEMAS[name]["file"])
+                signature = repr(_signature(path))
+                if loaded.get(name) != signature:
+                    self._load(conn, name, signature)
+
+    def _load(self, conn, name, signature):
+        schema = TABLE_SCHEMAS[name]
+        staging = f"{name}__new"
+        load_table(name).to_sql(staging, conn, if_exists="replace", index=False, chunksize=50000)
+
+        columns = {row[1] for row in conn.execute(f"PRAGMA table_info({_q(staging)})")}
+        conn.execute("BEGIN")
+        conn.execute(f"DROP TABLE IF EXISTS {_q(name)}")
+        conn.execute(f"ALTER TABLE {_q(staging)} RENAME TO {_q(name)}")
+        for col in schema["ids"] + schema["dates"]:
+            if col in columns:
+                conn.execute(f"CREATE INDEX {_q(f'{name}__{col}')} ON {_q(name)} ({_q(col)})")
+        for col in schema["categories"]:
+            if col in columns:
+                conn.execute(
+                    f"CREATE INDEX {_q(f'{name}__{col}')} ON {_q(name)} (lower({_q(col)}))"
+                )
+        for i, expr in enumerate(COVERING_INDEXES.get(name, [])):
+            conn.execute(f"CREATE INDEX {_q(f'{name}__covering{i}')} ON {_q(name)} {expr}")
+        conn.execute("INSERT OR REPLACE INTO _sources VALUES (?, ?)", (name, signature))
+        conn.commit()
+        conn.execute("ANALYZE")
+
+    def query(self, sql, params=(), parse_dates=None):
+        with self._connect() as conn:
+            return pd.read_sql_query(sql, conn, params=params, parse_dates=parse_dates)
+
+    def scalar(self, sql, params=()):
+        with self._connect() as conn:
+            return conn.execute(sql, params).fetchone()[0]
+
+    # ------------------ Metrics ------------------
+    def count_status(self, table, status_col, value):
+        return self.scalar(
+            f"SELECT COUNT(*) FROM {_q(table)} WHERE lower({_q(status_col)}) = ?", (value,)
+        )
+
+    def dashboard_metrics(self, today=None):
+        """Same keys and frame shapes as analytics.compute_dashboard_metrics."""
+        self.sync()
+        today = _sql_time(today or pd.Timestamp.today())
+        matter_dates = TABLE_SCHEMAS["matters"]["dates"]
+        leave_dates = TABLE_SCHEMAS["leaves"]["dates"]
+        client_id = CLIENT_COLUMNS["id"]
+
+        metrics = {
+            "total_attorneys": self.scalar("SELECT COUNT(*) FROM attorneys"),
+            "active_clients": self.count_status("clients", CLIENT_COLUMNS["status"], "active"),
+            "open_matters": self.count_status("matters", MATTER_COLUMNS["status"], "active"),
+            "pending_leaves": self.count_status("leaves", LEAVE_COLUMNS["status"], "pending"),
+            "billing_anomalies": pd.DataFrame(),
+        }
+        created = _q(MATTER_COLUMNS["created"])
+        metrics["recent_matters"] = self.query(
+            f"SELECT * FROM matters WHERE {created} IS NOT NULL ORDER BY {created} DESC LIMIT 5",
+            parse_dates=matter_dates,
+        )
+        start = _q(LEAVE_COLUMNS["start"])
+        metrics["upcoming_leaves"] = self.query(
+            f"SELECT * FROM leaves WHERE {start} >= ? ORDER BY {start} LIMIT 5",
+            (today,),
+            parse_dates=leave_dates,
+        )
+        metrics["top_clients"] = self.query(
+            f"""
+            WITH top AS (
+                SELECT {_q(MATTER_COLUMNS["client_id"])} AS {_q(client_id)}, COUNT(*) AS matter_count
+                FROM matters GROUP BY 1 ORDER BY matter_count DESC LIMIT 5
+            )
+            SELECT top.*, c.* FROM top LEFT JOIN clients c USING ({_q(client_id)})
+            ORDER BY matter_count DESC
+            """
+        ).loc[:, lambda df: ~df.columns.duplicated()]
+        metrics["attorney_workload_anomalies"] = self.attorney_workload_anomalies()
+        return metrics
+
+    def attorney_workload_anomalies(self, quantile=0.9):
+        """Attorneys whose average active-matter complexity is above the 90th percentile."""
+        attorney_id = ATTORNEY_COLUMNS["id"]
+        workload = self.query(
+            f"""
+            SELECT {_q(MATTER_COLUMNS["attorney_id"])} AS {_q(attorney_id)},
+                   AVG(complexity_score) AS avg_complexity
+            FROM matters
+            WHERE lower({_q(MATTER_COLUMNS["status"])}) = 'active'
+            GROUP BY 1
+            """
+        )
+        # One row per attorney: the percentile itself is cheap in pandas
+        threshold = workload["avg_complexity"].quantile(quantile)
+        flagged = workload[workload["avg_complexity"] > threshold]
+        if flagged.empty:
+            return flagged
+        ids = flagged[attorney_id].tolist()
+        attorneys = self.query(
+            f"SELECT * FROM attorneys WHERE {_q(attorney_id)} IN ({','.join('?' * len(ids))})",
+            ids,
+        )
+        return flagged.merge(attorneys, on=attorney_id, how="left")
+
+    # ------------------ Anomaly rules ------------------
+    def detect_anomalies(self, now=None):
+        """
+        The rules of services/anomaly_detection, each as one indexed query,
+        with the same thresholds and boundaries (config/anomaly_rules.py).
+        """
+        self.sync()
+        params = rule_params(now)
+        matter_id = _q(MATTER_COLUMNS["id"])
+        closed, due = _q(MATTER_COLUMNS["closed"]), _q(MATTER_COLUMNS["due"])
+        client_id = CLIENT_COLUMNS["id"]
+
+        rows = []
+        for mid, days in self._rows(
+            f"""
+            SELECT {matter_id}, CAST(julianday({closed}) - julianday({due}) AS INTEGER)
+            FROM matters
+            WHERE {closed} IS NOT NULL AND {due} IS NOT NULL AND {closed} > {due}
+            """
+        ):
+            rows.append({
+                "type": "Matter Delay",
+                "id": mid,
+                "description": f"Matter {mid} closed later than estimated by {days} days.",
+            })
+        for (mid,) in self._rows(
+            f"""
+            SELECT {matter_id} FROM matters
+            WHERE {closed} IS NULL AND {_q(MATTER_COLUMNS["created"])} <= ?
+            """,
+            (_sql_time(params["stale_before"]),),
+        ):
+            rows.append({
+                "type": "Stale Open Matter",
+                "id": mid,
+                "description": f"Matter {mid} has been open for more than 1 year without closure.",
+            })
+        for leave_id, attorney_id, days in self._rows(
+            f"""
+            SELECT {_q(LEAVE_COLUMNS["id"])}, {_q(LEAVE_COLUMNS["attorney_id"])},
+                   CAST(julianday({_q(LEAVE_COLUMNS["end"])}) - julianday({_q(LEAVE_COLUMNS["start"])}) AS INTEGER) AS days
+            FROM leaves WHERE days > ?
+            """,
+            (params["max_leave_days"],),
+        ):
+            rows.append({
+                "type": "Extended Leave",
+                "id": leave_id,
+                "description": f"Attorney {attorney_id} took leave for {days} days.",
+            })
+        for (cid,) in self._rows(
+            f"""
+            SELECT c.{_q(client_id)} FROM clients c
+            WHERE lower(c.{_q(CLIENT_COLUMNS["status"])}) = 'active'
+              AND NOT EXISTS (
+                  SELECT 1 FROM matters m
+                  WHERE m.{_q(MATTER_COLUMNS["client_id"])} = c.{_q(client_id)}
+                    AND lower(m.{_q(MATTER_COLUMNS["status"])}) = 'active'
+              )
+            """
+        ):
+            rows.append({
+                "type": "Inactive Client",
+                "id": cid,
+                "description": f"Client {cid} is marked active but has no open matters.",
+            })
+        return rows
+
+    def _rows(self, sql, params=()):
+        with self._connect() as conn:
+            return conn.execute(sql, params).fetchall()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_erp_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ERPStore()
+    return _store
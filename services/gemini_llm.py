@@ -1,20 +1,70 @@
-import os
-import google.generativeai as genai
-from dotenv import load_dotenv
+import logging
 
-load_dotenv()
+from services.answer_cache import get_answer_cache
+from services.llm_gateway import get_gateway
 
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+GEMINI_MODEL = "gemini-2.0-flash"
+ERROR_PREFIX = "Error from Gemini API"
+CACHE_NAMESPACE = f"gemini:{GEMINI_MODEL}"
+
+logger = logging.getLogger(__name__)
+
+
+class ErrorMessage(str):
+    """An error shown in place of a response; callers display it but never keep it."""
+
+
+def error_message(error):
+    return ErrorMessage(f"{ERROR_PREFIX}: {error}")
+
+
+def is_error_response(text):
+    return isinstance(text, ErrorMessage)
 
 
 def query_gemini(prompt: str):
     """
     Sends a prompt to the Gemini API and returns the response.
+    Identical prompts are answered from the persistent answer cache.
+    Calls go through the LLM gateway; errors that survive its retries are
+    returned as a message for the UI.
     """
-    model = genai.GenerativeModel("gemini-2.0-flash")
+    cache = get_answer_cache()
+    cached = cache.get_exact(CACHE_NAMESPACE, prompt)
+    if cached is not None:
+        return cached
+
     try:
-        response = model.generate_content(prompt)
-        return response.text
+        answer = get_gateway().complete("gemini", prompt, model=GEMINI_MODEL)
     except Exception as e:
-        print(f"An error occurred: {e}")
-        return f"Error from Gemini API: {e}"
+        logger.exception("Gemini request failed")
+        return error_message(e)
+
+    cache.put(CACHE_NAMESPACE, prompt, answer)
+    return answer
+
+
+def query_gemini_stream(prompt: str):
+    """
+    Streaming variant of query_gemini: yields text as Gemini generates it.
+    The complete response is cached once the stream finishes; a cached
+    response is yielded in one piece. Errors are yielded as a final
+    ErrorMessage, after any partial text.
+    """
+    cache = get_answer_cache()
+    cached = cache.get_exact(CACHE_NAMESPACE, prompt)
+    if cached is not None:
+        yield cached
+        return
+
+    parts = []
+    try:
+        for chunk in get_gateway().stream("gemini", prompt, model=GEMINI_MODEL):
+            parts.append(chunk)
+            yield chunk
+    except Exception as e:
+        logger.exception("Gemini stream failed after %d chunks", len(parts))
+        yield ErrorMessage(f"\n\n{error_message(e)}") if parts else error_message(e)
+        return
+
+    cache.put(CACHE_NAMESPACE, prompt, "".join(parts))
@@ -0,0 +1,159 @@
+# services/leave_index.py
+
+import threading
+
+import numpy as np
+import pandas as pd
+
+from config.schema import ATTORNEY_COLUMNS, LEAVE_COLUMNS, MATTER_COLUMNS
+from services.data_loader import load_table, table_signature
+
+# Leaves with these statuses don't make an attorney unavailable
+NOT_TAKEN = ("rejected",)
+
+
+def _ns(ts):
+    return pd.Timestamp(ts).value
+
+
+class LeaveIndex:
+    """
+    Sorted interval index over leave periods, overall and per attorney.
+
+    Intervals are sorted by start date next to a running maximum of their end
+    dates ("reach"). For a window [lo, hi], a binary search on starts bounds
+    the intervals starting by hi and one on reach skips every interval that
+    ended before lo, so point, overlap and next-k queries cost O(log n) plus
+    the candidates in between. Dates are whole days: a leave covers its end
+    date.
+    """
+
+    def __init__(self, leaves):
+        self.leaves = leaves
+        start = pd.to_datetime(leaves[LEAVE_COLUMNS["start"]], errors="coerce")
+        end = pd.to_datetime(leaves[LEAVE_COLUMNS["end"]], errors="coerce").fillna(start)
+        valid = start.notna().to_numpy()
+        rows = np.flatnonzero(valid)
+        starts = start.to_numpy("datetime64[ns]").view(np.int64)[valid]
+        # Through the end of the end date
+        ends = end.to_numpy("datetime64[ns]").view(np.int64)[valid] + pd.Timedelta(days=1).value - 1
+        ends = np.maximum(ends, starts)
+        self._status = leaves[LEAVE_COLUMNS["status"]].astype(str).str.lower().to_numpy()
+
+        order = np.argsort(starts, kind="stable")
+        self._all = (starts[order], ends[order], np.maximum.accumulate(ends[order]), rows[order])
+
+        codes, attorneys = pd.factorize(leaves[LEAVE_COLUMNS["attorney_id"]].to_numpy()[valid])
+        order = np.lexsort((starts, codes))
+        reach = pd.Series(ends[order]).groupby(codes[order]).cummax().to_numpy()
+        self._by_attorney = (starts[order], ends[order], reach, rows[order])
+        self._bounds = np.searchsorted(codes[order], np.arange(len(attorneys) + 1))
+        self._attorneys = pd.Index(attorneys)
+
+    def __len__(self):
+        return len(self._all[0])
+
+    def _arrays(self, attorney_id):
+        if attorney_id is None:
+            return self._all
+        code = self._attorneys.get_indexer([attorney_id])[0]
+        if code < 0:
+            return tuple(a[:0] for a in self._all)
+        lo, hi = self._bounds[code], self._bounds[code + 1]
+        return tuple(a[lo:hi] for a in self._by_attorney)
+
+    def _overlap_rows(self, lo, hi, attorney_id, exclude):
+        starts, ends, reach, rows = self._arrays(attorney_id)
+        last = np.searchsorted(starts, hi, "right")
+        first = np.searchsorted(reach, lo, "left")
+        if first >= last:
+            return rows[:0]
+        found = rows[first:last][ends[first:last] >= lo]
+        if exclude:
+            found = found[~np.isin(self._status[found], exclude)]
+        return found
+
+    def _frame(self, rows):
+        return self.leaves.iloc[rows]
+
+    # ------------------ Queries ------------------
+    def on(self, when, attorney_id=None, exclude=NOT_TAKEN):
+        """Leaves covering the day `when`."""
+        day = pd.Timestamp(when).normalize()
+        return self._frame(self._overlap_rows(_ns(day), _ns(day + pd.Timedelta(days=1)) - 1, attorney_id, exclude))
+
+    def overlapping(self, start, end, attorney_id=None, exclude=NOT_TAKEN):
+        """Leaves overlapping any day from `start` to `end`, inclusive."""
+        lo = _ns(pd.Timestamp(start).normalize())
+        hi = _ns(pd.Timestamp(end).normalize() + pd.Timedelta(days=1)) - 1
+        return self._frame(self._overlap_rows(lo, hi, attorney_id, exclude))
+
+    def upcoming(self, k=5, after=None, attorney_id=None, exclude=()):
+        """The next k leaves starting at or after `after` (now by default), soonest first."""
+        starts, _, _, rows = self._arrays(attorney_id)
+        first = np.searchsorted(starts, _ns(after or pd.Timestamp.today()), "left")
+        found, step = rows[first:first + k], k
+        if exclude:
+            # Skip excluded statuses, widening the look-ahead until k are found
+            found = rows[:0]
+            while len(found) < k and first < len(rows):
+                batch = rows[first:first + step]
+                found = np.concatenate([found, batch[~np.isin(self._status[batch], exclude)]])
+                first, step = first + step, step * 2
+        return self._frame(found[:k])
+
+    def out_on(self, when, exclude=NOT_TAKEN):
+        """Ids of attorneys on leave on the day `when`."""
+        return set(self.on(when, exclude=exclude)[LEAVE_COLUMNS["attorney_id"]].tolist())
+
+    def is_available(self, attorney_id, start, end, exclude=NOT_TAKEN):
+        return self.overlapping(start, end, attorney_id, exclude).empty
+
+
+_index = None
+_index_signature = None
+_index_lock = threading.Lock()
+
+
+def get_leave_index():
+    """The shared index, rebuilt only when the leave CSV changes."""
+    global _index, _index_signature
+    signature = table_signature("leaves")
+    if _index is None or _index_signature != signature:
+        with _index_lock:
+            if _index is None or _index_signature != signature:
+                _index = LeaveIndex(load_table("leaves"))
+                _index_signature = signature
+    return _index
+
+
+# ------------------ Staffing ------------------
+def staffing_conflicts(start, end, matters=None, index=None):
+    """
+    Active matters whose attorney is on leave at some point from `start` to
+    `end`: one row per (matter, leave), with the leave's dates and status.
+    """
+    index = index if index is not None else get_leave_index()
+    matters = matters if matters is not None else load_table("matters")
+    away = index.overlapping(start, end)
+    if away.empty:
+        return pd.DataFrame()
+    attorney_id = MATTER_COLUMNS["attorney_id"]
+    active = matters[
+        (matters[MATTER_COLUMNS["status"]].str.lower() == "active").to_numpy()
+        & matters[attorney_id].isin(away[LEAVE_COLUMNS["attorney_id"]].unique()).to_numpy()
+    ]
+    leaves = away[[LEAVE_COLUMNS["attorney_id"], LEAVE_COLUMNS["id"], LEAVE_COLUMNS["start"],
+                   LEAVE_COLUMNS["end"], LEAVE_COLUMNS["status"]]]
+    return active[["matter_id", MATTER_COLUMNS["title"], MATTER_COLUMNS["client_id"], attorney_id]].merge(
+        leaves, left_on=attorney_id, right_on=LEAVE_COLUMNS["attorney_id"], how="inner"
+    )
+
+
+def available_attorneys(start, end, attorneys=None, index=None):
+    """Active attorneys with no leave from `start` to `end`, i.e. free to take a new matter."""
+    index = index if index is not None else get_leave_index()
+    attorneys = attorneys if attorneys is not None else load_table("attorneys")
+    away = index.overlapping(start, end)[LEAVE_COLUMNS["attorney_id"]].unique()
+    active = attorneys[ATTORNEY_COLUMNS["status"]].str.lower() == "active"
+    return attorneys[(active & ~attorneys[ATTORNEY_COLUMNS["id"]].isin(away)).to_numpy()]
@@ -1,20 +1,61 @@
 # services/legal_rag.py (Updated for new RAG with 100% online tools)
 
+import hashlib
+import json
 import os
-import numpy as np
-import requests
-from sentence_transformers import SentenceTransformer, util
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 import streamlit as st
+from services.answer_cache import get_answer_cache
+from services.embedding_service import get_embedding_service
+from services.llm_gateway import get_gateway
+from services.rag_store import open_store, read_meta, top_k_indices, write_store
 
-# Load free Hugging Face embedding model (MiniLM)
-@st.cache_resource(show_spinner="🔧 Loading embedding model...")
+# Free Hugging Face embedding model (MiniLM), shared with every other module
 def get_embedder():
-    return SentenceTransformer("all-MiniLM-L6-v2")
+    return get_embedding_service()
+
+# On-disk index location and element type ("float32", "float16" or "int8")
+INDEX_DIR = "Data/legal_rag_index"
+QUANTIZATION = os.getenv("LEGAL_RAG_QUANTIZATION", "float16")
+CACHE_NAMESPACE = "legal_rag"
+
+
+def _source_fingerprint(folder, files, quantization):
+    files_meta = {}
+    for file in sorted(files):
+        stat = os.stat(os.path.join(folder, file))
+        files_meta[file] = [stat.st_size, stat.st_mtime_ns]
+    return {
+        "model": get_embedder().model_name,
+        "chunk_size": 512,
+        "chunk_overlap": 100,
+        "quantization": quantization,
+        "files": files_meta,
+    }
+
+
+def _is_current(meta, fingerprint):
+    return meta is not None and all(meta.get(k) == v for k, v in fingerprint.items())
+
+
+def index_version(index_dir=INDEX_DIR):
+    """Short hash of the store's meta.json; changes whenever the index is rebuilt."""
+    meta = read_meta(index_dir)
+    if meta is None:
+        return ""
+    return hashlib.sha1(json.dumps(meta, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
 
 # Chunk all documents and store vectors
 @st.cache_resource(show_spinner="🧠 Indexing legal documents...")
-def prepare_rag_index(folder="Data/legal_acts_cleaned_texts"):
+def prepare_rag_index(
+    folder="Data/legal_acts_cleaned_texts", index_dir=INDEX_DIR, quantization=QUANTIZATION
+):
+    """
+    Returns (chunks, titles, chunk_embeddings) backed by memory-mapped files in
+    `index_dir`. The .txt files are only re-chunked and re-embedded when one of
+    them changed; otherwise startup just maps the existing store.
+    """
     splitter = RecursiveCharacterTextSplitter(chunk_size=512, chunk_overlap=100)
     chunks, titles = [], []
 
@@ -27,6 +68,10 @@ def prepare_rag_index(folder="Data/legal_acts_cleaned_texts"):
         st.warning("⚠️ No .txt files found.")
         return [], [], None
 
+    fingerprint = _source_fingerprint(folder, files, quantization)
+    if _is_current(read_meta(index_dir), fingerprint):
+        return open_store(index_dir)
+
     for file in files:
         file_path = os.path.join(folder, file)
         with open(file_path, "r", encoding="utf-8") as f:
@@ -48,49 +93,40 @@ def prepare_rag_index(folder="Data/legal_acts_cleaned_texts"):
         return [], [], None
 
     embedder = get_embedder()
-    chunk_embeddings = embedder.encode(chunks, convert_to_tensor=True, show_progress_bar=True)
+    chunk_embeddings = embedder.encode(chunks, show_progress_bar=True)
 
-    return chunks, titles, chunk_embeddings
+    write_store(index_dir, fingerprint, chunks, titles, chunk_embeddings, quantization)
+    return open_store(index_dir)
 
 
 # Retrieve top-matching chunks by cosine similarity
 def retrieve_top_chunks(query, chunks, titles, chunk_embeddings, top_k=3):
+    if chunk_embeddings is None or len(chunk_embeddings) == 0:
+        return []
+
     embedder = get_embedder()
-    query_embedding = embedder.encode(query, convert_to_tensor=True)
-    similarities = util.pytorch_cos_sim(query_embedding, chunk_embeddings)[0]
+    query_embedding = embedder.embed_query(query)
+    top_indices = retrieve_top_indices(query_embedding, chunk_embeddings, top_k)
+    return [(titles[i], chunks[i]) for i in top_indices]
 
-    if similarities is None or similarities.shape[0] == 0:
-        return []
 
-    # Convert to numpy for safe slicing
-    similarities = similarities.cpu().numpy().flatten()
-    top_k = min(top_k, len(similarities))
-    if top_k == 0:
-        return []
+def retrieve_top_indices(query_embedding, chunk_embeddings, top_k=3):
+    similarities = chunk_embeddings.similarities(query_embedding)
 
-    top_indices = np.argsort(similarities)[-top_k:][::-1]
-    return [(titles[i], chunks[i]) for i in top_indices]
+    # Partial selection: only the top_k candidates are ever sorted
+    return top_k_indices(similarities, top_k)
 
 
 
-# Free Together.ai LLM call (Mistral-7B)
+# Free Together.ai LLM call (Mistral-7B), through the pooled LLM gateway
 def query_llm(prompt, model="mistral-7b-instruct"):
-    url = "https://api.together.xyz/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {os.getenv('TOGETHER_API_KEY')}",
-        "Content-Type": "application/json"
-    }
-    body = {
-        "model": model,
-        "messages": [
-            {"role": "system", "content": "You are a legal expert on Indian laws."},
-            {"role": "user", "content": prompt}
-        ],
-        "temperature": 0.4
-    }
-    res = requests.post(url, headers=headers, json=body)
-    res.raise_for_status()
-    return res.json()["choices"][0]["message"]["content"]
+    return get_gateway().complete(
+        "together",
+        prompt,
+        model=model,
+        system="You are a legal expert on Indian laws.",
+        temperature=0.4,
+    )
 
 # Main RAG entry point for Legal Act Explorer
 def answer_query_with_rag(query):
@@ -99,13 +135,29 @@ def answer_query_with_rag(query):
     if not chunks or chunk_embeddings is None:
         return "⚠️ No valid documents to search. Please check your .txt files."
 
-    top_docs = retrieve_top_chunks(query, chunks, titles, chunk_embeddings)
+    # Answers are only reused against the index they were generated from
+    cache = get_answer_cache()
+    version = index_version()
+    cache.invalidate(CACHE_NAMESPACE, keep_version=version)
 
-    if not top_docs:
+    cached = cache.get_exact(CACHE_NAMESPACE, query, version)
+    if cached is not None:
+        return cached
+
+    query_embedding = get_embedder().embed_query(query)
+    top_indices = [int(i) for i in retrieve_top_indices(query_embedding, chunk_embeddings)]
+
+    if not top_indices:
         return "⚠️ No relevant legal content found for this query."
 
+    cached = cache.get_similar(CACHE_NAMESPACE, query_embedding, top_indices, version)
+    if cached is not None:
+        return cached
+
+    top_docs = [(titles[i], chunks[i]) for i in top_indices]
     context = "\n\n".join([f"From [{title}]:\n{chunk[:1000]}..." for title, chunk in top_docs])
     prompt = f"Use the following Indian legal documents to answer the question clearly:\n\n{context}\n\nQuestion: {query}\n\nAnswer:"
-    return query_llm(prompt)
-
+    answer = query_llm(prompt)
 
+    cache.put(CACHE_NAMESPACE, query, answer, version, query_embedding, top_indices)
+    return answer
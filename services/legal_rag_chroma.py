@@ -1,9 +1,13 @@
 # Filename: services/legal_rag_chroma.py
 
 import os
+import io
+import json
+import hashlib
+import threading
+from functools import lru_cache
 import pandas as pd
 import numpy as np
-from sentence_transformers import SentenceTransformer
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 
 try:
@@ -15,7 +19,10 @@ except ImportError:
 
 # Load correct Chroma client
 from chromadb import PersistentClient
-from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
+
+from services.embedding_service import get_embedding_service
+from services.bm25_index import BM25Index, reciprocal_rank_fusion, section_tokens
+from services.section_index import SectionIndex
 
 # Detect if running on Streamlit Cloud
 is_cloud = os.getenv("IS_STREAMLIT_CLOUD", "false").lower() == "true"
@@ -24,8 +31,28 @@ is_cloud = os.getenv("IS_STREAMLIT_CLOUD", "false").lower() == "true"
 CHROMA_DB_DIR = None if is_cloud else "./chroma_db"
 COLLECTION_NAME = "legal_acts"
 
-# Embedder
-embedder = SentenceTransformer("all-MiniLM-L6-v2")
+# Content-hash manifest lives next to chroma_db/ so warm restarts can skip unchanged acts
+MANIFEST_PATH = (
+    os.path.join(os.path.dirname(CHROMA_DB_DIR), "chroma_manifest.json")
+    if CHROMA_DB_DIR
+    else None
+)
+# Lexical (BM25) index over the same chunk ids, persisted beside the manifest
+BM25_INDEX_PATH = (
+    os.path.join(os.path.dirname(CHROMA_DB_DIR), "bm25_index.pkl")
+    if CHROMA_DB_DIR
+    else None
+)
+# (act, section number) lookup used to answer section citations directly
+SECTION_INDEX_PATH = (
+    os.path.join(os.path.dirname(CHROMA_DB_DIR), "section_index.pkl")
+    if CHROMA_DB_DIR
+    else None
+)
+
+# Embedder: the process-wide MiniLM instance. Embeddings are always passed to
+# Chroma explicitly so it never loads a model of its own.
+embedder = get_embedding_service()
 
 
 # Create Chroma client (new API)
@@ -41,110 +68,448 @@ if use_cache:
 else:
     chroma_client = create_chroma_client()
 
+# The client's telemetry batching races when sessions query concurrently, so
+# reads from the query path are serialized. Embedding and BM25 stay outside it.
+_read_lock = threading.Lock()
+# Held while the lexical index is loaded or rebuilt, so concurrent sessions
+# that find it stale wait for one rebuild instead of each running their own
+_bm25_lock = threading.Lock()
 
-def chunk_text(text, chunk_size=500, chunk_overlap=50):
-    splitter = RecursiveCharacterTextSplitter(
+
+@lru_cache(maxsize=8)
+def get_splitter(chunk_size=500, chunk_overlap=50):
+    return RecursiveCharacterTextSplitter(
         chunk_size=chunk_size, chunk_overlap=chunk_overlap
     )
-    return splitter.split_text(text)
+
+
+def chunk_text(text, chunk_size=500, chunk_overlap=50):
+    return get_splitter(chunk_size, chunk_overlap).split_text(text)
+
+
+def _load_manifest():
+    if not os.path.exists(MANIFEST_PATH):
+        return {"collection": COLLECTION_NAME, "files": {}}
+    with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("collection") != COLLECTION_NAME:
+        return {"collection": COLLECTION_NAME, "files": {}}
+    return manifest
+
+
+def _save_manifest(manifest):
+    # The revision lets the BM25 index tell whether it saw the latest changes
+    manifest["revision"] = manifest.get("revision", 0) + 1
+    # Write to a temp file first so a crash never leaves a half-written manifest
+    tmp_path = f"{MANIFEST_PATH}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, MANIFEST_PATH)
+
+
+def _hash(*parts):
+    return hashlib.sha1("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+def _chunk_ids(file, section_key, n_chunks, start=0):
+    return [f"{file}_{section_key}_{j}" for j in range(start, n_chunks)]
+
+
+def _iter_sections(df, file, seen=None):
+    """
+    Yields (section_key, content_hash, text, metadata) for every row of an act CSV.
+    The key identifies a section independently of its row position, so inserting
+    or reordering rows does not invalidate the sections around it. Pass the same
+    `seen` dict when a file is read in several chunks.
+    """
+    section_number_column = "section_number" if "section_number" in df.columns else None
+    seen = {} if seen is None else seen
+
+    for row in df.itertuples(index=False):
+        row = row._asdict()
+        text = str(row["section_text"])
+        act_title = str(row["title"])
+        section_name = str(row["section_name"])
+        section_number = (
+            str(row[section_number_column]) if section_number_column else "N/A"
+        )
+
+        identity = _hash(act_title, section_number, section_name)
+        occurrence = seen.get(identity, 0)
+        seen[identity] = occurrence + 1
+        section_key = f"{identity[:16]}-{occurrence}"
+
+        metadata = {
+            "source": file,
+            "act_title": act_title,
+            "section_name": section_name,
+            "section_number": section_number,
+        }
+        yield section_key, _hash(text, act_title, section_name, section_number), text, metadata
+
+
+def _delete_ids(collection, ids, batch_size):
+    for i in range(0, len(ids), batch_size):
+        collection.delete(ids=ids[i : i + batch_size])
+    for doc_id in ids:
+        _bm25.remove(doc_id)
+
+
+def _delete_source(collection, file):
+    collection.delete(where={"source": file})
+    _bm25.remove_source(file)
+
+
+def _index_lexical(ids, documents, metadatas):
+    for doc_id, doc, meta in zip(ids, documents, metadatas):
+        tokens = section_tokens(
+            doc, meta["act_title"], meta["section_name"], meta["section_number"]
+        )
+        _bm25.add(doc_id, tokens, source=meta["source"])
+
+
+_bm25 = BM25Index()
+_sections = SectionIndex()
+
+
+def _rebuild_bm25(collection, page_size=5000):
+    index = BM25Index()
+    offset = 0
+    while True:
+        with _read_lock:
+            page = collection.get(
+                include=["documents", "metadatas"], limit=page_size, offset=offset
+            )
+        if not page["ids"]:
+            break
+        for doc_id, doc, meta in zip(page["ids"], page["documents"], page["metadatas"]):
+            tokens = section_tokens(
+                doc, meta["act_title"], meta["section_name"], meta["section_number"]
+            )
+            index.add(doc_id, tokens, source=meta["source"])
+        offset += len(page["ids"])
+    return index
+
+
+_manifest_revision_cache = (None, None)
+
+
+def _manifest_revision():
+    # Keyed by mtime so the hot query path never re-parses a large manifest
+    global _manifest_revision_cache
+    if not os.path.exists(MANIFEST_PATH):
+        return None
+    mtime_ns = os.stat(MANIFEST_PATH).st_mtime_ns
+    if _manifest_revision_cache[0] != mtime_ns:
+        _manifest_revision_cache = (mtime_ns, _load_manifest().get("revision"))
+    return _manifest_revision_cache[1]
+
+
+def _save_side_indexes(manifest):
+    for index, path in ((_bm25, BM25_INDEX_PATH), (_sections, SECTION_INDEX_PATH)):
+        if index.revision != manifest.get("revision"):
+            index.revision = manifest.get("revision")
+            index.save(path)
+
+
+def get_bm25_index(collection=None):
+    """
+    Returns the lexical index for the current manifest revision, loading it from
+    disk or rebuilding it from the Chroma collection when it is missing or stale.
+    """
+    global _bm25
+    revision = _manifest_revision()
+    if _bm25.revision is not None and _bm25.revision == revision:
+        return _bm25
+
+    with _bm25_lock:
+        # Another session may have loaded or rebuilt it while we waited
+        if _bm25.revision is not None and _bm25.revision == revision:
+            return _bm25
+
+        if BM25_INDEX_PATH and os.path.exists(BM25_INDEX_PATH):
+            loaded = BM25Index.load(BM25_INDEX_PATH)
+            if loaded.revision == revision:
+                _bm25 = loaded
+                return _bm25
+
+        collection = collection or chroma_client.get_collection(name=COLLECTION_NAME)
+        index = _rebuild_bm25(collection)
+        index.revision = revision
+        index.save(BM25_INDEX_PATH)
+        _bm25 = index
+        return _bm25
+
+
+def get_section_index(folder_path=None):
+    """
+    Returns the section lookup for the current manifest revision. A missing or
+    stale index is rebuilt from the CSVs in `folder_path`, or None is returned
+    when no folder is given so callers fall back to retrieval.
+    """
+    global _sections
+    revision = _manifest_revision()
+    if _sections.revision is not None and _sections.revision == revision:
+        return _sections
+
+    if SECTION_INDEX_PATH and os.path.exists(SECTION_INDEX_PATH):
+        loaded = SectionIndex.load(SECTION_INDEX_PATH)
+        if loaded.revision == revision:
+            _sections = loaded
+            return _sections
+
+    if folder_path is None:
+        return None
+
+    _sections = SectionIndex()
+    for file in sorted(os.listdir(folder_path)):
+        if not file.endswith(".csv"):
+            continue
+        file_path = os.path.join(folder_path, file)
+        header = pd.read_csv(file_path, nrows=0).columns
+        if all(col in header for col in ["section_text", "title", "section_name"]):
+            for rows in pd.read_csv(file_path, chunksize=5000):
+                _sections.add_rows(file, rows)
+    _sections.revision = revision
+    _sections.save(SECTION_INDEX_PATH)
+    return _sections
+
+
+def _index_file(collection, file, data, previous, batch_size, stats):
+    """
+    Diffs one CSV against its manifest entry and applies only the changes.
+    Returns the new per-section manifest entries, or None if the file is unusable.
+    """
+    df = pd.read_csv(io.BytesIO(data))
+
+    required_columns = ["section_text", "title", "section_name"]
+    if df.empty or any(col not in df.columns for col in required_columns):
+        return None
+
+    old_sections = previous["sections"] if previous else {}
+    new_sections = {}
+    stale_ids, all_chunks, all_metadatas, all_ids = [], [], [], []
+
+    for section_key, content_hash, text, metadata in _iter_sections(df, file):
+        old = old_sections.get(section_key)
+        if old and old["hash"] == content_hash:
+            new_sections[section_key] = old
+            continue
+
+        chunks = chunk_text(text)
+        new_sections[section_key] = {"hash": content_hash, "chunks": len(chunks)}
+        if old:
+            stats["updated"] += 1
+            stale_ids.extend(_chunk_ids(file, section_key, old["chunks"], len(chunks)))
+        else:
+            stats["added"] += 1
+
+        for j, chunk in enumerate(chunks):
+            all_chunks.append(chunk)
+            all_metadatas.append(metadata)
+            all_ids.append(f"{file}_{section_key}_{j}")
+
+    for section_key, old in old_sections.items():
+        if section_key not in new_sections:
+            stats["deleted"] += 1
+            stale_ids.extend(_chunk_ids(file, section_key, old["chunks"]))
+
+    if previous is None:
+        # No manifest entry: clear anything indexed for this file by older, row-numbered ids
+        _delete_source(collection, file)
+
+    _delete_ids(collection, stale_ids, batch_size)
+
+    for i in range(0, len(all_chunks), batch_size):
+        batch_chunks = all_chunks[i : i + batch_size]
+        collection.upsert(
+            documents=batch_chunks,
+            embeddings=embedder.encode(batch_chunks),
+            metadatas=all_metadatas[i : i + batch_size],
+            ids=all_ids[i : i + batch_size],
+        )
+    _index_lexical(all_ids, all_chunks, all_metadatas)
+
+    _sections.remove_file(file)
+    _sections.add_rows(file, df)
+    return new_sections
 
 
 def prepare_rag_index(folder_path="Data/actmetadata", batch_size=5000):
+    """
+    Brings the Chroma collection in line with the act CSVs in `folder_path`.
+
+    A manifest of per-file and per-section content hashes is kept next to
+    `chroma_db/`. Unchanged files are skipped on their size and mtime alone,
+    changed sections are re-chunked and upserted, and chunks whose source rows
+    disappeared are deleted. The BM25 index is kept in step with the same
+    chunk ids. Returns counts of what was touched.
+    """
+    global _bm25, _sections
     if not os.path.exists(folder_path):
         raise FileNotFoundError(f"❌ Folder not found: {folder_path}")
 
     existing_collections = [col.name for col in chroma_client.list_collections()]
     if COLLECTION_NAME in existing_collections:
         collection = chroma_client.get_collection(name=COLLECTION_NAME)
+        manifest = _load_manifest()
     else:
         collection = chroma_client.create_collection(
-            name=COLLECTION_NAME,
-            embedding_function=SentenceTransformerEmbeddingFunction(
-                model_name="all-MiniLM-L6-v2"
-            ),
+            name=COLLECTION_NAME, embedding_function=None
         )
+        # A fresh collection makes any previous manifest or lexical index meaningless
+        manifest = {
+            "collection": COLLECTION_NAME,
+            "files": {},
+            "revision": _load_manifest().get("revision", 0),
+        }
+        _bm25 = BM25Index()
+        _sections = SectionIndex()
 
-    for file in os.listdir(folder_path):
-        if file.endswith(".csv"):
-            file_path = os.path.join(folder_path, file)
-            df = pd.read_csv(file_path)
-            if df.empty:
+    if COLLECTION_NAME in existing_collections:
+        # Load the side indexes as of the last completed run before applying changes
+        get_bm25_index(collection)
+        get_section_index(folder_path)
+
+    stats = {"added": 0, "updated": 0, "deleted": 0, "skipped_files": 0}
+    files = manifest["files"]
+    present = set()
+
+    for file in sorted(os.listdir(folder_path)):
+        if not file.endswith(".csv"):
+            continue
+        present.add(file)
+        file_path = os.path.join(folder_path, file)
+        stat = os.stat(file_path)
+        previous = files.get(file)
+
+        if (
+            previous
+            and previous["size"] == stat.st_size
+            and previous["mtime_ns"] == stat.st_mtime_ns
+        ):
+            stats["skipped_files"] += 1
+            continue
+
+        with open(file_path, "rb") as f:
+            data = f.read()
+        file_hash = hashlib.sha256(data).hexdigest()
+
+        if previous and previous["sha256"] == file_hash:
+            # Touched but not modified: just refresh the stat signature
+            previous.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+            stats["skipped_files"] += 1
+        else:
+            sections = _index_file(collection, file, data, previous, batch_size, stats)
+            if sections is None:
+                if previous:
+                    _delete_source(collection, file)
+                _sections.remove_file(file)
+                files.pop(file, None)
                 continue
+            files[file] = {
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "sha256": file_hash,
+                "sections": sections,
+            }
+        _save_manifest(manifest)
+
+    removed = [f for f in files if f not in present]
+    for file in removed:
+        # Source CSV was removed: drop every chunk that came from it
+        stats["deleted"] += len(files[file]["sections"])
+        _delete_source(collection, file)
+        _sections.remove_file(file)
+        del files[file]
+
+    if removed or not os.path.exists(MANIFEST_PATH):
+        _save_manifest(manifest)
+    _save_side_indexes(manifest)
+    return stats
+
+
+def render_results(documents, metadatas):
+    response = ""
+    for doc, meta in zip(documents, metadatas):
+        act_title = meta.get("act_title", "Unknown Act")
+        section_number = meta.get("section_number", "N/A")
+        section_name = meta.get("section_name", "Unnamed Section")
 
-            required_columns = ["section_text", "title", "section_name"]
-            if any(col not in df.columns for col in required_columns):
-                continue
+        response += f"""<div style="border: 1px solid #ccc; padding: 16px; border-radius: 8px; margin-bottom: 12px;">
+            <h4 style="color:#003366;">📘 {act_title} — Section {section_number}: {section_name}</h4>
+            <p style="color:#333; font-size: 15px; line-height: 1.6;">{doc}</p>
+        </div>"""
+    return response
 
-            text_column = "section_text"
-            act_title_column = "title"
-            section_name_column = "section_name"
-            section_number_column = (
-                "section_number" if "section_number" in df.columns else None
-            )
 
-            all_chunks, all_metadatas, all_ids = [], [], []
-
-            for i, row in df.iterrows():
-                text = str(row[text_column])
-                act_title = str(row[act_title_column])
-                section_name = str(row[section_name_column])
-                section_number = (
-                    str(row[section_number_column]) if section_number_column else "N/A"
-                )
-
-                chunks = chunk_text(text)
-                for j, chunk in enumerate(chunks):
-                    all_chunks.append(chunk)
-                    all_metadatas.append(
-                        {
-                            "source": file,
-                            "act_title": act_title,
-                            "section_name": section_name,
-                            "section_number": section_number,
-                        }
-                    )
-                    all_ids.append(f"{file}_{i}_{j}")
-
-            for i in range(0, len(all_chunks), batch_size):
-                batch_chunks = all_chunks[i : i + batch_size]
-                batch_metadatas = all_metadatas[i : i + batch_size]
-                batch_ids = all_ids[i : i + batch_size]
-
-                collection.add(
-                    documents=batch_chunks,
-                    metadatas=batch_metadatas,
-                    ids=batch_ids,
-                )
+def hybrid_search(collection, query, top_k=3, candidates=20):
+    """
+    Fuses BM25 and vector rankings by reciprocal rank.
+    Returns (ids, documents, metadatas) for the best `top_k` chunks.
+    """
+    n_candidates = max(candidates, top_k)
+    query_embedding = embedder.embed_query(query)
+    with _read_lock:
+        results = collection.query(
+            query_embeddings=[query_embedding], n_results=n_candidates
+        )
+    vector_ids = results.get("ids", [[]])[0]
+    found = {
+        doc_id: (doc, meta)
+        for doc_id, doc, meta in zip(
+            vector_ids,
+            results.get("documents", [[]])[0],
+            results.get("metadatas", [[]])[0],
+        )
+    }
+
+    lexical_ids = [
+        doc_id for doc_id, _ in get_bm25_index(collection).search(query, n_candidates)
+    ]
+    fused = reciprocal_rank_fusion([lexical_ids, vector_ids])[:top_k]
+
+    missing = [doc_id for doc_id in fused if doc_id not in found]
+    if missing:
+        with _read_lock:
+            extra = collection.get(ids=missing, include=["documents", "metadatas"])
+        for doc_id, doc, meta in zip(extra["ids"], extra["documents"], extra["metadatas"]):
+            found[doc_id] = (doc, meta)
+
+    fused = [doc_id for doc_id in fused if doc_id in found]
+    return (
+        fused,
+        [found[doc_id][0] for doc_id in fused],
+        [found[doc_id][1] for doc_id in fused],
+    )
 
 
-def answer_query_with_rag(query, top_k=3):
+def search(query, top_k=3):
+    """
+    Returns (documents, metadatas) for `query`: cited sections straight from the
+    lookup index, otherwise the hybrid BM25 + vector ranking.
+    """
     if COLLECTION_NAME not in [col.name for col in chroma_client.list_collections()]:
         raise ValueError("RAG index not prepared. Run `prepare_rag_index()` first.")
 
-    collection = chroma_client.get_collection(
-        name=COLLECTION_NAME,
-        embedding_function=SentenceTransformerEmbeddingFunction(
-            model_name="all-MiniLM-L6-v2"
-        ),
-    )
+    # Section citations ("section 302 IPC", "s. 420") are answered straight from
+    # the lookup index; only free-text questions reach embedding and ANN search
+    section_index = get_section_index()
+    cited = section_index.find(query) if section_index is not None else []
+    if cited:
+        cited = cited[:top_k]
+        return [entry["section_text"] for entry in cited], cited
 
-    results = collection.query(query_texts=[query], n_results=top_k)
+    collection = chroma_client.get_collection(name=COLLECTION_NAME)
 
-    documents = results.get("documents", [[]])[0]
-    metadatas = results.get("metadatas", [[]])[0]
+    _, documents, metadatas = hybrid_search(collection, query, top_k=top_k)
+    return documents, metadatas
 
-    if not documents:
-        return "⚠️ No matching documents found."
 
-    response = ""
-    for doc, meta in zip(documents, metadatas):
-        act_title = meta.get("act_title", "Unknown Act")
-        section_number = meta.get("section_number", "N/A")
-        section_name = meta.get("section_name", "Unnamed Section")
+def answer_query_with_rag(query, top_k=3):
+    documents, metadatas = search(query, top_k=top_k)
 
-        response += f"""<div style="border: 1px solid #ccc; padding: 16px; border-radius: 8px; margin-bottom: 12px;">
-            <h4 style="color:#003366;">📘 {act_title} — Section {section_number}: {section_name}</h4>
-            <p style="color:#333; font-size: 15px; line-height: 1.6;">{doc}</p>
-        </div>"""
+    if not documents:
+        return "⚠️ No matching documents found."
 
-    return response
+    return render_results(documents, metadatas)
@@ -0,0 +1,382 @@
+# services/llm_gateway.py
+
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future
+
+import requests
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+
+load_dotenv()
+
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+
+# Per-provider defaults; each can be overridden with <NAME>_MAX_CONCURRENCY and
+# <NAME>_REQUESTS_PER_MINUTE (0 disables rate limiting).
+PROVIDER_LIMITS = {
+    "gemini": {"concurrency": 4, "requests_per_minute": 60},
+    "together": {"concurrency": 4, "requests_per_minute": 60},
+    "ollama": {"concurrency": 1, "requests_per_minute": 0},
+    "stub": {"concurrency": 8, "requests_per_minute": 0},
+}
+
+
+class LLMError(Exception):
+    def __init__(self, message, retryable=False, retry_after=None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+def _status_of(exc):
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    if status is None:
+        status = getattr(exc, "code", None)
+    try:
+        return int(status)
+    except (TypeError, ValueError):
+        return None
+
+
+def _retry_after_of(exc):
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(exc):
+    if isinstance(exc, LLMError):
+        return exc.retryable
+    if isinstance(exc, (requests.ConnectionError, requests.Timeout, TimeoutError)):
+        return True
+    return _status_of(exc) in RETRYABLE_STATUS
+
+
+class TokenBucket:
+    """Blocking token bucket: `rate` tokens per second, bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+# ------------------ Providers ------------------
+class Provider:
+    """A chat-completion backend. Subclasses implement `complete` and may override `stream`."""
+
+    name = None
+    default_model = None
+
+    def __init__(self, concurrency=None, requests_per_minute=None):
+        limits = PROVIDER_LIMITS.get(self.name, {"concurrency": 4, "requests_per_minute": 0})
+        prefix = self.name.upper()
+        if concurrency is None:
+            concurrency = int(os.getenv(f"{prefix}_MAX_CONCURRENCY", limits["concurrency"]))
+        if requests_per_minute is None:
+            requests_per_minute = float(
+                os.getenv(f"{prefix}_REQUESTS_PER_MINUTE", limits["requests_per_minute"])
+            )
+        self.concurrency = concurrency
+        self.semaphore = threading.BoundedSemaphore(concurrency)
+        self.bucket = (
+            TokenBucket(requests_per_minute / 60.0, concurrency) if requests_per_minute else None
+        )
+
+    def complete(self, prompt, model, system=None, **options):
+        raise NotImplementedError
+
+    def stream(self, prompt, model, system=None, **options):
+        yield self.complete(prompt, model, system=system, **options)
+
+
+class GeminiProvider(Provider):
+    name = "gemini"
+    default_model = "gemini-2.0-flash"
+
+    def __init__(self, **limits):
+        super().__init__(**limits)
+        import google.generativeai as genai
+
+        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+        self._genai = genai
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def _model(self, model, system):
+        key = (model, system)
+        with self._lock:
+            if key not in self._models:
+                self._models[key] = self._genai.GenerativeModel(model, system_instruction=system)
+            return self._models[key]
+
+    def complete(self, prompt, model, system=None, **options):
+        response = self._model(model, system).generate_content(
+            prompt, generation_config=options or None
+        )
+        return response.text
+
+    def stream(self, prompt, model, system=None, **options):
+        response = self._model(model, system).generate_content(
+            prompt, generation_config=options or None, stream=True
+        )
+        for chunk in response:
+            if chunk.parts:
+                yield chunk.text
+
+
+class TogetherProvider(Provider):
+    name = "together"
+    default_model = "mistral-7b-instruct"
+    url = "https://api.together.xyz/v1/chat/completions"
+
+    def __init__(self, timeout=(5, 120), **limits):
+        super().__init__(**limits)
+        self.timeout = timeout
+        # Keep-alive pool sized to the concurrency limit
+        self.session = requests.Session()
+        self.session.mount(
+            "https://", HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency)
+        )
+        self.session.headers.update(
+            {
+                "Authorization": f"Bearer {os.getenv('TOGETHER_API_KEY')}",
+                "Content-Type": "application/json",
+            }
+        )
+
+    def complete(self, prompt, model, system=None, **options):
+        messages = [{"role": "system", "content": system}] if system else []
+        messages.append({"role": "user", "content": prompt})
+        res = self.session.post(
+            self.url, json={"model": model, "messages": messages, **options}, timeout=self.timeout
+        )
+        res.raise_for_status()
+        return res.json()["choices"][0]["message"]["content"]
+
+
+class OllamaProvider(Provider):
+    name = "ollama"
+    default_model = "mistral"
+
+    def __init__(self, host=None, timeout=300, **limits):
+        super().__init__(**limits)
+        import ollama
+
+        self.client = ollama.Client(host=host or os.getenv("OLLAMA_HOST"), timeout=timeout)
+
+    def _messages(self, prompt, system):
+        messages = [{"role": "system", "content": system}] if system else []
+        messages.append({"role": "user", "content": prompt})
+        return messages
+
+    def complete(self, prompt, model, system=None, **options):
+        response = self.client.chat(
+            model=model, messages=self._messages(prompt, system), options=options or None
+        )
+        return response["message"]["content"]
+
+    def stream(self, prompt, model, system=None, **options):
+        for part in self.client.chat(
+            model=model, messages=self._messages(prompt, system), options=options or None, stream=True
+        ):
+            yield part["message"]["content"]
+
+
+class StubProvider(Provider):
+    """
+    Offline provider for tests and demos. Answers deterministically after
+    `latency` seconds; the first `fail_times` calls raise a retryable 429.
+    """
+
+    name = "stub"
+    default_model = "stub"
+
+    def __init__(self, latency=0.0, fail_times=0, **limits):
+        super().__init__(**limits)
+        self.latency = latency
+        self.fail_times = fail_times
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def complete(self, prompt, model, system=None, **options):
+        with self._lock:
+            self.calls += 1
+            fail = self.calls <= self.fail_times
+        time.sleep(self.latency)
+        if fail:
+            raise LLMError("stub 429: rate limited", retryable=True)
+        digest = hashlib.sha1(prompt.encode("utf-8")).hexdigest()[:8]
+        return f"Stub answer {digest} ({len(prompt)} chars)."
+
+    def stream(self, prompt, model, system=None, **options):
+        for word in self.complete(prompt, model, system, **options).split(" "):
+            yield word + " "
+
+
+PROVIDERS = {
+    "gemini": GeminiProvider,
+    "together": TogetherProvider,
+    "ollama": OllamaProvider,
+    "stub": StubProvider,
+}
+
+
+# ------------------ Gateway ------------------
+class LLMGateway:
+    """
+    Single entry point for every LLM call in the app.
+
+    - provider clients are built once and reused (keep-alive pools, cached models);
+    - each provider has a concurrency limit and a token-bucket rate limit;
+    - retryable failures (429, 5xx, timeouts) back off with full jitter,
+      honouring Retry-After when the provider sends it;
+    - identical prompts already in flight share one upstream call.
+
+    Set LLM_GATEWAY_PROVIDER=stub to route every call to the offline stub.
+    """
+
+    def __init__(self, max_retries=3, base_delay=0.5, max_delay=8.0, override=None):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.override = override if override is not None else os.getenv("LLM_GATEWAY_PROVIDER")
+        self._providers = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "coalesced": 0, "retries": 0, "failures": 0}
+
+    def register(self, provider):
+        with self._lock:
+            self._providers[provider.name] = provider
+        return provider
+
+    def provider(self, name):
+        name = self.override or name
+        with self._lock:
+            if name not in self._providers:
+                if name not in PROVIDERS:
+                    raise ValueError(f"Unknown LLM provider {name!r}")
+                self._providers[name] = PROVIDERS[name]()
+            return self._providers[name]
+
+    def _count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def _backoff(self, attempt, exc):
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        retry_after = getattr(exc, "retry_after", None) or _retry_after_of(exc)
+        time.sleep(max(delay, retry_after or 0))
+
+    def _acquire(self, provider):
+        provider.semaphore.acquire()
+        if provider.bucket is not None:
+            provider.bucket.acquire()
+
+    def _call(self, provider, prompt, model, system, options):
+        for attempt in range(self.max_retries + 1):
+            self._acquire(provider)
+            try:
+                self._count("calls")
+                return provider.complete(prompt, model, system=system, **options)
+            except Exception as e:
+                if attempt == self.max_retries or not is_retryable(e):
+                    self._count("failures")
+                    raise
+                error = e
+            finally:
+                provider.semaphore.release()
+            self._count("retries")
+            self._backoff(attempt, error)
+
+    def complete(self, provider, prompt, model=None, system=None, **options):
+        """Returns the full response text; raises on non-retryable or exhausted errors."""
+        backend = self.provider(provider)
+        model = model or backend.default_model
+        key = hashlib.sha256(
+            json.dumps([backend.name, model, system, prompt, options], sort_keys=True).encode("utf-8")
+        ).hexdigest()
+
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+            else:
+                self.stats["coalesced"] += 1
+        if not leader:
+            return future.result()
+
+        try:
+            result = self._call(backend, prompt, model, system, options)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def stream(self, provider, prompt, model=None, system=None, **options):
+        """
+        Yields response text as it arrives. Retries only happen before the first
+        chunk; once text has been yielded, a failure is raised to the caller.
+        """
+        backend = self.provider(provider)
+        model = model or backend.default_model
+        for attempt in range(self.max_retries + 1):
+            started = False
+            self._acquire(backend)
+            try:
+                self._count("calls")
+                for chunk in backend.stream(prompt, model, system=system, **options):
+                    started = True
+                    yield chunk
+                return
+            except Exception as e:
+                if started or attempt == self.max_retries or not is_retryable(e):
+                    self._count("failures")
+                    raise
+                error = e
+            finally:
+                backend.semaphore.release()
+            self._count("retries")
+            self._backoff(attempt, error)
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway():
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = LLMGateway()
+    return _gateway
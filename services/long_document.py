@@ -0,0 +1,165 @@
+# services/long_document.py
+
+import hashlib
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from services.answer_cache import get_answer_cache
+from services.gemini_llm import GEMINI_MODEL
+from services.llm_gateway import get_gateway
+
+# Rough English average for Gemini/Mistral tokenizers
+CHARS_PER_TOKEN = 4
+# Documents above this go through map-reduce instead of one prompt
+MAX_PROMPT_TOKENS = int(os.getenv("LONG_DOC_MAX_TOKENS", "30000"))
+SECTION_TOKENS = int(os.getenv("LONG_DOC_SECTION_TOKENS", "8000"))
+MAP_CONCURRENCY = int(os.getenv("LONG_DOC_MAP_CONCURRENCY", "4"))
+MAX_REDUCE_ROUNDS = 3
+
+# single: whole document in one prompt; map: per section; reduce: over partial results
+TASKS = {
+    "summary": {
+        "single": "Summarize the following legal case:\n\n{text}\n\nSummary:",
+        "map": "Summarize this section of a legal case, keeping names, dates and amounts:\n\n{text}\n\nSummary:",
+        "reduce": "Below are summaries of consecutive sections of one legal case. Combine them into a single coherent summary of the whole case:\n\n{text}\n\nSummary:",
+    },
+    "timeline": {
+        "single": "Extract a detailed timeline of events from the following legal document:\n\n{text}\n\nTimeline:",
+        "map": "Extract a detailed timeline of events from this section of a legal document:\n\n{text}\n\nTimeline:",
+        "reduce": "Below are timelines extracted from consecutive sections of one legal document. Merge them into one chronological timeline without duplicates:\n\n{text}\n\nTimeline:",
+    },
+    "risks": {
+        "single": "Analyze the following legal case and list any potential legal risks:\n\n{text}\n\nRisks:",
+        "map": "List any potential legal risks raised by this section of a legal case:\n\n{text}\n\nRisks:",
+        "reduce": "Below are legal risks found in consecutive sections of one legal case. Consolidate them into one deduplicated list, most serious first:\n\n{text}\n\nRisks:",
+    },
+    "actions": {
+        "single": "Based on the following legal case, suggest possible legal actions or next steps:\n\n{text}\n\nSuggestions:",
+        "map": "List the facts and issues in this section of a legal case that bear on possible legal actions or next steps:\n\n{text}\n\nNotes:",
+        "reduce": "Below are notes on consecutive sections of one legal case. Based on them, suggest possible legal actions or next steps:\n\n{text}\n\nSuggestions:",
+    },
+    "brief": {
+        "single": "Generate a simple and clear client communication brief for the following legal case:\n\n{text}\n\nBrief:",
+        "map": "Summarize the points of this section of a legal case that the client needs to know, in plain language:\n\n{text}\n\nKey points:",
+        "reduce": "Below are key points from consecutive sections of one legal case. Generate a simple and clear client communication brief from them:\n\n{text}\n\nBrief:",
+    },
+}
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def needs_map_reduce(text, max_tokens=MAX_PROMPT_TOKENS):
+    return estimate_tokens(text) > max_tokens
+
+
+def _hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def split_sections(text, section_tokens=SECTION_TOKENS):
+    """
+    Splits on paragraph boundaries into sections of at most ~section_tokens.
+    Past half the target size, a section also ends at any paragraph whose hash
+    is 0 mod 4, so boundaries depend on content rather than on position: an
+    edit only changes the sections around it and the rest keep their hashes.
+    """
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=section_tokens * CHARS_PER_TOKEN, chunk_overlap=0
+    )
+    sections, current, size = [], [], 0
+
+    def flush():
+        nonlocal current, size
+        if current:
+            sections.append("\n\n".join(current))
+        current, size = [], 0
+
+    for para in re.split(r"\n\s*\n", text):
+        para = para.strip()
+        if not para:
+            continue
+        tokens = estimate_tokens(para)
+        if tokens > section_tokens:
+            flush()
+            sections.extend(splitter.split_text(para))
+            continue
+        if size + tokens > section_tokens:
+            flush()
+        current.append(para)
+        size += tokens
+        if size >= section_tokens // 2 and int(_hash(para)[:8], 16) % 4 == 0:
+            flush()
+    flush()
+    return sections
+
+
+def _complete(namespace, key, prompt):
+    """Gateway call memoized in the answer cache under `key`."""
+    cache = get_answer_cache()
+    cached = cache.get_exact(namespace, key)
+    if cached is not None:
+        return cached
+    answer = get_gateway().complete("gemini", prompt, model=GEMINI_MODEL)
+    cache.put(namespace, key, answer)
+    return answer
+
+
+def map_sections(sections, task, on_progress=None):
+    """
+    Runs the map prompt over every section in parallel. Results are cached by
+    section hash, so only new or edited sections reach the LLM.
+    """
+    template = TASKS[task]["map"]
+    namespace = f"long_doc:{task}:{GEMINI_MODEL}"
+    done = 0
+
+    def run(section):
+        return _complete(namespace, _hash(section), template.format(text=section))
+
+    results = []
+    with ThreadPoolExecutor(max_workers=MAP_CONCURRENCY) as pool:
+        for partial in pool.map(run, sections):
+            results.append(partial)
+            done += 1
+            if on_progress:
+                on_progress(done, len(sections))
+    return results
+
+
+def _join(partials):
+    return "\n\n".join(f"### Part {i + 1}\n{p}" for i, p in enumerate(partials))
+
+
+def build_prompt(text, task, on_progress=None, max_tokens=MAX_PROMPT_TOKENS):
+    """
+    Returns the final prompt for `task`: the single-prompt template for short
+    documents, otherwise the reduce prompt over mapped sections. Partial
+    results that are still too long are reduced in groups first.
+    """
+    if not needs_map_reduce(text, max_tokens):
+        return TASKS[task]["single"].format(text=text)
+
+    partials = map_sections(split_sections(text), task, on_progress)
+    template = TASKS[task]["reduce"]
+    namespace = f"long_doc:{task}:reduce:{GEMINI_MODEL}"
+
+    for _ in range(MAX_REDUCE_ROUNDS):
+        if not needs_map_reduce(_join(partials), max_tokens) or len(partials) == 1:
+            break
+        groups, group = [], []
+        for partial in partials:
+            if group and needs_map_reduce(_join(group + [partial]), max_tokens):
+                groups.append(group)
+                group = []
+            group.append(partial)
+        groups.append(group)
+
+        prompts = [template.format(text=_join(g)) for g in groups]
+        with ThreadPoolExecutor(max_workers=MAP_CONCURRENCY) as pool:
+            partials = list(pool.map(lambda p: _complete(namespace, _hash(p), p), prompts))
+
+    return template.format(text=_join(partials))
@@ -0,0 +1,252 @@
+# services/metrics_engine.py
+
+import heapq
+import logging
+import threading
+from collections import Counter
+
+import pandas as pd
+
+from config.schema import (
+    ATTORNEY_COLUMNS,
+    CLIENT_COLUMNS,
+    LEAVE_COLUMNS,
+    MATTER_COLUMNS,
+)
+from services.data_loader import TABLES, load_table, table_signature
+from services.leave_index import get_leave_index
+
+ID_COLUMNS = {
+    "attorneys": ATTORNEY_COLUMNS["id"],
+    "clients": CLIENT_COLUMNS["id"],
+    "matters": "matter_id",
+    "leaves": LEAVE_COLUMNS["id"],
+}
+STATUS_COLUMNS = {
+    "attorneys": ATTORNEY_COLUMNS["status"],
+    "clients": CLIENT_COLUMNS["status"],
+    "matters": MATTER_COLUMNS["status"],
+    "leaves": LEAVE_COLUMNS["status"],
+}
+
+logger = logging.getLogger(__name__)
+
+
+class TopK:
+    """
+    Smallest-key items under updates, via a heap with lazy deletion: setting
+    or removing an item only records its current key, and stale heap entries
+    are discarded when they surface. Each operation is O(log n).
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._current = {}
+
+    def __len__(self):
+        return len(self._current)
+
+    def set(self, item, key):
+        self._current[item] = key
+        heapq.heappush(self._heap, (key, item))
+
+    def remove(self, item):
+        self._current.pop(item, None)
+
+    def smallest(self, k):
+        """The k items with the smallest keys, as (key, item) pairs."""
+        found = []
+        while self._heap and len(found) < k:
+            key, item = heapq.heappop(self._heap)
+            if self._current.get(item) != key:
+                continue
+            found.append((key, item))
+        for entry in found:
+            heapq.heappush(self._heap, entry)
+        if len(self._heap) > 2 * len(self._current) + 1024:
+            self._heap = [(key, item) for item, key in self._current.items()]
+            heapq.heapify(self._heap)
+        return found
+
+
+class MetricsEngine:
+    """
+    Materialized dashboard aggregates, maintained incrementally:
+
+    - status counts per table (lower-cased);
+    - matter counts per client, with a top-k heap over them;
+    - complexity sum and count of active matters per attorney;
+    - a top-k heap of matters by open date (upcoming leaves come from the
+      leave interval index).
+
+    When a table's CSV changes, rows are diffed by id and content hash and
+    only added, changed or removed rows touch the aggregates. Reading the
+    metrics costs the same whatever the size of the history.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.frames = {}
+        self.signatures = {}
+        self._hashes = {}
+        self._positions = {}
+        self.status_counts = {name: Counter() for name in TABLES}
+        self.client_matters = Counter()
+        self.attorney_complexity = {}
+        self._top_clients = TopK()
+        self._recent_matters = TopK()
+
+    # ------------------ Updates ------------------
+    def refresh(self):
+        """Folds in any table whose CSV changed since the last refresh."""
+        with self._lock:
+            for name in TABLES:
+                signature = table_signature(name)
+                if self.signatures.get(name) != signature:
+                    self.apply_frame(name, load_table(name))
+                    self.signatures[name] = signature
+
+    def apply_frame(self, name, frame):
+        """Replaces a table with a new version, applying only the rows that differ."""
+        with self._lock:
+            id_col = ID_COLUMNS[name]
+            duplicated = frame[id_col].duplicated(keep="last")
+            if duplicated.any():
+                # Rows are diffed by id, so keep the last row for each one
+                logger.warning(
+                    "%s: ignoring %d rows with a duplicate %s", name, int(duplicated.sum()), id_col
+                )
+                frame = frame[~duplicated.to_numpy()]
+            hashes = pd.Series(
+                pd.util.hash_pandas_object(frame, index=False).to_numpy(),
+                index=frame[id_col].to_numpy(),
+            )
+            old_hashes = self._hashes.get(name)
+            old_frame = self.frames.get(name)
+
+            if old_hashes is None:
+                removed, added = [], hashes.index
+            else:
+                common = old_hashes.index.intersection(hashes.index)
+                changed = common[old_hashes[common].to_numpy() != hashes[common].to_numpy()]
+                removed = old_hashes.index.difference(hashes.index).append(changed)
+                added = hashes.index.difference(old_hashes.index).append(changed)
+
+            if len(removed):
+                old_rows = old_frame.iloc[self._positions[name].get_indexer(removed)]
+                self._apply_rows(name, old_rows, sign=-1)
+
+            self.frames[name] = frame
+            self._hashes[name] = hashes
+            self._positions[name] = pd.Index(frame[id_col])
+            if len(added):
+                new_rows = frame.iloc[self._positions[name].get_indexer(added)]
+                self._apply_rows(name, new_rows, sign=1)
+
+    def _apply_rows(self, name, rows, sign):
+        """Adds (sign=1) or retracts (sign=-1) a batch of rows' contributions."""
+        status = rows[STATUS_COLUMNS[name]].astype(str).str.lower()
+        for value, count in status.value_counts().items():
+            self.status_counts[name][value] += sign * int(count)
+
+        if name == "matters":
+            self._apply_matters(rows, status, sign)
+
+    def _apply_matters(self, rows, status, sign):
+        clients = rows[MATTER_COLUMNS["client_id"]].value_counts()
+        for client_id, count in clients.items():
+            self.client_matters[client_id] += sign * int(count)
+            current = self.client_matters[client_id]
+            if current > 0:
+                self._top_clients.set(client_id, (-current, client_id))
+            else:
+                del self.client_matters[client_id]
+                self._top_clients.remove(client_id)
+
+        active = rows[(status == "active").to_numpy()]
+        grouped = active.groupby(MATTER_COLUMNS["attorney_id"], observed=True)["complexity_score"]
+        for attorney_id, (total, count) in grouped.agg(["sum", "count"]).iterrows():
+            entry = self.attorney_complexity.setdefault(attorney_id, [0.0, 0])
+            entry[0] += sign * float(total)
+            entry[1] += sign * int(count)
+            if entry[1] <= 0:
+                del self.attorney_complexity[attorney_id]
+
+        ids = rows[ID_COLUMNS["matters"]].tolist()
+        opened = pd.to_datetime(rows[MATTER_COLUMNS["created"]], errors="coerce")
+        for matter_id, open_date in zip(ids, opened):
+            if sign < 0 or pd.isna(open_date):
+                self._recent_matters.remove(matter_id)
+            else:
+                self._recent_matters.set(matter_id, -open_date.value)
+
+    # ------------------ Reads ------------------
+    def rows(self, name, ids):
+        """Rows of a table by id, in the order given."""
+        frame = self.frames[name]
+        positions = self._positions[name].get_indexer(ids)
+        return frame.iloc[positions[positions >= 0]]
+
+    def status_count(self, name, value):
+        return self.status_counts[name][value.lower()]
+
+    def recent_matters(self, k=5):
+        return self.rows("matters", [item for _, item in self._recent_matters.smallest(k)])
+
+    def upcoming_leaves(self, k=5, today=None):
+        return get_leave_index().upcoming(k, today)
+
+    def top_clients(self, k=5):
+        client_id = CLIENT_COLUMNS["id"]
+        found = self._top_clients.smallest(k)
+        top = pd.DataFrame(
+            {client_id: [item for _, item in found], "matter_count": [-key[0] for key, _ in found]}
+        )
+        clients = self.rows("clients", top[client_id]) if len(top) else self.frames["clients"].iloc[:0]
+        return top.merge(clients, on=client_id, how="left")
+
+    def attorney_workload(self):
+        """Average complexity of active matters per attorney, one row each."""
+        items = self.attorney_complexity.items()
+        return pd.DataFrame(
+            {
+                ATTORNEY_COLUMNS["id"]: [attorney_id for attorney_id, _ in items],
+                "avg_complexity": [total / count for total, count in (v for _, v in items)],
+            }
+        )
+
+    def attorney_workload_anomalies(self, quantile=0.9):
+        workload = self.attorney_workload()
+        threshold = workload["avg_complexity"].quantile(quantile)
+        flagged = workload[workload["avg_complexity"] > threshold]
+        attorneys = self.rows("attorneys", flagged[ATTORNEY_COLUMNS["id"]])
+        return flagged.merge(attorneys, on=ATTORNEY_COLUMNS["id"], how="left")
+
+    def dashboard_metrics(self, today=None):
+        """Same keys and frame shapes as analytics.compute_dashboard_metrics."""
+        with self._lock:
+            self.refresh()
+            return {
+                "total_attorneys": len(self.frames["attorneys"]),
+                "active_clients": self.status_count("clients", "active"),
+                "open_matters": self.status_count("matters", "active"),
+                "pending_leaves": self.status_count("leaves", "pending"),
+                "billing_anomalies": pd.DataFrame(),
+                "recent_matters": self.recent_matters(),
+                "upcoming_leaves": self.upcoming_leaves(today=today),
+                "top_clients": self.top_clients(),
+                "attorney_workload_anomalies": self.attorney_workload_anomalies(),
+            }
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_metrics_engine():
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = MetricsEngine()
+    return _engine
@@ -1,17 +1,21 @@
 # services/legal_rag_chroma.py
 
 import os
+import sys
 import chromadb
 import pandas as pd
 from chromadb.config import Settings
-from sentence_transformers import SentenceTransformer
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from services.embedding_service import get_embedding_service
+
 # Initialize Chroma client
 chroma_client = chromadb.Client(Settings())
 COLLECTION_NAME = "legal_acts"
 ACT_METADATA_COLLECTION_NAME = "legal_act_metadata"
-embedder = SentenceTransformer("all-MiniLM-L6-v2")
+embedder = get_embedding_service()
 
 
 def chunk_text(text, chunk_size=500, chunk_overlap=50):
@@ -66,7 +70,7 @@ def prepare_rag_index(folder_path="Data/actmetadata"):
                 ids.append(f"{file}_{i}_{j}")
 
         print(f"📦 {file}: {len(chunks)} chunks")
-        embeddings = embedder.encode(chunks).tolist()
+        embeddings = embedder.encode(chunks)
         collection.add(
             documents=chunks, embeddings=embeddings, metadatas=metadatas, ids=ids
         )
@@ -99,7 +103,7 @@ def prepare_act_metadata_index(csv_path="Data/actmetadata/act_metadata.csv"):
         metadatas.append({"title": title})
         ids.append(f"act_meta_{i}")
 
-    embeddings = embedder.encode(documents).tolist()
+    embeddings = embedder.encode(documents)
     collection.add(
         documents=documents, embeddings=embeddings, metadatas=metadatas, ids=ids
     )
@@ -108,7 +112,7 @@ def prepare_act_metadata_index(csv_path="Data/actmetadata/act_metadata.csv"):
 
 def answer_query_with_rag(query, top_k=3):
     collection = chroma_client.get_collection(name=COLLECTION_NAME)
-    query_embedding = embedder.encode([query])[0].tolist()
+    query_embedding = embedder.embed_query(query)
     results = collection.query(query_embeddings=[query_embedding], n_results=top_k)
 
     documents = results.get("documents", [[]])[0]
@@ -133,7 +137,7 @@ def answer_query_with_rag(query, top_k=3):
 
 def search_acts(query, top_k=5):
     collection = chroma_client.get_collection(name=ACT_METADATA_COLLECTION_NAME)
-    query_embedding = embedder.encode([query])[0].tolist()
+    query_embedding = embedder.embed_query(query)
     results = collection.query(query_embeddings=[query_embedding], n_results=top_k)
 
     documents = results.get("documents", [[]])[0]
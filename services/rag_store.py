@@ -0,0 +1,158 @@
+# services/rag_store.py
+
+import json
+import os
+import shutil
+
+import numpy as np
+
+QUANTIZATIONS = ("float32", "float16", "int8")
+
+
+class ChunkStore:
+    """Chunk texts in one UTF-8 buffer, addressed through an offsets array."""
+
+    def __init__(self, buffer, offsets):
+        self.buffer = buffer
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        start, stop = self.offsets[i], self.offsets[i + 1]
+        return bytes(self.buffer[start:stop]).decode("utf-8")
+
+
+class TitleColumn:
+    """Per-chunk titles stored as integer codes into a small list of names."""
+
+    def __init__(self, names, codes):
+        self.names = names
+        self.codes = codes
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, i):
+        return self.names[self.codes[i]]
+
+
+class EmbeddingMatrix:
+    """
+    Row-normalized chunk embeddings, optionally quantized.
+
+    int8 rows carry a per-row scale, so a dot product with a float32 query is
+    `(q_int8 @ query) * scale`. Scores are computed in blocks, so a quantized
+    matrix is never upcast to float32 all at once.
+    """
+
+    def __init__(self, values, scales=None, block_rows=65536):
+        self.values = values
+        self.scales = scales
+        self.block_rows = block_rows
+
+    def __len__(self):
+        return self.values.shape[0]
+
+    def similarities(self, query):
+        query = np.asarray(query, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        scores = np.empty(len(self), dtype=np.float32)
+        for start in range(0, len(self), self.block_rows):
+            block = self.values[start : start + self.block_rows]
+            scores[start : start + len(block)] = block.astype(np.float32) @ query
+        if self.scales is not None:
+            scores *= self.scales
+        return scores
+
+
+def top_k_indices(scores, top_k):
+    """Indices of the `top_k` highest scores, best first, without a full sort."""
+    top_k = min(top_k, len(scores))
+    if top_k <= 0:
+        return np.array([], dtype=np.int64)
+    candidates = np.argpartition(scores, -top_k)[-top_k:]
+    return candidates[np.argsort(scores[candidates])[::-1]]
+
+
+def quantize(embeddings, quantization):
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    embeddings = embeddings / np.where(norms == 0, 1.0, norms)
+
+    if quantization == "float32":
+        return embeddings, None
+    if quantization == "float16":
+        return embeddings.astype(np.float16), None
+    if quantization == "int8":
+        scales = np.abs(embeddings).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        values = np.round(embeddings / scales[:, None]).astype(np.int8)
+        return values, scales.astype(np.float32)
+    raise ValueError(f"Unknown quantization {quantization!r}; use one of {QUANTIZATIONS}")
+
+
+def write_store(index_dir, meta, chunks, titles, embeddings, quantization):
+    """Writes a complete store to a temp directory, then swaps it into place."""
+    tmp_dir = f"{index_dir}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    values, scales = quantize(embeddings, quantization)
+    np.save(os.path.join(tmp_dir, "embeddings.npy"), values)
+    if scales is not None:
+        np.save(os.path.join(tmp_dir, "scales.npy"), scales)
+
+    names = list(dict.fromkeys(titles))
+    code_of = {name: i for i, name in enumerate(names)}
+    codes = np.fromiter((code_of[t] for t in titles), dtype=np.int32, count=len(titles))
+    np.save(os.path.join(tmp_dir, "title_codes.npy"), codes)
+
+    encoded = [chunk.encode("utf-8") for chunk in chunks]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    np.save(os.path.join(tmp_dir, "chunk_offsets.npy"), offsets)
+    with open(os.path.join(tmp_dir, "chunks.bin"), "wb") as f:
+        for b in encoded:
+            f.write(b)
+
+    meta = dict(meta, quantization=quantization, titles=names, count=len(encoded))
+    with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+    shutil.rmtree(index_dir, ignore_errors=True)
+    os.replace(tmp_dir, index_dir)
+
+
+def read_meta(index_dir):
+    meta_path = os.path.join(index_dir, "meta.json")
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def open_store(index_dir):
+    """
+    Maps a store read-only. Every array is backed by the OS page cache, so
+    processes that open the same store share its pages.
+    """
+    meta = read_meta(index_dir)
+    values = np.load(os.path.join(index_dir, "embeddings.npy"), mmap_mode="r")
+    scales_path = os.path.join(index_dir, "scales.npy")
+    scales = np.load(scales_path, mmap_mode="r") if os.path.exists(scales_path) else None
+    codes = np.load(os.path.join(index_dir, "title_codes.npy"), mmap_mode="r")
+    offsets = np.load(os.path.join(index_dir, "chunk_offsets.npy"), mmap_mode="r")
+
+    chunks_path = os.path.join(index_dir, "chunks.bin")
+    if os.path.getsize(chunks_path):
+        buffer = np.memmap(chunks_path, dtype=np.uint8, mode="r")
+    else:
+        buffer = np.zeros(0, dtype=np.uint8)
+
+    return (
+        ChunkStore(buffer, offsets),
+        TitleColumn(meta["titles"], codes),
+        EmbeddingMatrix(values, scales),
+    )
@@ -0,0 +1,147 @@
+# services/section_index.py
+
+import os
+import pickle
+import re
+from collections import Counter
+
+from services.bm25_index import acronym
+
+# Extra short forms that cannot be derived from a title's initials
+ACT_ALIASES = {
+    "crpc": "Code of Criminal Procedure",
+    "cpc": "Code of Civil Procedure",
+    "iea": "Indian Evidence Act",
+}
+
+SECTION_PATTERN = re.compile(
+    r"(?:\bsections?|\bsecs?\.?|\bs\.|§)\s*(\d+[a-z]*)\b", re.IGNORECASE
+)
+NUMBER_PATTERN = re.compile(r"\b(\d+[a-z]*)\b", re.IGNORECASE)
+
+
+def normalize_title(title):
+    return " ".join(re.findall(r"[a-z0-9]+", str(title).lower()))
+
+
+def normalize_number(number):
+    # CSVs read with missing values turn "302" into "302.0"
+    number = str(number).strip().lower()
+    return number[:-2] if number.endswith(".0") else number
+
+
+class SectionIndex:
+    """
+    Direct (act, section number) -> section lookup built from the act CSVs.
+
+    Answers queries that cite a section ("section 302 IPC", "s. 420") in O(1),
+    without touching the embedding model or the vector index.
+    """
+
+    def __init__(self):
+        self.revision = None
+        self.sections = {}
+        self.by_number = {}
+        self.titles = Counter()
+        self.files = {}
+        self._aliases = None
+
+    def __len__(self):
+        return len(self.sections)
+
+    def add_rows(self, file, df):
+        if "section_number" not in df.columns:
+            return
+        keys = self.files.setdefault(file, [])
+        columns = ["title", "section_number", "section_name", "section_text"]
+        for title, number, name, text in df[columns].itertuples(index=False, name=None):
+            if number is None or str(number) == "nan":
+                continue
+            act_key = normalize_title(title)
+            number = normalize_number(number)
+            entry = {
+                "act_title": str(title),
+                "section_number": number,
+                "section_name": str(name),
+                "section_text": str(text),
+                "source": file,
+            }
+            self.sections.setdefault((act_key, number), []).append(entry)
+            self.by_number.setdefault(number, Counter())[act_key] += 1
+            self.titles[act_key] += 1
+            keys.append((act_key, number))
+        self._aliases = None
+
+    def remove_file(self, file):
+        for act_key, number in self.files.pop(file, ()):
+            entries = self.sections.get((act_key, number), [])
+            entries[:] = [e for e in entries if e["source"] != file]
+            if not entries:
+                self.sections.pop((act_key, number), None)
+            self.by_number[number][act_key] -= 1
+            if self.by_number[number][act_key] <= 0:
+                del self.by_number[number][act_key]
+                if not self.by_number[number]:
+                    del self.by_number[number]
+            self.titles[act_key] -= 1
+            if self.titles[act_key] <= 0:
+                del self.titles[act_key]
+        self._aliases = None
+
+    @property
+    def aliases(self):
+        if self._aliases is None:
+            aliases = {}
+            for act_key in self.titles:
+                aliases.setdefault(act_key, set()).add(act_key)
+                short = acronym(act_key)
+                if short:
+                    aliases.setdefault(short, set()).add(act_key)
+            for alias, title in ACT_ALIASES.items():
+                act_key = normalize_title(title)
+                if act_key in self.titles:
+                    aliases.setdefault(alias, set()).add(act_key)
+            self._aliases = aliases
+        return self._aliases
+
+    def parse_citations(self, query):
+        """
+        Returns [(act_keys, section_number)] for every section cited in `query`.
+        `act_keys` is empty when the query names no act we know.
+        """
+        normalized = f" {normalize_title(query)} "
+        acts = set()
+        for alias, act_keys in self.aliases.items():
+            if f" {alias} " in normalized:
+                acts |= act_keys
+
+        numbers = [m.group(1).lower() for m in SECTION_PATTERN.finditer(query)]
+        if not numbers and acts:
+            # "IPC 302" / "302 IPC": a bare number next to a named act
+            numbers = [
+                m.group(1).lower()
+                for m in NUMBER_PATTERN.finditer(query)
+                if (acts & set(self.by_number.get(m.group(1).lower(), ())))
+            ]
+        return [(acts, number) for number in dict.fromkeys(numbers)]
+
+    def find(self, query):
+        """Returns the section entries cited by `query`, or [] if it cites none."""
+        hits = []
+        for acts, number in self.parse_citations(query):
+            candidates = self.by_number.get(number, {})
+            act_keys = [a for a in candidates if a in acts] if acts else list(candidates)
+            for act_key in act_keys:
+                hits.extend(self.sections.get((act_key, number), []))
+        return hits
+
+    def save(self, path):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            return pickle.load(f)